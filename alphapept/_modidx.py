@@ -31,7 +31,26 @@ d = { 'settings': { 'branch': 'master',
                                   'alphapept.export.remove_mods': ('export.html#remove_mods', 'alphapept/export.py')},
             'alphapept.ext.bruker.timsdata': {},
             'alphapept.ext.bruker.tsfdata': {},
-            'alphapept.fasta': { 'alphapept.fasta.add_decoy_tag': ('fasta.html#add_decoy_tag', 'alphapept/fasta.py'),
+            'alphapept.fasta': { 'alphapept.fasta.MappedDatabase': ('fasta.html#mappeddatabase', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.MappedDatabase.__getitem__': ( 'fasta.html#mappeddatabase.__getitem__',
+                                                                                 'alphapept/fasta.py'),
+                                 'alphapept.fasta.MappedDatabase.__init__': ('fasta.html#mappeddatabase.__init__', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.MappedDatabase.__iter__': ('fasta.html#mappeddatabase.__iter__', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.MappedDatabase.__len__': ('fasta.html#mappeddatabase.__len__', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.MappedDatabase.__repr__': ('fasta.html#mappeddatabase.__repr__', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.PeptideIndex': ('fasta.html#peptideindex', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.PeptideIndex.__getitem__': ('fasta.html#peptideindex.__getitem__', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.PeptideIndex.__init__': ('fasta.html#peptideindex.__init__', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.PeptideIndex.__iter__': ('fasta.html#peptideindex.__iter__', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.PeptideIndex.__len__': ('fasta.html#peptideindex.__len__', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.PeptideIndex.__repr__': ('fasta.html#peptideindex.__repr__', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.PeptideIndex.from_dict': ('fasta.html#peptideindex.from_dict', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.PeptideIndex.from_hdf': ('fasta.html#peptideindex.from_hdf', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.PeptideIndex.get_proteins': ( 'fasta.html#peptideindex.get_proteins',
+                                                                                'alphapept/fasta.py'),
+                                 'alphapept.fasta.PeptideIndex.get_rows': ('fasta.html#peptideindex.get_rows', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.PeptideIndex.subset': ('fasta.html#peptideindex.subset', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.add_decoy_tag': ('fasta.html#add_decoy_tag', 'alphapept/fasta.py'),
                                  'alphapept.fasta.add_fixed_mod_terminal': ('fasta.html#add_fixed_mod_terminal', 'alphapept/fasta.py'),
                                  'alphapept.fasta.add_fixed_mods': ('fasta.html#add_fixed_mods', 'alphapept/fasta.py'),
                                  'alphapept.fasta.add_fixed_mods_terminal': ('fasta.html#add_fixed_mods_terminal', 'alphapept/fasta.py'),
@@ -42,18 +61,33 @@ d = { 'settings': { 'branch': 'master',
                                                                                  'alphapept/fasta.py'),
                                  'alphapept.fasta.block_idx': ('fasta.html#block_idx', 'alphapept/fasta.py'),
                                  'alphapept.fasta.blocks': ('fasta.html#blocks', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.build_fragment_index': ('fasta.html#build_fragment_index', 'alphapept/fasta.py'),
                                  'alphapept.fasta.check_peptide': ('fasta.html#check_peptide', 'alphapept/fasta.py'),
                                  'alphapept.fasta.check_sequence': ('fasta.html#check_sequence', 'alphapept/fasta.py'),
                                  'alphapept.fasta.cleave_sequence': ('fasta.html#cleave_sequence', 'alphapept/fasta.py'),
                                  'alphapept.fasta.count_internal_cleavages': ('fasta.html#count_internal_cleavages', 'alphapept/fasta.py'),
                                  'alphapept.fasta.count_missed_cleavages': ('fasta.html#count_missed_cleavages', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.csr_take': ('fasta.html#csr_take', 'alphapept/fasta.py'),
                                  'alphapept.fasta.digest_fasta_block': ('fasta.html#digest_fasta_block', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.digest_fasta_block_peptides': ( 'fasta.html#digest_fasta_block_peptides',
+                                                                                  'alphapept/fasta.py'),
+                                 'alphapept.fasta.digest_fasta_block_to_chunk': ( 'fasta.html#digest_fasta_block_to_chunk',
+                                                                                  'alphapept/fasta.py'),
+                                 'alphapept.fasta.encode_peptides': ('fasta.html#encode_peptides', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.evict_database_cache': ('fasta.html#evict_database_cache', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.find_cached_database': ('fasta.html#find_cached_database', 'alphapept/fasta.py'),
                                  'alphapept.fasta.generate_database': ('fasta.html#generate_database', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.generate_database_cached': ('fasta.html#generate_database_cached', 'alphapept/fasta.py'),
                                  'alphapept.fasta.generate_database_parallel': ( 'fasta.html#generate_database_parallel',
                                                                                  'alphapept/fasta.py'),
+                                 'alphapept.fasta.generate_database_streaming': ( 'fasta.html#generate_database_streaming',
+                                                                                  'alphapept/fasta.py'),
                                  'alphapept.fasta.generate_fasta_list': ('fasta.html#generate_fasta_list', 'alphapept/fasta.py'),
                                  'alphapept.fasta.generate_peptides': ('fasta.html#generate_peptides', 'alphapept/fasta.py'),
                                  'alphapept.fasta.generate_spectra': ('fasta.html#generate_spectra', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.generate_spectra_flat': ('fasta.html#generate_spectra_flat', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.get_database_settings_hash': ( 'fasta.html#get_database_settings_hash',
+                                                                                 'alphapept/fasta.py'),
                                  'alphapept.fasta.get_decoy_sequence': ('fasta.html#get_decoy_sequence', 'alphapept/fasta.py'),
                                  'alphapept.fasta.get_decoys': ('fasta.html#get_decoys', 'alphapept/fasta.py'),
                                  'alphapept.fasta.get_frag_dict': ('fasta.html#get_frag_dict', 'alphapept/fasta.py'),
@@ -61,19 +95,27 @@ d = { 'settings': { 'branch': 'master',
                                  'alphapept.fasta.get_isoforms': ('fasta.html#get_isoforms', 'alphapept/fasta.py'),
                                  'alphapept.fasta.get_missed_cleavages': ('fasta.html#get_missed_cleavages', 'alphapept/fasta.py'),
                                  'alphapept.fasta.get_precmass': ('fasta.html#get_precmass', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.get_protease_pattern': ('fasta.html#get_protease_pattern', 'alphapept/fasta.py'),
                                  'alphapept.fasta.get_spectra': ('fasta.html#get_spectra', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.get_spectra_flat': ('fasta.html#get_spectra_flat', 'alphapept/fasta.py'),
                                  'alphapept.fasta.get_spectrum': ('fasta.html#get_spectrum', 'alphapept/fasta.py'),
                                  'alphapept.fasta.get_unique_peptides': ('fasta.html#get_unique_peptides', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.link_database': ('fasta.html#link_database', 'alphapept/fasta.py'),
                                  'alphapept.fasta.list_to_numba': ('fasta.html#list_to_numba', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.load_pept_dict': ('fasta.html#load_pept_dict', 'alphapept/fasta.py'),
                                  'alphapept.fasta.merge_pept_dicts': ('fasta.html#merge_pept_dicts', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.merge_spectra_chunks': ('fasta.html#merge_spectra_chunks', 'alphapept/fasta.py'),
                                  'alphapept.fasta.parse': ('fasta.html#parse', 'alphapept/fasta.py'),
                                  'alphapept.fasta.pept_dict_from_search': ('fasta.html#pept_dict_from_search', 'alphapept/fasta.py'),
                                  'alphapept.fasta.read_database': ('fasta.html#read_database', 'alphapept/fasta.py'),
                                  'alphapept.fasta.read_fasta_file': ('fasta.html#read_fasta_file', 'alphapept/fasta.py'),
                                  'alphapept.fasta.read_fasta_file_entries': ('fasta.html#read_fasta_file_entries', 'alphapept/fasta.py'),
                                  'alphapept.fasta.save_database': ('fasta.html#save_database', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.save_pept_dict': ('fasta.html#save_pept_dict', 'alphapept/fasta.py'),
                                  'alphapept.fasta.swap_AL': ('fasta.html#swap_al', 'alphapept/fasta.py'),
-                                 'alphapept.fasta.swap_KR': ('fasta.html#swap_kr', 'alphapept/fasta.py')},
+                                 'alphapept.fasta.swap_KR': ('fasta.html#swap_kr', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.write_database_chunk': ('fasta.html#write_database_chunk', 'alphapept/fasta.py'),
+                                 'alphapept.fasta.write_spectra_chunk': ('fasta.html#write_spectra_chunk', 'alphapept/fasta.py')},
             'alphapept.feature_finding': { 'alphapept.feature_finding.check_averagine': ( 'feature_finding.html#check_averagine',
                                                                                           'alphapept/feature_finding.py'),
                                            'alphapept.feature_finding.check_isotope_pattern': ( 'feature_finding.html#check_isotope_pattern',
@@ -183,7 +225,10 @@ d = { 'settings': { 'branch': 'master',
             'alphapept.gui.start': {},
             'alphapept.gui.status': {},
             'alphapept.gui.utils': {},
-            'alphapept.interface': { 'alphapept.interface.align': ('interface.html#align', 'alphapept/interface.py'),
+            'alphapept.interface': { 'alphapept.interface._execute_stage': ('interface.html#_execute_stage', 'alphapept/interface.py'),
+                                     'alphapept.interface._execute_task': ('interface.html#_execute_task', 'alphapept/interface.py'),
+                                     'alphapept.interface._get_rss': ('interface.html#_get_rss', 'alphapept/interface.py'),
+                                     'alphapept.interface.align': ('interface.html#align', 'alphapept/interface.py'),
                                      'alphapept.interface.bcolors': ('interface.html#bcolors', 'alphapept/interface.py'),
                                      'alphapept.interface.check_version_and_hardware': ( 'interface.html#check_version_and_hardware',
                                                                                          'alphapept/interface.py'),
@@ -202,18 +247,27 @@ d = { 'settings': { 'branch': 'master',
                                      'alphapept.interface.cli_search': ('interface.html#cli_search', 'alphapept/interface.py'),
                                      'alphapept.interface.cli_workflow': ('interface.html#cli_workflow', 'alphapept/interface.py'),
                                      'alphapept.interface.create_database': ('interface.html#create_database', 'alphapept/interface.py'),
+                                     'alphapept.interface.estimate_task_memory': ( 'interface.html#estimate_task_memory',
+                                                                                   'alphapept/interface.py'),
                                      'alphapept.interface.export': ('interface.html#export', 'alphapept/interface.py'),
                                      'alphapept.interface.extract_median_unique': ( 'interface.html#extract_median_unique',
                                                                                     'alphapept/interface.py'),
                                      'alphapept.interface.feature_finding': ('interface.html#feature_finding', 'alphapept/interface.py'),
+                                     'alphapept.interface.get_file_size': ('interface.html#get_file_size', 'alphapept/interface.py'),
+                                     'alphapept.interface.get_file_stages': ('interface.html#get_file_stages', 'alphapept/interface.py'),
                                      'alphapept.interface.get_file_summary': ('interface.html#get_file_summary', 'alphapept/interface.py'),
                                      'alphapept.interface.get_summary': ('interface.html#get_summary', 'alphapept/interface.py'),
                                      'alphapept.interface.import_raw_data': ('interface.html#import_raw_data', 'alphapept/interface.py'),
                                      'alphapept.interface.is_port_in_use': ('interface.html#is_port_in_use', 'alphapept/interface.py'),
                                      'alphapept.interface.isobaric_labeling': ( 'interface.html#isobaric_labeling',
                                                                                 'alphapept/interface.py'),
+                                     'alphapept.interface.load_memory_model': ( 'interface.html#load_memory_model',
+                                                                                'alphapept/interface.py'),
                                      'alphapept.interface.match': ('interface.html#match', 'alphapept/interface.py'),
+                                     'alphapept.interface.memory_aware_imap': ( 'interface.html#memory_aware_imap',
+                                                                                'alphapept/interface.py'),
                                      'alphapept.interface.parallel_execute': ('interface.html#parallel_execute', 'alphapept/interface.py'),
+                                     'alphapept.interface.pipeline_execute': ('interface.html#pipeline_execute', 'alphapept/interface.py'),
                                      'alphapept.interface.protein_grouping': ('interface.html#protein_grouping', 'alphapept/interface.py'),
                                      'alphapept.interface.quantification': ('interface.html#quantification', 'alphapept/interface.py'),
                                      'alphapept.interface.read_label_intensity': ( 'interface.html#read_label_intensity',
@@ -222,6 +276,8 @@ d = { 'settings': { 'branch': 'master',
                                      'alphapept.interface.run_cli': ('interface.html#run_cli', 'alphapept/interface.py'),
                                      'alphapept.interface.run_complete_workflow': ( 'interface.html#run_complete_workflow',
                                                                                     'alphapept/interface.py'),
+                                     'alphapept.interface.save_memory_model': ( 'interface.html#save_memory_model',
+                                                                                'alphapept/interface.py'),
                                      'alphapept.interface.score': ('interface.html#score', 'alphapept/interface.py'),
                                      'alphapept.interface.search_data': ('interface.html#search_data', 'alphapept/interface.py'),
                                      'alphapept.interface.tqdm_wrapper': ('interface.html#tqdm_wrapper', 'alphapept/interface.py'),
@@ -232,6 +288,7 @@ d = { 'settings': { 'branch': 'master',
                               'alphapept.io.HDF_File.__init__': ('io.html#hdf_file.__init__', 'alphapept/io.py'),
                               'alphapept.io.HDF_File.__repr__': ('io.html#hdf_file.__repr__', 'alphapept/io.py'),
                               'alphapept.io.HDF_File.__str__': ('io.html#hdf_file.__str__', 'alphapept/io.py'),
+                              'alphapept.io.HDF_File._open': ('io.html#hdf_file._open', 'alphapept/io.py'),
                               'alphapept.io.HDF_File.check': ('io.html#hdf_file.check', 'alphapept/io.py'),
                               'alphapept.io.HDF_File.creation_time': ('io.html#hdf_file.creation_time', 'alphapept/io.py'),
                               'alphapept.io.HDF_File.directory': ('io.html#hdf_file.directory', 'alphapept/io.py'),
@@ -241,6 +298,7 @@ d = { 'settings': { 'branch': 'master',
                               'alphapept.io.HDF_File.last_updated': ('io.html#hdf_file.last_updated', 'alphapept/io.py'),
                               'alphapept.io.HDF_File.original_file_name': ('io.html#hdf_file.original_file_name', 'alphapept/io.py'),
                               'alphapept.io.HDF_File.read': ('io.html#hdf_file.read', 'alphapept/io.py'),
+                              'alphapept.io.HDF_File.session': ('io.html#hdf_file.session', 'alphapept/io.py'),
                               'alphapept.io.HDF_File.version': ('io.html#hdf_file.version', 'alphapept/io.py'),
                               'alphapept.io.HDF_File.write': ('io.html#hdf_file.write', 'alphapept/io.py'),
                               'alphapept.io.MS_Data_File': ('io.html#ms_data_file', 'alphapept/io.py'),
@@ -250,8 +308,22 @@ d = { 'settings': { 'branch': 'master',
                                                                                  'alphapept/io.py'),
                               'alphapept.io.MS_Data_File.read_DDA_query_data': ( 'io.html#ms_data_file.read_dda_query_data',
                                                                                  'alphapept/io.py'),
+                              'alphapept.io.QueryData': ('io.html#querydata', 'alphapept/io.py'),
+                              'alphapept.io.QueryData.__contains__': ('io.html#querydata.__contains__', 'alphapept/io.py'),
+                              'alphapept.io.QueryData.__delitem__': ('io.html#querydata.__delitem__', 'alphapept/io.py'),
+                              'alphapept.io.QueryData.__getitem__': ('io.html#querydata.__getitem__', 'alphapept/io.py'),
+                              'alphapept.io.QueryData.__init__': ('io.html#querydata.__init__', 'alphapept/io.py'),
+                              'alphapept.io.QueryData.__iter__': ('io.html#querydata.__iter__', 'alphapept/io.py'),
+                              'alphapept.io.QueryData.__len__': ('io.html#querydata.__len__', 'alphapept/io.py'),
+                              'alphapept.io.QueryData.__repr__': ('io.html#querydata.__repr__', 'alphapept/io.py'),
+                              'alphapept.io.QueryData.__setitem__': ('io.html#querydata.__setitem__', 'alphapept/io.py'),
+                              'alphapept.io.QueryData._read': ('io.html#querydata._read', 'alphapept/io.py'),
                               'alphapept.io.__extract_nested': ('io.html#__extract_nested', 'alphapept/io.py'),
+                              'alphapept.io._get_column_dtype': ('io.html#_get_column_dtype', 'alphapept/io.py'),
+                              'alphapept.io._get_n_rows': ('io.html#_get_n_rows', 'alphapept/io.py'),
                               'alphapept.io._read_DDA_query_data': ('io.html#_read_dda_query_data', 'alphapept/io.py'),
+                              'alphapept.io._read_column': ('io.html#_read_column', 'alphapept/io.py'),
+                              'alphapept.io._read_rows': ('io.html#_read_rows', 'alphapept/io.py'),
                               'alphapept.io.centroid_data': ('io.html#centroid_data', 'alphapept/io.py'),
                               'alphapept.io.check_sanity': ('io.html#check_sanity', 'alphapept/io.py'),
                               'alphapept.io.extract_mq_settings': ('io.html#extract_mq_settings', 'alphapept/io.py'),
@@ -278,7 +350,9 @@ d = { 'settings': { 'branch': 'master',
                                                                                   'alphapept/matching.py'),
                                     'alphapept.matching._calculate_deltas_rel': ( 'matching.html#_calculate_deltas_rel',
                                                                                   'alphapept/matching.py'),
-                                    'alphapept.matching._get_offset_dict_and_columns_to_drop': ( 'matching.html#_get_offset_dict_and_columns_to_drop',
+                                    'alphapept.matching._calculate_pair_deltas': ( 'matching.html#_calculate_pair_deltas',
+                                                                                   'alphapept/matching.py'),
+                                    'alphapept.matching._get_offset_dict_and_columns_to_read': ( 'matching.html#_get_offset_dict_and_columns_to_read',
                                                                                                  'alphapept/matching.py'),
                                     'alphapept.matching.align': ('matching.html#align', 'alphapept/matching.py'),
                                     'alphapept.matching.align_datasets': ('matching.html#align_datasets', 'alphapept/matching.py'),
@@ -287,8 +361,18 @@ d = { 'settings': { 'branch': 'master',
                                     'alphapept.matching.calculate_distance': ('matching.html#calculate_distance', 'alphapept/matching.py'),
                                     'alphapept.matching.calib_table': ('matching.html#calib_table', 'alphapept/matching.py'),
                                     'alphapept.matching.convert_decoy': ('matching.html#convert_decoy', 'alphapept/matching.py'),
+                                    'alphapept.matching.get_alignment_pairs': ( 'matching.html#get_alignment_pairs',
+                                                                                'alphapept/matching.py'),
+                                    'alphapept.matching.get_precursor_matrix': ( 'matching.html#get_precursor_matrix',
+                                                                                 'alphapept/matching.py'),
+                                    'alphapept.matching.get_probabilities': ('matching.html#get_probabilities', 'alphapept/matching.py'),
                                     'alphapept.matching.get_probability': ('matching.html#get_probability', 'alphapept/matching.py'),
-                                    'alphapept.matching.match_datasets': ('matching.html#match_datasets', 'alphapept/matching.py')},
+                                    'alphapept.matching.load_matching_library': ( 'matching.html#load_matching_library',
+                                                                                  'alphapept/matching.py'),
+                                    'alphapept.matching.match_datasets': ('matching.html#match_datasets', 'alphapept/matching.py'),
+                                    'alphapept.matching.match_file': ('matching.html#match_file', 'alphapept/matching.py'),
+                                    'alphapept.matching.save_matching_library': ( 'matching.html#save_matching_library',
+                                                                                  'alphapept/matching.py')},
             'alphapept.paths': {},
             'alphapept.performance': { 'alphapept.performance.AlphaPool': ('performance.html#alphapool', 'alphapept/performance.py'),
                                        'alphapept.performance.__copy_func': ('performance.html#__copy_func', 'alphapept/performance.py'),
@@ -303,12 +387,16 @@ d = { 'settings': { 'branch': 'master',
                                        'alphapept.performance.set_worker_count': ( 'performance.html#set_worker_count',
                                                                                    'alphapept/performance.py')},
             'alphapept.pyrawfilereader': {},
-            'alphapept.quantification': { 'alphapept.quantification.delayed_normalization': ( 'quantification.html#delayed_normalization',
+            'alphapept.quantification': { 'alphapept.quantification._get_protein_profiles': ( 'quantification.html#_get_protein_profiles',
+                                                                                              'alphapept/quantification.py'),
+                                          'alphapept.quantification.delayed_normalization': ( 'quantification.html#delayed_normalization',
                                                                                               'alphapept/quantification.py'),
                                           'alphapept.quantification.gaussian': ( 'quantification.html#gaussian',
                                                                                  'alphapept/quantification.py'),
                                           'alphapept.quantification.generate_dummy_data': ( 'quantification.html#generate_dummy_data',
                                                                                             'alphapept/quantification.py'),
+                                          'alphapept.quantification.get_protein_arrays': ( 'quantification.html#get_protein_arrays',
+                                                                                           'alphapept/quantification.py'),
                                           'alphapept.quantification.get_protein_ratios': ( 'quantification.html#get_protein_ratios',
                                                                                            'alphapept/quantification.py'),
                                           'alphapept.quantification.get_total_error': ( 'quantification.html#get_total_error',
@@ -359,6 +447,8 @@ d = { 'settings': { 'branch': 'master',
                                          'alphapept.recalibration.transform': ( 'recalibration.html#transform',
                                                                                 'alphapept/recalibration.py')},
             'alphapept.score': { 'alphapept.score._get_limited_n_jobs': ('score.html#_get_limited_n_jobs', 'alphapept/score.py'),
+                                 'alphapept.score._get_protein_groups': ('score.html#_get_protein_groups', 'alphapept/score.py'),
+                                 'alphapept.score._pop_protein': ('score.html#_pop_protein', 'alphapept/score.py'),
                                  'alphapept.score.assign_proteins': ('score.html#assign_proteins', 'alphapept/score.py'),
                                  'alphapept.score.cut_fdr': ('score.html#cut_fdr', 'alphapept/score.py'),
                                  'alphapept.score.cut_global_fdr': ('score.html#cut_global_fdr', 'alphapept/score.py'),
@@ -368,38 +458,78 @@ d = { 'settings': { 'branch': 'master',
                                  'alphapept.score.filter_with_ML': ('score.html#filter_with_ml', 'alphapept/score.py'),
                                  'alphapept.score.filter_with_score': ('score.html#filter_with_score', 'alphapept/score.py'),
                                  'alphapept.score.filter_with_x_tandem': ('score.html#filter_with_x_tandem', 'alphapept/score.py'),
+                                 'alphapept.score.fit_RF': ('score.html#fit_rf', 'alphapept/score.py'),
                                  'alphapept.score.get_ML_features': ('score.html#get_ml_features', 'alphapept/score.py'),
+                                 'alphapept.score.get_ML_model_path': ('score.html#get_ml_model_path', 'alphapept/score.py'),
+                                 'alphapept.score.get_best_analytes': ('score.html#get_best_analytes', 'alphapept/score.py'),
+                                 'alphapept.score.get_cutoff_index': ('score.html#get_cutoff_index', 'alphapept/score.py'),
+                                 'alphapept.score.get_fdr': ('score.html#get_fdr', 'alphapept/score.py'),
+                                 'alphapept.score.get_fdr_mask': ('score.html#get_fdr_mask', 'alphapept/score.py'),
+                                 'alphapept.score.get_feature_hash': ('score.html#get_feature_hash', 'alphapept/score.py'),
+                                 'alphapept.score.get_fragment_ion_indices': ('score.html#get_fragment_ion_indices', 'alphapept/score.py'),
                                  'alphapept.score.get_generic_score': ('score.html#get_generic_score', 'alphapept/score.py'),
                                  'alphapept.score.get_ion': ('score.html#get_ion', 'alphapept/score.py'),
+                                 'alphapept.score.get_ion_labels': ('score.html#get_ion_labels', 'alphapept/score.py'),
+                                 'alphapept.score.get_ions': ('score.html#get_ions', 'alphapept/score.py'),
+                                 'alphapept.score.get_pooled_training_psms': ('score.html#get_pooled_training_psms', 'alphapept/score.py'),
+                                 'alphapept.score.get_possible_proteins': ('score.html#get_possible_proteins', 'alphapept/score.py'),
                                  'alphapept.score.get_protein_groups': ('score.html#get_protein_groups', 'alphapept/score.py'),
                                  'alphapept.score.get_q_values': ('score.html#get_q_values', 'alphapept/score.py'),
+                                 'alphapept.score.get_sequence_features': ('score.html#get_sequence_features', 'alphapept/score.py'),
                                  'alphapept.score.get_shared_proteins': ('score.html#get_shared_proteins', 'alphapept/score.py'),
+                                 'alphapept.score.get_training_psms': ('score.html#get_training_psms', 'alphapept/score.py'),
                                  'alphapept.score.get_x_tandem_score': ('score.html#get_x_tandem_score', 'alphapept/score.py'),
+                                 'alphapept.score.load_ML_model': ('score.html#load_ml_model', 'alphapept/score.py'),
                                  'alphapept.score.perform_protein_grouping': ('score.html#perform_protein_grouping', 'alphapept/score.py'),
                                  'alphapept.score.protein_grouping_all': ('score.html#protein_grouping_all', 'alphapept/score.py'),
+                                 'alphapept.score.read_search_psms': ('score.html#read_search_psms', 'alphapept/score.py'),
+                                 'alphapept.score.save_ML_model': ('score.html#save_ml_model', 'alphapept/score.py'),
                                  'alphapept.score.score_ML': ('score.html#score_ml', 'alphapept/score.py'),
                                  'alphapept.score.score_generic': ('score.html#score_generic', 'alphapept/score.py'),
                                  'alphapept.score.score_hdf': ('score.html#score_hdf', 'alphapept/score.py'),
                                  'alphapept.score.score_psms': ('score.html#score_psms', 'alphapept/score.py'),
                                  'alphapept.score.score_x_tandem': ('score.html#score_x_tandem', 'alphapept/score.py'),
-                                 'alphapept.score.train_RF': ('score.html#train_rf', 'alphapept/score.py')},
-            'alphapept.search': { 'alphapept.search.add_column': ('search.html#add_column', 'alphapept/search.py'),
+                                 'alphapept.score.train_RF': ('score.html#train_rf', 'alphapept/score.py'),
+                                 'alphapept.score.train_experiment_RF': ('score.html#train_experiment_rf', 'alphapept/score.py')},
+            'alphapept.search': { 'alphapept.search.TopNAccumulator': ('search.html#topnaccumulator', 'alphapept/search.py'),
+                                  'alphapept.search.TopNAccumulator.__init__': ( 'search.html#topnaccumulator.__init__',
+                                                                                 'alphapept/search.py'),
+                                  'alphapept.search.TopNAccumulator._compact': ( 'search.html#topnaccumulator._compact',
+                                                                                 'alphapept/search.py'),
+                                  'alphapept.search.TopNAccumulator._get_seq_ids': ( 'search.html#topnaccumulator._get_seq_ids',
+                                                                                     'alphapept/search.py'),
+                                  'alphapept.search.TopNAccumulator._resize': ( 'search.html#topnaccumulator._resize',
+                                                                                'alphapept/search.py'),
+                                  'alphapept.search.TopNAccumulator.add': ('search.html#topnaccumulator.add', 'alphapept/search.py'),
+                                  'alphapept.search.TopNAccumulator.to_df': ('search.html#topnaccumulator.to_df', 'alphapept/search.py'),
+                                  'alphapept.search.add_column': ('search.html#add_column', 'alphapept/search.py'),
+                                  'alphapept.search.clear_query_cache': ('search.html#clear_query_cache', 'alphapept/search.py'),
                                   'alphapept.search.compare_frags': ('search.html#compare_frags', 'alphapept/search.py'),
+                                  'alphapept.search.compare_spectrum_indexed': ( 'search.html#compare_spectrum_indexed',
+                                                                                 'alphapept/search.py'),
                                   'alphapept.search.compare_spectrum_parallel': ( 'search.html#compare_spectrum_parallel',
                                                                                   'alphapept/search.py'),
+                                  'alphapept.search.count_fragment_ions': ('search.html#count_fragment_ions', 'alphapept/search.py'),
+                                  'alphapept.search.fill_fragment_ions': ('search.html#fill_fragment_ions', 'alphapept/search.py'),
                                   'alphapept.search.filter_top_n': ('search.html#filter_top_n', 'alphapept/search.py'),
                                   'alphapept.search.frag_delta': ('search.html#frag_delta', 'alphapept/search.py'),
+                                  'alphapept.search.gather_query_fragments': ('search.html#gather_query_fragments', 'alphapept/search.py'),
+                                  'alphapept.search.get_fragment_index': ('search.html#get_fragment_index', 'alphapept/search.py'),
                                   'alphapept.search.get_hits': ('search.html#get_hits', 'alphapept/search.py'),
                                   'alphapept.search.get_idxs': ('search.html#get_idxs', 'alphapept/search.py'),
                                   'alphapept.search.get_psms': ('search.html#get_psms', 'alphapept/search.py'),
+                                  'alphapept.search.get_query_fragments': ('search.html#get_query_fragments', 'alphapept/search.py'),
                                   'alphapept.search.get_score_columns': ('search.html#get_score_columns', 'alphapept/search.py'),
                                   'alphapept.search.get_sequences': ('search.html#get_sequences', 'alphapept/search.py'),
                                   'alphapept.search.intensity_fraction': ('search.html#intensity_fraction', 'alphapept/search.py'),
                                   'alphapept.search.ion_extractor': ('search.html#ion_extractor', 'alphapept/search.py'),
+                                  'alphapept.search.load_query_cache': ('search.html#load_query_cache', 'alphapept/search.py'),
+                                  'alphapept.search.merge_top_n': ('search.html#merge_top_n', 'alphapept/search.py'),
                                   'alphapept.search.plot_psms': ('search.html#plot_psms', 'alphapept/search.py'),
                                   'alphapept.search.ppm_to_dalton': ('search.html#ppm_to_dalton', 'alphapept/search.py'),
                                   'alphapept.search.query_data_to_features': ('search.html#query_data_to_features', 'alphapept/search.py'),
                                   'alphapept.search.remove_column': ('search.html#remove_column', 'alphapept/search.py'),
+                                  'alphapept.search.save_query_cache': ('search.html#save_query_cache', 'alphapept/search.py'),
                                   'alphapept.search.score': ('search.html#score', 'alphapept/search.py'),
                                   'alphapept.search.search_db': ('search.html#search_db', 'alphapept/search.py'),
                                   'alphapept.search.search_fasta_block': ('search.html#search_fasta_block', 'alphapept/search.py'),
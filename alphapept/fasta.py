@@ -1,14 +1,20 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/03_fasta.ipynb.
 
 # %% auto 0
-__all__ = ['mass_dict', 'get_missed_cleavages', 'cleave_sequence', 'count_missed_cleavages', 'count_internal_cleavages', 'parse',
+__all__ = ['mass_dict', 'FRAGMENT_INDEX_BIN_WIDTH', 'SPECTRA_CHUNK_KEYS', 'DB_CACHE_SETTINGS', 'get_missed_cleavages',
+           'cleave_sequence', 'get_protease_pattern', 'count_missed_cleavages', 'count_internal_cleavages', 'parse',
            'list_to_numba', 'get_decoy_sequence', 'swap_KR', 'swap_AL', 'get_decoys', 'add_decoy_tag', 'add_fixed_mods',
            'add_variable_mod', 'get_isoforms', 'add_variable_mods', 'add_fixed_mod_terminal', 'add_fixed_mods_terminal',
            'add_variable_mods_terminal', 'get_unique_peptides', 'generate_peptides', 'check_peptide', 'get_precmass',
-           'get_fragmass', 'get_frag_dict', 'get_spectrum', 'get_spectra', 'read_fasta_file', 'read_fasta_file_entries',
-           'check_sequence', 'add_to_pept_dict', 'merge_pept_dicts', 'generate_fasta_list', 'generate_database',
-           'generate_spectra', 'block_idx', 'blocks', 'digest_fasta_block', 'generate_database_parallel',
-           'pept_dict_from_search', 'save_database', 'read_database']
+           'get_fragmass', 'get_frag_dict', 'get_spectrum', 'get_spectra', 'csr_take', 'encode_peptides',
+           'get_spectra_flat', 'generate_spectra_flat', 'read_fasta_file', 'read_fasta_file_entries', 'check_sequence',
+           'add_to_pept_dict', 'merge_pept_dicts', 'generate_fasta_list', 'generate_database', 'generate_spectra',
+           'block_idx', 'blocks', 'digest_fasta_block_peptides', 'digest_fasta_block', 'generate_database_parallel',
+           'pept_dict_from_search', 'build_fragment_index', 'save_database', 'save_pept_dict', 'read_database',
+           'load_pept_dict', 'PeptideIndex', 'MappedDatabase', 'write_spectra_chunk', 'merge_spectra_chunks',
+           'digest_fasta_block_to_chunk', 'write_database_chunk', 'generate_database_streaming',
+           'get_database_settings_hash', 'find_cached_database', 'evict_database_cache', 'link_database',
+           'generate_database_cached']
 
 # %% ../nbs/03_fasta.ipynb 5
 from . import constants
@@ -74,6 +80,20 @@ def cleave_sequence(
 import re
 from . import constants
 
+_protease_patterns = {}
+
+def get_protease_pattern(protease:str="trypsin") -> re.Pattern:
+    """
+    Gets the compiled regular expression for a protease. Patterns are compiled once and cached.
+    Args:
+        protease (str): the protease/enzyme name, the regular expression can be found in alphapept.constants.protease_dict.
+    Returns:
+        re.Pattern: the compiled regular expression.
+    """
+    if protease not in _protease_patterns:
+        _protease_patterns[protease] = re.compile(constants.protease_dict[protease])
+    return _protease_patterns[protease]
+
 def count_missed_cleavages(sequence:str="", protease:str="trypsin", **kwargs) -> int:
     """
     Counts the number of missed cleavages for a given sequence and protease
@@ -83,9 +103,7 @@ def count_missed_cleavages(sequence:str="", protease:str="trypsin", **kwargs) ->
     Returns:
         int: the number of miss cleavages
     """
-    proteases = constants.protease_dict
-    protease = proteases[protease]
-    p = re.compile(protease)
+    p = get_protease_pattern(protease)
     n_missed = len(p.findall(sequence))
     return n_missed
 
@@ -98,9 +116,8 @@ def count_internal_cleavages(sequence:str="", protease:str="trypsin", **kwargs)
     Returns:
         int (0 or 1): if the sequence is from internal cleavage.
     """
-    proteases = constants.protease_dict
-    protease = proteases[protease]
-    match = re.search(protease,sequence[-1]+'_')
+    p = get_protease_pattern(protease)
+    match = p.search(sequence[-1]+'_')
     if match:
         n_internal = 0
     else:
@@ -649,6 +666,158 @@ def get_spectra(peptides:numba.typed.List, mass_dict:numba.typed.Dict)->List:
     return spectra
 
 # %% ../nbs/03_fasta.ipynb 65
+def csr_take(indices:np.ndarray, order:np.ndarray)->tuple:
+    """
+    Select rows of flat arrays that are indexed by an indptr, e.g. the fragments of database entries.
+    Args:
+        indices (np.ndarray(np.int64)): indptr to the elements of each row.
+        order (np.ndarray(np.int64)): the rows to take.
+    Returns:
+        np.ndarray(np.int64): indptr to the elements of the taken rows.
+        np.ndarray(np.int64): the positions of the elements of the taken rows in the flat arrays.
+    """
+    lens = np.diff(indices)[order]
+    new_indices = np.zeros(len(lens) + 1, np.int64)
+    new_indices[1:] = np.cumsum(lens)
+    element_idx = np.repeat(indices[:-1][order] - new_indices[:-1], lens) + np.arange(new_indices[-1])
+
+    return new_indices, element_idx
+
+def encode_peptides(peptides:list, mass_dict:numba.typed.Dict)->tuple:
+    """
+    Encode the (modified) amino acids of peptides as integer codes. The amino acids are split as in parse.
+    Args:
+        peptides (list of str): the (modified) peptide list.
+        mass_dict (numba.typed.Dict): key is the amino acid or modified amino acid, and the value is the mass.
+    Returns:
+        np.ndarray(np.int64): the code of each amino acid of all peptides.
+        np.ndarray(np.int64): indptr to the amino acids of each peptide.
+        np.ndarray(np.float64): the mass of each code, NaN if the amino acid is not in the mass_dict.
+    """
+    peptides = [_.split("_")[0] for _ in peptides]
+    joined = "".join(peptides)
+
+    pep_indptr = np.zeros(len(peptides) + 1, np.int64)
+    pep_indptr[1:] = np.cumsum([len(_) for _ in peptides])
+
+    #Each amino acid ends with an uppercase letter and is preceded by its modification
+    buffer = np.frombuffer(joined.encode(), dtype=np.uint8)
+    ends = np.flatnonzero((buffer >= ord("A")) & (buffer <= ord("Z")))
+    pep_idx = np.searchsorted(pep_indptr, ends, side="right") - 1
+
+    starts = np.zeros(len(ends), np.int64)
+    starts[1:] = ends[:-1] + 1
+    starts = np.maximum(starts, pep_indptr[pep_idx])
+
+    indptr = np.zeros(len(peptides) + 1, np.int64)
+    indptr[1:] = np.cumsum(np.bincount(pep_idx, minlength=len(peptides)))
+
+    #Codes 0-25 are the unmodified amino acids, modified amino acids are added after
+    codes = buffer[ends].astype(np.int64) - ord("A")
+    modified = np.flatnonzero(starts < ends)
+    mod_aas = np.array([joined[s:e+1] for s, e in zip(starts[modified], ends[modified])], dtype=str)
+    mod_aas, inverse = np.unique(mod_aas, return_inverse=True)
+    codes[modified] = 26 + inverse
+
+    aas = [chr(ord("A") + _) for _ in range(26)] + list(mod_aas)
+    code_masses = np.array([mass_dict[_] if _ in mass_dict else np.nan for _ in aas], dtype=np.float64)
+
+    return codes, indptr, code_masses
+
+@njit
+def get_spectra_flat(codes:np.ndarray, aa_indptr:np.ndarray, code_masses:np.ndarray, mass_proton:float, mass_h2o:float)->tuple:
+    """
+    Get neutral peptide masses, fragment masses and fragment types for encoded peptides. See encode_peptides.
+    Args:
+        codes (np.ndarray(np.int64)): the code of each amino acid of all peptides.
+        aa_indptr (np.ndarray(np.int64)): indptr to the amino acids of each peptide. Each peptide needs at least one amino acid.
+        code_masses (np.ndarray(np.float64)): the mass of each code.
+        mass_proton (float): mass of a proton.
+        mass_h2o (float): mass of water.
+    Returns:
+        np.ndarray(np.float64): the neutral peptide masses.
+        np.ndarray(np.int64): indptr to the fragments of each peptide.
+        np.ndarray(np.float64): the fragment masses, sorted for each peptide.
+        np.ndarray(np.int8): the fragment types, see get_fragmass.
+    """
+    n_peptides = len(aa_indptr) - 1
+
+    indices = np.zeros(n_peptides + 1, np.int64)
+    for i in range(n_peptides):
+        indices[i+1] = indices[i] + (aa_indptr[i+1] - aa_indptr[i] - 1) * 2
+
+    precmasses = np.zeros(n_peptides, dtype=np.float64)
+    fragmasses = np.zeros(indices[-1], dtype=np.float64)
+    fragtypes = np.zeros(indices[-1], dtype=np.int8)
+
+    for i in range(n_peptides):
+        start, end = aa_indptr[i], aa_indptr[i+1]
+
+        tmass = mass_h2o
+        for j in range(start, end):
+            tmass += code_masses[codes[j]]
+        precmasses[i] = tmass
+
+        n_frag = indices[i]
+
+        # b-ions > 0
+        frag_m = mass_proton
+        for j in range(start, end - 1):
+            frag_m += code_masses[codes[j]]
+            fragmasses[n_frag] = frag_m
+            fragtypes[n_frag] = j - start + 1
+            n_frag += 1
+
+        # y-ions < 0
+        frag_m = mass_proton + mass_h2o
+        for j in range(end - 1, start, -1):
+            frag_m += code_masses[codes[j]]
+            fragmasses[n_frag] = frag_m
+            fragtypes[n_frag] = -(end - j)
+            n_frag += 1
+
+        sortindex = np.argsort(fragmasses[indices[i]:indices[i+1]])
+        fragmasses[indices[i]:indices[i+1]] = fragmasses[indices[i]:indices[i+1]][sortindex]
+        fragtypes[indices[i]:indices[i+1]] = fragtypes[indices[i]:indices[i+1]][sortindex]
+
+    return precmasses, indices, fragmasses, fragtypes
+
+def generate_spectra_flat(peptides:list, mass_dict:numba.typed.Dict)->dict:
+    """
+    Generate theoretical spectra for a block of peptides as flat arrays sorted by precursor mass.
+    Args:
+        peptides (list of str): the (modified) peptide list.
+        mass_dict (numba.typed.Dict): key is the amino acid or modified amino acid, and the value is the mass.
+    Returns:
+        dict: with the arrays precursors, seqs, indices, fragmasses and fragtypes, see save_database.
+    """
+    codes, aa_indptr, code_masses = encode_peptides(peptides, mass_dict)
+
+    #Skip peptides that cannot be parsed, see get_spectra
+    n_aas = np.diff(aa_indptr)
+    n_invalid = np.zeros(len(codes) + 1, np.int64)
+    n_invalid[1:] = np.cumsum(np.isnan(code_masses[codes]))
+    valid = (n_aas > 0) & (n_invalid[aa_indptr[1:]] == n_invalid[aa_indptr[:-1]])
+
+    codes = codes[np.repeat(valid, n_aas)]
+    aa_indptr = np.zeros(valid.sum() + 1, np.int64)
+    aa_indptr[1:] = np.cumsum(n_aas[valid])
+
+    precmasses, indices, fragmasses, fragtypes = get_spectra_flat(codes, aa_indptr, code_masses, mass_dict["Proton"], mass_dict["H2O"])
+
+    sortindex = np.argsort(precmasses)
+    indices, frag_idx = csr_take(indices, sortindex)
+
+    spectra = {}
+    spectra["precursors"] = precmasses[sortindex]
+    spectra["seqs"] = np.array(peptides, dtype=str)[valid][sortindex]
+    spectra["indices"] = indices
+    spectra["fragmasses"] = fragmasses[frag_idx]
+    spectra["fragtypes"] = fragtypes[frag_idx]
+
+    return spectra
+
+# %% ../nbs/03_fasta.ipynb 68
 from Bio import SeqIO
 import os
 from glob import glob
@@ -726,7 +895,7 @@ def check_sequence(element:dict, AAs:set, verbose:bool = False)->bool:
     
 
 
-# %% ../nbs/03_fasta.ipynb 68
+# %% ../nbs/03_fasta.ipynb 71
 def add_to_pept_dict(pept_dict:dict, new_peptides:list, i:int)->tuple:
     """
     Add peptides to the peptide dictionary
@@ -749,7 +918,7 @@ def add_to_pept_dict(pept_dict:dict, new_peptides:list, i:int)->tuple:
 
     return pept_dict, added_peptides
 
-# %% ../nbs/03_fasta.ipynb 71
+# %% ../nbs/03_fasta.ipynb 74
 def merge_pept_dicts(list_of_pept_dicts:list)->dict:
     """
     Merge a list of peptide dict into a single dict.
@@ -774,7 +943,7 @@ def merge_pept_dicts(list_of_pept_dicts:list)->dict:
 
     return new_pept_dict
 
-# %% ../nbs/03_fasta.ipynb 75
+# %% ../nbs/03_fasta.ipynb 78
 from collections import OrderedDict
 
 def generate_fasta_list(fasta_paths:list, callback = None, **kwargs)->tuple:
@@ -816,7 +985,7 @@ def generate_fasta_list(fasta_paths:list, callback = None, **kwargs)->tuple:
 
 
 
-# %% ../nbs/03_fasta.ipynb 77
+# %% ../nbs/03_fasta.ipynb 80
 def generate_database(mass_dict:dict, fasta_paths:list, callback = None, **kwargs)->tuple:
     """
     Function to generate a database from a fasta file
@@ -862,7 +1031,7 @@ def generate_database(mass_dict:dict, fasta_paths:list, callback = None, **kwarg
 
     return to_add, pept_dict, fasta_dict
 
-# %% ../nbs/03_fasta.ipynb 80
+# %% ../nbs/03_fasta.ipynb 83
 def generate_spectra(to_add:list, mass_dict:dict, callback = None)->list:
     """
     Function to generate spectra list database from a fasta file
@@ -893,7 +1062,7 @@ def generate_spectra(to_add:list, mass_dict:dict, callback = None)->list:
 
     return spectra
 
-# %% ../nbs/03_fasta.ipynb 84
+# %% ../nbs/03_fasta.ipynb 87
 from typing import Generator
 
 def block_idx(len_list:int, block_size:int = 1000)->list:
@@ -928,19 +1097,16 @@ def blocks(l:int, n:int)->Generator[list, None, None]:
     n = max(1, n)
     return (l[i:i+n] for i in range(0, len(l), n))
 
-# %% ../nbs/03_fasta.ipynb 86
+# %% ../nbs/03_fasta.ipynb 89
 from multiprocessing import Pool
 from . import constants
 mass_dict = constants.mass_dict
 
 #This function is a wrapper function and to be tested by the integration test
-def digest_fasta_block(to_process:tuple)-> (list, dict):
+def digest_fasta_block_peptides(fasta_index:int, fasta_block:list, settings:dict)-> (List, dict):
     """
-    Digest and create spectra for a whole fasta_block for multiprocessing. See generate_database_parallel.
+    Digest a whole fasta_block. See digest_fasta_block.
     """
-
-    fasta_index, fasta_block, settings = to_process
-
     to_add = List()
 
     f_index = 0
@@ -954,6 +1120,18 @@ def digest_fasta_block(to_process:tuple)-> (list, dict):
             to_add.extend(added_peptides)
         f_index += 1
 
+    return to_add, pept_dict
+
+#This function is a wrapper function and to be tested by the integration test
+def digest_fasta_block(to_process:tuple)-> (list, dict):
+    """
+    Digest and create spectra for a whole fasta_block for multiprocessing. See generate_database_parallel.
+    """
+
+    fasta_index, fasta_block, settings = to_process
+
+    to_add, pept_dict = digest_fasta_block_peptides(fasta_index, fasta_block, settings)
+
     spectra = []
     if len(to_add) > 0:
         for specta_block in blocks(to_add, settings['fasta']['spectra_block']):
@@ -1006,11 +1184,11 @@ def generate_database_parallel(settings:dict, callback = None):
 
     return spectra_set, pept_dict, fasta_dict
 
-# %% ../nbs/03_fasta.ipynb 88
+# %% ../nbs/03_fasta.ipynb 91
 #This function is a wrapper function and to be tested by the integration test
 def pept_dict_from_search(settings:dict):
     """
-    Generates a peptide dict from a large search.
+    Generates a peptide index from a large search. See PeptideIndex.
     """
 
     paths = settings['experiment']['file_paths']
@@ -1031,29 +1209,57 @@ def pept_dict_from_search(settings:dict):
 
     df = pd.concat(all_dfs)
 
-    df['fasta_index'] = df['fasta_index'].str.split(',')
+    fasta_index = df['fasta_index'].astype(str).str.split(',')
 
-    lst_col = 'fasta_index'
+    pairs = pd.DataFrame({
+        'sequence': np.repeat(df['sequence'].values, fasta_index.str.len()),
+        'protein': np.concatenate(fasta_index.values)
+    })
 
-    df_ = pd.DataFrame({
-          col:np.repeat(df[col].values, df[lst_col].str.len())
-          for col in df.columns.drop(lst_col)}
-        ).assign(**{lst_col:np.concatenate(df[lst_col].values)})[df.columns]
+    # Matched peptides have no fasta_index and are kept without proteins
+    pairs = pairs[pairs['protein'].str.isdigit()].drop_duplicates()
 
-    df_['fasta_index'] = df_['fasta_index'].astype('int')
-    df_grouped = df_.groupby(['sequence'])['fasta_index'].unique()
+    sequences = np.unique(df['sequence'].values.astype(str))
+    rows = np.searchsorted(sequences, pairs['sequence'].values.astype(str))
+    order = np.argsort(rows, kind='stable')
 
-    pept_dict = {}
-    for keys, vals in zip(df_grouped.index, df_grouped.values):
-        pept_dict[keys] = vals.tolist()
+    protein_indptr = np.zeros(len(sequences) + 1, dtype=np.int64)
+    protein_indptr[1:] = np.cumsum(np.bincount(rows, minlength=len(sequences)))
 
-    return pept_dict
+    return PeptideIndex(sequences, protein_indptr, pairs['protein'].values.astype(np.int64)[order])
+
+# %% ../nbs/03_fasta.ipynb 93
+FRAGMENT_INDEX_BIN_WIDTH = 0.05
+
+def build_fragment_index(fragmasses:np.ndarray, indices:np.ndarray, bin_width:float=FRAGMENT_INDEX_BIN_WIDTH)->tuple:
+    """
+    Build an inverted index that maps fragment mass buckets to database entries.
+    Args:
+        fragmasses (np.ndarray): flat array with the fragment masses of all database entries.
+        indices (np.ndarray): indices to the fragments of each database entry.
+        bin_width (float): width of a fragment mass bucket in Dalton.
+    Returns:
+        np.ndarray: indptr to the entries of each bucket.
+        np.ndarray: db_idx of each entry, sorted by bucket and db_idx.
+        np.ndarray: fragment mass of each entry.
+    """
+    db_idx = np.repeat(np.arange(len(indices) - 1, dtype=np.int64), np.diff(indices))
+    bins = (fragmasses / bin_width).astype(np.int64)
+
+    #Fragments are stored per db entry, a stable sort keeps db_idx sorted within each bucket
+    order = np.argsort(bins, kind='stable')
+
+    n_bins = bins.max() + 1 if len(bins) > 0 else 0
+    indptr = np.zeros(n_bins + 1, np.int64)
+    indptr[1:] = np.cumsum(np.bincount(bins, minlength=n_bins))
+
+    return indptr, db_idx[order], fragmasses[order]
 
-# %% ../nbs/03_fasta.ipynb 90
+# %% ../nbs/03_fasta.ipynb 96
 import alphapept.io
 import pandas as pd
 
-def save_database(spectra:list, pept_dict:dict, fasta_dict:dict, database_path:str, **kwargs):
+def save_database(spectra:list, pept_dict:dict, fasta_dict:dict, database_path:str, fragment_index:bool = False, **kwargs):
     """
     Function to save a database to the *.hdf format. Write the database into hdf.
     
@@ -1062,6 +1268,7 @@ def save_database(spectra:list, pept_dict:dict, fasta_dict:dict, database_path:s
         pept_dict (dict): peptide dict. See add_to_pept_dict().
         fasta_dict (dict): fasta_dict. See generate_fasta_list().
         database_path (str): Path to database.
+        fragment_index (bool): Additionally save a fragment index. See build_fragment_index().
     """
     
     precmasses, seqs, fragmasses, fragtypes = zip(*spectra)
@@ -1099,11 +1306,31 @@ def save_database(spectra:list, pept_dict:dict, fasta_dict:dict, database_path:s
     to_save["fragtypes"] = frag_types
     to_save["indices"] = indices
 
+    if fragment_index:
+        (
+            to_save["fragment_index_indptr"],
+            to_save["fragment_index_db_idx"],
+            to_save["fragment_index_fragmasses"]
+        ) = build_fragment_index(frags, indices)
+
     db_file = alphapept.io.HDF_File(database_path, is_new_file=True)
     for key, value in to_save.items():
         db_file.write(value, dataset_name=key)
-    
-    peps = np.array(list(pept_dict), dtype=object)
+
+    if fragment_index:
+        db_file.write(FRAGMENT_INDEX_BIN_WIDTH, dataset_name="fragment_index_indptr", attr_name="bin_width")
+
+    save_pept_dict(pept_dict, db_file)
+
+def save_pept_dict(pept_dict:dict, db_file:alphapept.io.HDF_File):
+    """
+    Write the peptide dict as peptides group with flat arrays to a database.
+    Peptides are sorted so that they can be looked up with a binary search, see PeptideIndex.
+    Args:
+        pept_dict (dict): peptide dict. See add_to_pept_dict().
+        db_file (alphapept.io.HDF_File): database file to write to.
+    """
+    peps = np.array(sorted(pept_dict), dtype=object)
     indices = np.empty(len(peps) + 1, dtype=np.int64)
     indices[0] = 0
     indices[1:] = np.cumsum([len(pept_dict[i]) for i in peps])
@@ -1126,8 +1353,9 @@ def save_database(spectra:list, pept_dict:dict, fasta_dict:dict, database_path:s
         group_name="peptides"
     )
 
-# %% ../nbs/03_fasta.ipynb 91
+# %% ../nbs/03_fasta.ipynb 97
 import collections
+import collections.abc
 
 def read_database(database_path:str, array_name:str=None)->dict:
     """
@@ -1136,7 +1364,7 @@ def read_database(database_path:str, array_name:str=None)->dict:
         database_path (str): hdf database file generate by alphapept.
         array_name (str): the dataset name to read
     return:
-        dict: key is the dataset_name in hdf file, value is the python object read from the dataset_name
+        dict: key is the dataset_name in hdf file, value is the python object read from the dataset_name. The peptides are returned as PeptideIndex under pept_dict.
     """
     db_file = alphapept.io.HDF_File(database_path)
     if array_name is None:
@@ -1151,25 +1379,647 @@ def read_database(database_path:str, array_name:str=None)->dict:
         db_data["fasta_dict"] = np.array(
             collections.OrderedDict(db_file.read(dataset_name="proteins").T)
         )
-        peps = db_file.read(dataset_name="sequences", group_name="peptides")
-        protein_indptr = db_file.read(
-            dataset_name="protein_indptr",
-            group_name="peptides"
-        )
-        protein_indices = db_file.read(
-            dataset_name="protein_indices",
-            group_name="peptides"
-        )
-        db_data["pept_dict"] = np.array(
-            {
-                pep: (protein_indices[s: e]).tolist() for pep, s, e in zip(
-                    peps,
-                    protein_indptr[:-1],
-                    protein_indptr[1:],
-                )
-            }
-        )
+        # 0-d object array, as np.array would treat the index as a sequence
+        db_data["pept_dict"] = np.empty((), dtype=object)
+        db_data["pept_dict"][()] = PeptideIndex.from_hdf(db_file)
         db_data["seqs"] = db_data["seqs"].astype(str)
     else:
         db_data = db_file.read(dataset_name=array_name)
     return db_data
+
+def load_pept_dict(db_file:alphapept.io.HDF_File)->dict:
+    """
+    Read the peptide dict from the peptides group of a database. See save_pept_dict.
+    Args:
+        db_file (alphapept.io.HDF_File): database file to read from.
+    Returns:
+        dict: peptide dict. See add_to_pept_dict().
+    """
+    peps = db_file.read(dataset_name="sequences", group_name="peptides")
+    protein_indptr = db_file.read(
+        dataset_name="protein_indptr",
+        group_name="peptides"
+    )
+    protein_indices = db_file.read(
+        dataset_name="protein_indices",
+        group_name="peptides"
+    )
+    pept_dict = {
+        pep: (protein_indices[s: e]).tolist() for pep, s, e in zip(
+            peps,
+            protein_indptr[:-1],
+            protein_indptr[1:],
+        )
+    }
+
+    return pept_dict
+
+class PeptideIndex(collections.abc.Mapping):
+    """
+    Read-only peptide dict on the flat arrays of the peptides group of a database, see save_pept_dict.
+    Sequences are kept sorted and looked up with a binary search, so no Python dict is created.
+    Args:
+        sequences (np.ndarray): peptide sequences.
+        protein_indptr (np.ndarray): indptr to the proteins of each peptide.
+        protein_indices (np.ndarray): protein ids of all peptides.
+    """
+
+    def __init__(self, sequences:np.ndarray, protein_indptr:np.ndarray, protein_indices:np.ndarray):
+        sequences = np.asarray(sequences).astype(str)
+        protein_indptr = np.asarray(protein_indptr, dtype=np.int64)
+        protein_indices = np.asarray(protein_indices, dtype=np.int64)
+
+        if np.any(sequences[1:] < sequences[:-1]):
+            order = np.argsort(sequences, kind='stable')
+            sequences = sequences[order]
+            protein_indptr, element_idx = csr_take(protein_indptr, order)
+            protein_indices = protein_indices[element_idx]
+
+        self.sequences = sequences
+        self.protein_indptr = protein_indptr
+        self.protein_indices = protein_indices
+
+    @classmethod
+    def from_dict(cls, pept_dict:dict):
+        """
+        Create a peptide index from a peptide dict. See add_to_pept_dict().
+        """
+        sequences = np.array(list(pept_dict), dtype=str)
+        protein_indptr = np.zeros(len(sequences) + 1, dtype=np.int64)
+        protein_indptr[1:] = np.cumsum([len(pept_dict[_]) for _ in pept_dict])
+        protein_indices = np.fromiter((_ for v in pept_dict.values() for _ in v), dtype=np.int64, count=protein_indptr[-1])
+
+        return cls(sequences, protein_indptr, protein_indices)
+
+    @classmethod
+    def from_hdf(cls, db_file:alphapept.io.HDF_File):
+        """
+        Read the peptide index from the peptides group of a database. See save_pept_dict.
+        """
+        return cls(
+            db_file.read(dataset_name="sequences", group_name="peptides"),
+            db_file.read(dataset_name="protein_indptr", group_name="peptides"),
+            db_file.read(dataset_name="protein_indices", group_name="peptides"),
+        )
+
+    def get_rows(self, sequences:np.ndarray)->np.ndarray:
+        """
+        Get the rows of sequences in the index.
+        Args:
+            sequences (np.ndarray): peptide sequences.
+        Returns:
+            np.ndarray(np.int64): row of each sequence.
+        Raises:
+            KeyError: if a sequence is not in the index.
+        """
+        sequences = np.asarray(sequences).astype(str)
+        rows = np.searchsorted(self.sequences, sequences)
+        found = rows < len(self.sequences)
+        found[found] = self.sequences[rows[found]] == sequences[found]
+        if not np.all(found):
+            raise KeyError(sequences[~found][0])
+
+        return rows.astype(np.int64)
+
+    def get_proteins(self, sequences:np.ndarray)->tuple:
+        """
+        Get the proteins of sequences in CSR layout, the proteins of sequence i are indices[indptr[i]:indptr[i+1]].
+        Args:
+            sequences (np.ndarray): peptide sequences.
+        Returns:
+            np.ndarray(np.int64): indptr to the proteins of each sequence.
+            np.ndarray(np.int64): protein ids.
+        """
+        indptr, element_idx = csr_take(self.protein_indptr, self.get_rows(sequences))
+
+        return indptr, self.protein_indices[element_idx]
+
+    def subset(self, sequences:np.ndarray):
+        """
+        Create a peptide index that only contains the given sequences.
+        """
+        sequences = np.unique(np.asarray(sequences).astype(str))
+        indptr, indices = self.get_proteins(sequences)
+
+        return PeptideIndex(sequences, indptr, indices)
+
+    def __getitem__(self, sequence:str)->list:
+        row = self.get_rows(np.array([sequence]))[0]
+
+        return self.protein_indices[self.protein_indptr[row]:self.protein_indptr[row+1]].tolist()
+
+    def __iter__(self):
+        return iter(self.sequences.tolist())
+
+    def __len__(self)->int:
+        return len(self.sequences)
+
+    def __repr__(self)->str:
+        return f"PeptideIndex({len(self):,} peptides)"
+
+# %% ../nbs/03_fasta.ipynb 99
+import collections.abc
+import h5py
+
+class MappedDatabase(collections.abc.Mapping):
+    """
+    Read-only view on a database hdf file. Contiguous numeric datasets are returned as memory-mapped arrays, all other datasets are read on first access and cached.
+    Args:
+        database_path (str): hdf database file generate by alphapept.
+    """
+
+    def __init__(self, database_path:str):
+        self.database_path = database_path
+        self.attrs = {}
+        self._layout = {}
+        self._cache = {}
+
+        with h5py.File(database_path, "r") as hdf_file:
+            for key, dataset in hdf_file.items():
+                if not isinstance(dataset, h5py.Dataset):
+                    continue
+                self.attrs[key] = dict(dataset.attrs)
+                offset = dataset.id.get_offset()
+                if (
+                    (offset is not None) and
+                    (dataset.chunks is None) and
+                    (dataset.dtype.kind in 'biuf')
+                ):
+                    self._layout[key] = (offset, dataset.dtype, dataset.shape)
+                else:
+                    self._layout[key] = None
+
+    def __getitem__(self, key:str)->np.ndarray:
+        if key not in self._cache:
+            layout = self._layout[key]
+            if layout is not None:
+                offset, dtype, shape = layout
+                array = np.memmap(self.database_path, mode="r", dtype=dtype, shape=shape, offset=offset)
+            else:
+                array = alphapept.io.HDF_File(self.database_path).read(dataset_name=key)
+            self._cache[key] = array
+        return self._cache[key]
+
+    def __iter__(self):
+        return iter(self._layout)
+
+    def __len__(self)->int:
+        return len(self._layout)
+
+    def __repr__(self)->str:
+        return f"MappedDatabase({self.database_path})"
+
+# %% ../nbs/03_fasta.ipynb 105
+import os
+
+SPECTRA_CHUNK_KEYS = ['precursors', 'seqs', 'indices', 'fragmasses', 'fragtypes']
+
+def write_spectra_chunk(spectra:dict, chunk_path:str)->int:
+    """
+    Write theoretical spectra as a sorted chunk of flat arrays to disk.
+    Args:
+        spectra (dict): theoretical spectra as flat arrays. See generate_spectra_flat().
+        chunk_path (str): directory to store the arrays of the chunk as *.npy files.
+    Returns:
+        int: number of unique spectra in the chunk.
+    """
+    precmasses = spectra['precursors']
+    seqs = spectra['seqs'].astype(np.bytes_)
+
+    #Identical sequences have identical precursor masses, sorting by both puts duplicates next to each other
+    order = np.lexsort((seqs, precmasses))
+    keep = np.ones(len(order), dtype=np.bool_)
+    keep[1:] = (precmasses[order][1:] != precmasses[order][:-1]) | (seqs[order][1:] != seqs[order][:-1])
+    order = order[keep]
+
+    indices, frag_idx = csr_take(spectra['indices'], order)
+
+    chunk = {
+        'precursors': precmasses[order],
+        'seqs': seqs[order],
+        'indices': indices,
+        'fragmasses': spectra['fragmasses'][frag_idx],
+        'fragtypes': spectra['fragtypes'][frag_idx],
+    }
+
+    os.makedirs(chunk_path, exist_ok=True)
+    for key in SPECTRA_CHUNK_KEYS:
+        np.save(os.path.join(chunk_path, f'{key}.npy'), chunk[key])
+
+    return len(order)
+
+# %% ../nbs/03_fasta.ipynb 106
+import h5py
+
+def merge_spectra_chunks(chunk_paths:list, database_path:str, tmp_dir:str, memory_budget:float = 4000)->int:
+    """
+    K-way merge of sorted spectra chunks into the precursors, seqs, indices, fragmasses and fragtypes datasets of a database.
+    Duplicate sequences are removed and the output is sorted by precursor mass. Chunks are read as memory-mapped arrays in blocks so that the merge stays within the memory budget.
+    Args:
+        chunk_paths (list): directories of chunks. See write_spectra_chunk().
+        database_path (str): Path to database. Needs to exist.
+        tmp_dir (str): directory to store the merged arrays before they are copied to the database.
+        memory_budget (float): memory budget for the merge in MB.
+    Returns:
+        int: number of merged spectra.
+    """
+    chunks = [
+        {key: np.load(os.path.join(_, f'{key}.npy'), mmap_mode='r') for key in SPECTRA_CHUNK_KEYS}
+        for _ in chunk_paths
+    ]
+    chunks = [_ for _ in chunks if len(_['precursors']) > 0]
+
+    if len(chunks) == 0:
+        raise ValueError("No spectra to merge.")
+
+    n_spectra = sum([len(_['precursors']) for _ in chunks])
+    n_bytes = sum([sum([_[key].nbytes for key in SPECTRA_CHUNK_KEYS]) for _ in chunks])
+    seq_dtype = max([_['seqs'].dtype for _ in chunks], key=lambda x: x.itemsize)
+    frag_dtype = chunks[0]['fragmasses'].dtype
+    type_dtype = chunks[0]['fragtypes'].dtype
+
+    #Buffers are copied a few times when merging, reserve space for that
+    budget = memory_budget * 1024**2 / 4
+    block_size = max(1, int(budget / len(chunks) / (n_bytes / n_spectra)))
+
+    out_files = {key: open(os.path.join(tmp_dir, f'merged_{key}.bin'), 'wb') for key in ['precursors', 'seqs', 'lens', 'fragmasses', 'fragtypes']}
+
+    pos = [0 for _ in chunks]
+    last_key = None
+    n_merged = 0
+
+    while any(pos[i] < len(chunk['precursors']) for i, chunk in enumerate(chunks)):
+        ends = [min(pos[i] + block_size, len(chunk['precursors'])) for i, chunk in enumerate(chunks)]
+
+        #Everything up to the smallest last key of a chunk that is not fully read can be merged
+        limits = [(chunk['precursors'][ends[i]-1], chunk['seqs'][ends[i]-1]) for i, chunk in enumerate(chunks) if ends[i] < len(chunk['precursors'])]
+        limit = min(limits) if len(limits) > 0 else None
+
+        block = {key: [] for key in ['precursors', 'seqs', 'lens', 'fragmasses', 'fragtypes']}
+        for i, chunk in enumerate(chunks):
+            start, end = pos[i], ends[i]
+            if limit is not None:
+                masses = chunk['precursors'][start:end]
+                lower = start + np.searchsorted(masses, limit[0], side='left')
+                upper = start + np.searchsorted(masses, limit[0], side='right')
+                end = lower + np.searchsorted(chunk['seqs'][lower:upper], limit[1], side='right')
+            if end > start:
+                frag_start, frag_end = chunk['indices'][start], chunk['indices'][end]
+                block['precursors'].append(chunk['precursors'][start:end])
+                block['seqs'].append(chunk['seqs'][start:end])
+                block['lens'].append(np.diff(chunk['indices'][start:end+1]))
+                block['fragmasses'].append(chunk['fragmasses'][frag_start:frag_end])
+                block['fragtypes'].append(chunk['fragtypes'][frag_start:frag_end])
+            pos[i] = end
+
+        block = {key: np.concatenate(value) for key, value in block.items()}
+        indices = np.zeros(len(block['lens']) + 1, np.int64)
+        indices[1:] = np.cumsum(block['lens'])
+
+        order = np.lexsort((block['seqs'], block['precursors']))
+        masses = block['precursors'][order]
+        seqs = block['seqs'][order]
+
+        keep = np.ones(len(order), dtype=np.bool_)
+        keep[1:] = (masses[1:] != masses[:-1]) | (seqs[1:] != seqs[:-1])
+        if last_key is not None:
+            keep[0] = (masses[0], seqs[0]) != last_key
+        last_key = (masses[-1], seqs[-1])
+
+        order = order[keep]
+        lens = block['lens'][order]
+        _, frag_idx = csr_take(indices, order)
+
+        block['precursors'][order].tofile(out_files['precursors'])
+        block['seqs'][order].astype(seq_dtype).tofile(out_files['seqs'])
+        lens.tofile(out_files['lens'])
+        block['fragmasses'][frag_idx].tofile(out_files['fragmasses'])
+        block['fragtypes'][frag_idx].tofile(out_files['fragtypes'])
+
+        n_merged += len(order)
+
+    for _ in out_files.values():
+        _.close()
+
+    merged = {
+        'precursors': np.memmap(os.path.join(tmp_dir, 'merged_precursors.bin'), mode='r', dtype=np.float64),
+        'seqs': np.memmap(os.path.join(tmp_dir, 'merged_seqs.bin'), mode='r', dtype=seq_dtype),
+        'lens': np.memmap(os.path.join(tmp_dir, 'merged_lens.bin'), mode='r', dtype=np.int64),
+        'fragmasses': np.memmap(os.path.join(tmp_dir, 'merged_fragmasses.bin'), mode='r', dtype=frag_dtype),
+        'fragtypes': np.memmap(os.path.join(tmp_dir, 'merged_fragtypes.bin'), mode='r', dtype=type_dtype),
+    }
+    n_frags = len(merged['fragmasses'])
+
+    #Copy to contiguous datasets so that they can be memory-mapped, see MappedDatabase
+    copy_size = max(1, int(budget / 16))
+    with h5py.File(database_path, 'a') as hdf_file:
+        dataset = hdf_file.create_dataset('precursors', shape=(n_merged,), dtype=np.float64)
+        for start in range(0, n_merged, copy_size):
+            dataset[start:start+copy_size] = merged['precursors'][start:start+copy_size]
+
+        dataset = hdf_file.create_dataset('seqs', shape=(n_merged,), dtype=h5py.string_dtype())
+        for start in range(0, n_merged, copy_size):
+            dataset[start:start+copy_size] = np.char.decode(merged['seqs'][start:start+copy_size]).astype(object)
+
+        dataset = hdf_file.create_dataset('indices', shape=(n_merged + 1,), dtype=np.int64)
+        dataset[0] = 0
+        offset = 0
+        for start in range(0, n_merged, copy_size):
+            indices = offset + np.cumsum(merged['lens'][start:start+copy_size])
+            dataset[start+1:start+1+len(indices)] = indices
+            offset = indices[-1]
+
+        for key in ['fragmasses', 'fragtypes']:
+            dataset = hdf_file.create_dataset(key, shape=(n_frags,), dtype=merged[key].dtype)
+            for start in range(0, n_frags, copy_size):
+                dataset[start:start+copy_size] = merged[key][start:start+copy_size]
+
+    del merged
+
+    return n_merged
+
+# %% ../nbs/03_fasta.ipynb 107
+import tempfile
+
+#This function is a wrapper function and to be tested by the integration test
+def digest_fasta_block_to_chunk(to_process:tuple)->(int, dict, str):
+    """
+    Digest a fasta_block and write the spectra as chunk to disk for multiprocessing. See generate_database_streaming.
+    """
+    fasta_index, fasta_block, settings, chunk_path = to_process
+
+    to_add, pept_dict = digest_fasta_block_peptides(fasta_index, fasta_block, settings)
+
+    if len(to_add) > 0:
+        n_spectra = write_spectra_chunk(generate_spectra_flat(to_add, mass_dict), chunk_path)
+    else:
+        n_spectra = 0
+
+    return (n_spectra, pept_dict, chunk_path)
+
+def write_database_chunk(database_path:str, chunk_path:str, memory_budget:float = 4000):
+    """
+    Write the spectra of a database as chunk to disk so that it can be merged with new spectra. See write_spectra_chunk.
+    The spectra of the database need to be sorted by precursor mass and sequence as written by merge_spectra_chunks.
+    Args:
+        database_path (str): Path to database.
+        chunk_path (str): directory to store the arrays of the chunk as *.npy files.
+        memory_budget (float): memory budget for copying the sequences in MB.
+    """
+    os.makedirs(chunk_path, exist_ok=True)
+
+    db_data = MappedDatabase(database_path)
+    for key in ['precursors', 'indices', 'fragmasses', 'fragtypes']:
+        np.save(os.path.join(chunk_path, f'{key}.npy'), db_data[key])
+    del db_data
+
+    with h5py.File(database_path, 'r') as hdf_file:
+        seqs = hdf_file['seqs']
+        block_size = max(1, int(memory_budget * 1024**2 / 100))
+
+        max_len = 1
+        for start in range(0, len(seqs), block_size):
+            max_len = max([max_len] + [len(_) for _ in seqs[start:start+block_size]])
+
+        chunk_seqs = np.lib.format.open_memmap(os.path.join(chunk_path, 'seqs.npy'), mode='w+', dtype=f'S{max_len}', shape=seqs.shape)
+        for start in range(0, len(seqs), block_size):
+            chunk_seqs[start:start+block_size] = seqs[start:start+block_size]
+        chunk_seqs.flush()
+        del chunk_seqs
+
+#This function is a wrapper function and to be tested by the integration test
+def generate_database_streaming(settings:dict, database_path:str, callback = None, fragment_index:bool = False, base_database_path:str = None)->(int, dict):
+    """
+    Function to generate and save a database from a fasta file in parallel without keeping all spectra in memory.
+    Workers write sorted chunks of spectra to disk that are merged into the database. See merge_spectra_chunks.
+    Args:
+        settings: alphapept settings.
+        database_path (str): Path to database.
+        callback (function, optional): callback function. (Default: None)
+        fragment_index (bool): Additionally save a fragment index. See build_fragment_index().
+        base_database_path (str, optional): Path to a database generated with this function that is extended by the FASTA files in settings. (Default: None)
+    Returns:
+        int: number of theoretical spectra.
+        dict: fasta_dict. See generate_fasta_list()
+    """
+    n_processes = alphapept.performance.set_worker_count(
+        worker_count=settings['general']['n_processes'],
+        set_global=False
+    )
+
+    fasta_list, fasta_dict = generate_fasta_list(fasta_paths = settings['experiment']['fasta_paths'], **settings['fasta'])
+
+    logging.info(f'FASTA contains {len(fasta_list):,} entries.')
+
+    proteins = pd.DataFrame(fasta_dict).T
+    memory_budget = settings['fasta'].get('db_memory_budget', 4000)
+
+    #New entries are indexed after the entries of the base database
+    fasta_offset = 0
+    if base_database_path is not None:
+        base_file = alphapept.io.HDF_File(base_database_path)
+        base_proteins = base_file.read(dataset_name="proteins")
+        fasta_offset = len(base_proteins)
+        proteins = pd.concat([base_proteins, proteins], ignore_index=True)
+        fasta_dict = collections.OrderedDict(proteins.T)
+        logging.info(f'Extending database {base_database_path} with {fasta_offset:,} entries.')
+
+    blocks = block_idx(len(fasta_list), settings['fasta']['fasta_block'])
+
+    db_file = alphapept.io.HDF_File(database_path, is_new_file=True)
+
+    with tempfile.TemporaryDirectory(dir=db_file.directory) as tmp_dir:
+        to_process = [(fasta_offset + idx_start, fasta_list[idx_start:idx_end], settings, os.path.join(tmp_dir, f'chunk_{i}')) for i, (idx_start, idx_end) in enumerate(blocks)]
+
+        chunk_paths = []
+        pept_dicts = []
+        with Pool(n_processes) as p:
+            max_ = len(to_process)
+            for i, _ in enumerate(p.imap_unordered(digest_fasta_block_to_chunk, to_process)):
+                if callback:
+                    callback((i+1)/max_)
+                if _[0] > 0:
+                    chunk_paths.append(_[2])
+                pept_dicts.append(_[1])
+
+        if base_database_path is not None:
+            chunk_paths.append(os.path.join(tmp_dir, 'chunk_base'))
+            write_database_chunk(base_database_path, chunk_paths[-1], memory_budget)
+            pept_dicts.insert(0, load_pept_dict(base_file))
+
+        logging.info(f'Merging {len(chunk_paths):,} chunks of spectra with a memory budget of {memory_budget:,} MB.')
+        n_spectra = merge_spectra_chunks(chunk_paths, database_path, tmp_dir, memory_budget)
+
+    pept_dict = merge_pept_dicts(pept_dicts)
+    del pept_dicts
+
+    db_file.write(proteins, dataset_name="proteins")
+
+    if fragment_index:
+        db_data = MappedDatabase(database_path)
+        index_indptr, index_db_idx, index_frags = build_fragment_index(db_data['fragmasses'], db_data['indices'])
+        del db_data
+        db_file.write(index_indptr, dataset_name="fragment_index_indptr")
+        db_file.write(index_db_idx, dataset_name="fragment_index_db_idx")
+        db_file.write(index_frags, dataset_name="fragment_index_fragmasses")
+        db_file.write(FRAGMENT_INDEX_BIN_WIDTH, dataset_name="fragment_index_indptr", attr_name="bin_width")
+
+    save_pept_dict(pept_dict, db_file)
+
+    return n_spectra, fasta_dict
+
+# %% ../nbs/03_fasta.ipynb 110
+import json
+import hashlib
+import shutil
+from .settings import hash_file
+from .__version__ import VERSION_NO
+
+DB_CACHE_SETTINGS = [
+    'mods_fixed',
+    'mods_fixed_terminal',
+    'mods_variable',
+    'mods_variable_terminal',
+    'mods_fixed_terminal_prot',
+    'mods_variable_terminal_prot',
+    'n_missed_cleavages',
+    'pep_length_min',
+    'pep_length_max',
+    'isoforms_max',
+    'n_modifications_max',
+    'pseudo_reverse',
+    'AL_swap',
+    'KR_swap',
+    'protease',
+]
+
+def get_database_settings_hash(fasta_settings:dict, fragment_index:bool = False)->str:
+    """
+    Hash the settings that change the content of a database.
+    Args:
+        fasta_settings (dict): fasta settings. See DB_CACHE_SETTINGS.
+        fragment_index (bool): Database contains a fragment index.
+    Returns:
+        str: the sha1 hash.
+    """
+    relevant = {key: fasta_settings[key] for key in DB_CACHE_SETTINGS}
+    relevant['fragment_index'] = fragment_index
+    relevant['version'] = VERSION_NO
+
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True).encode()).hexdigest()
+
+def find_cached_database(cache_path:str, settings_hash:str, fasta_hashes:list)->tuple:
+    """
+    Find the cached database that was built from the most of the FASTA files.
+    Args:
+        cache_path (str): directory of the database cache.
+        settings_hash (str): hash of the settings. See get_database_settings_hash.
+        fasta_hashes (list of str): hashes of the FASTA files.
+    Returns:
+        str: key of the cached database, None if there is no match.
+        int: number of FASTA files that the cached database was built from.
+    """
+    best_key, best_n = None, 0
+
+    for file in glob(os.path.join(cache_path, '*.json')):
+        key = os.path.splitext(os.path.basename(file))[0]
+        if not os.path.isfile(os.path.join(cache_path, f'{key}.hdf')):
+            continue
+        with open(file, 'r') as f:
+            entry = json.load(f)
+        n_fastas = len(entry['fasta_hashes'])
+        if (entry['settings_hash'] == settings_hash) and (entry['fasta_hashes'] == fasta_hashes[:n_fastas]) and (n_fastas > best_n):
+            best_key, best_n = key, n_fastas
+
+    return best_key, best_n
+
+def evict_database_cache(cache_path:str, cache_size:float, keep:str = None):
+    """
+    Remove the least recently used databases until the cache is smaller than cache_size.
+    Args:
+        cache_path (str): directory of the database cache.
+        cache_size (float): maximum size of the cache in GB.
+        keep (str, optional): key of a database that should not be removed. (Default: None)
+    """
+    entries = []
+    for file in glob(os.path.join(cache_path, '*.json')):
+        key = os.path.splitext(os.path.basename(file))[0]
+        db_path = os.path.join(cache_path, f'{key}.hdf')
+        size = os.stat(db_path).st_size if os.path.isfile(db_path) else 0
+        entries.append((os.stat(file).st_mtime, key, size))
+
+    total_size = sum([_[2] for _ in entries])
+
+    for last_used, key, size in sorted(entries):
+        if total_size <= cache_size * 1024**3:
+            break
+        if key == keep:
+            continue
+        logging.info(f'Removing database {key} from cache.')
+        for ext in ['.hdf', '.json']:
+            if os.path.isfile(os.path.join(cache_path, key + ext)):
+                os.remove(os.path.join(cache_path, key + ext))
+        total_size -= size
+
+def link_database(source:str, destination:str):
+    """
+    Hard link a database to a new path, copy if linking is not possible.
+    """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+#This function is a wrapper function and to be tested by the integration test
+def generate_database_cached(settings:dict, database_path:str, cache_path:str, callback = None, fragment_index:bool = False, cache_size:float = 50):
+    """
+    Provide a database at database_path from the database cache, extend or generate it if needed. See generate_database_streaming.
+    Args:
+        settings: alphapept settings.
+        database_path (str): Path to database.
+        cache_path (str): directory of the database cache.
+        callback (function, optional): callback function. (Default: None)
+        fragment_index (bool): Additionally save a fragment index. See build_fragment_index().
+        cache_size (float): maximum size of the cache in GB.
+    """
+    os.makedirs(cache_path, exist_ok=True)
+
+    fasta_paths = settings['experiment']['fasta_paths']
+    if type(fasta_paths) is str:
+        fasta_paths = [fasta_paths]
+
+    fasta_hashes = [hash_file(_)[1] for _ in fasta_paths]
+    settings_hash = get_database_settings_hash(settings['fasta'], fragment_index)
+    key = hashlib.sha1((settings_hash + ''.join(fasta_hashes)).encode()).hexdigest()
+
+    cached_path = os.path.join(cache_path, f'{key}.hdf')
+    entry_path = os.path.join(cache_path, f'{key}.json')
+
+    base_key, n_base = find_cached_database(cache_path, settings_hash, fasta_hashes)
+
+    if base_key == key:
+        logging.info(f'Found database {key} in cache.')
+    else:
+        settings_ = settings.copy()
+        settings_['experiment'] = settings['experiment'].copy()
+        settings_['experiment']['fasta_paths'] = fasta_paths[n_base:]
+
+        if base_key is None:
+            base_database_path = None
+        else:
+            base_database_path = os.path.join(cache_path, f'{base_key}.hdf')
+            logging.info(f'Found database {base_key} for the first {n_base} FASTA files in cache.')
+
+        tmp_path = os.path.join(cache_path, f'{key}_{os.getpid()}.hdf.tmp')
+        n_spectra, fasta_dict = generate_database_streaming(settings_, tmp_path, callback=callback, fragment_index=fragment_index, base_database_path=base_database_path)
+        os.replace(tmp_path, cached_path)
+        logging.info(f'Digested {len(fasta_dict):,} proteins and generated {n_spectra:,} spectra')
+
+        with open(entry_path, 'w') as f:
+            json.dump({'settings_hash': settings_hash, 'fasta_hashes': fasta_hashes, 'fasta_paths': fasta_paths}, f)
+
+    #Mark as recently used
+    os.utime(entry_path)
+
+    link_database(cached_path, database_path)
+    evict_database_cache(cache_path, cache_size, keep=key)
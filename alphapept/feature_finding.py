@@ -1900,116 +1900,117 @@ def find_features(to_process:tuple, callback:Union[Callable, None] = None, paral
 
         if not skip:
             ms_file = alphapept.io.MS_Data_File(out_file, is_read_only=False)
-            query_data = ms_file.read_DDA_query_data()
+            with ms_file.session(mode='a'):
+                query_data = ms_file.read_DDA_query_data()
             
-            feature_cluster_mapping = pd.DataFrame()
+                feature_cluster_mapping = pd.DataFrame()
 
-            if not settings['workflow']["find_features"]:
-                features = query_data_to_features(query_data)
-            else:
-                if datatype in ['thermo','mzml','sciex']:
+                if not settings['workflow']["find_features"]:
+                    features = query_data_to_features(query_data)
+                else:
+                    if datatype in ['thermo','mzml','sciex']:
 
-                    from alphapept.constants import averagine_aa, isotopes
+                        from alphapept.constants import averagine_aa, isotopes
 
-                    f_settings = settings['features']
-                    max_gap = f_settings['max_gap']
-                    centroid_tol = f_settings['centroid_tol']
-                    hill_split_level = f_settings['hill_split_level']
-                    iso_split_level = f_settings['iso_split_level']
+                        f_settings = settings['features']
+                        max_gap = f_settings['max_gap']
+                        centroid_tol = f_settings['centroid_tol']
+                        hill_split_level = f_settings['hill_split_level']
+                        iso_split_level = f_settings['iso_split_level']
                     
                     
-                    #Cleanup if 
+                        #Cleanup if 
                     
-                    int_data = np.array(query_data['int_list_ms1'])
+                        int_data = np.array(query_data['int_list_ms1'])
 
 
-                    window = f_settings['hill_smoothing']
-                    hill_check_large = f_settings['hill_check_large']
+                        window = f_settings['hill_smoothing']
+                        hill_check_large = f_settings['hill_check_large']
 
-                    iso_charge_min = f_settings['iso_charge_min']
-                    iso_charge_max = f_settings['iso_charge_max']
-                    iso_n_seeds = f_settings['iso_n_seeds']
+                        iso_charge_min = f_settings['iso_charge_min']
+                        iso_charge_max = f_settings['iso_charge_max']
+                        iso_n_seeds = f_settings['iso_n_seeds']
 
-                    hill_nboot_max = f_settings['hill_nboot_max']
-                    hill_nboot = f_settings['hill_nboot']
+                        hill_nboot_max = f_settings['hill_nboot_max']
+                        hill_nboot = f_settings['hill_nboot']
 
-                    iso_mass_range = f_settings['iso_mass_range']
+                        iso_mass_range = f_settings['iso_mass_range']
 
-                    iso_corr_min = f_settings['iso_corr_min']
+                        iso_corr_min = f_settings['iso_corr_min']
 
-                    logging.info('Feature finding on {}'.format(file_name))
+                        logging.info('Feature finding on {}'.format(file_name))
 
-                    logging.info(f'Hill extraction with centroid_tol {centroid_tol} and max_gap {max_gap}')
+                        logging.info(f'Hill extraction with centroid_tol {centroid_tol} and max_gap {max_gap}')
 
-                    hill_ptrs, hill_data, path_node_cnt, score_median, score_std = extract_hills(query_data, max_gap, centroid_tol)
-                    logging.info(f'Number of hills {len(hill_ptrs):,}, len = {np.mean(path_node_cnt):.2f}')
+                        hill_ptrs, hill_data, path_node_cnt, score_median, score_std = extract_hills(query_data, max_gap, centroid_tol)
+                        logging.info(f'Number of hills {len(hill_ptrs):,}, len = {np.mean(path_node_cnt):.2f}')
 
-                    logging.info(f'Repeating hill extraction with centroid_tol {score_median+score_std*3:.2f}')
+                        logging.info(f'Repeating hill extraction with centroid_tol {score_median+score_std*3:.2f}')
 
-                    hill_ptrs, hill_data, path_node_cnt, score_median, score_std = extract_hills(query_data, max_gap, score_median+score_std*3)
-                    logging.info(f'Number of hills {len(hill_ptrs):,}, len = {np.mean(path_node_cnt):.2f}')
+                        hill_ptrs, hill_data, path_node_cnt, score_median, score_std = extract_hills(query_data, max_gap, score_median+score_std*3)
+                        logging.info(f'Number of hills {len(hill_ptrs):,}, len = {np.mean(path_node_cnt):.2f}')
 
-                    hill_ptrs, hill_data = remove_duplicate_hills(hill_ptrs, hill_data, path_node_cnt)
-                    logging.info(f'After duplicate removal of hills {len(hill_ptrs):,}')
+                        hill_ptrs, hill_data = remove_duplicate_hills(hill_ptrs, hill_data, path_node_cnt)
+                        logging.info(f'After duplicate removal of hills {len(hill_ptrs):,}')
                     
-                    hill_ptrs = split_hills(hill_ptrs, hill_data, int_data, hill_split_level=hill_split_level, window = window) #hill lenght is inthere already
-                    logging.info(f'After split hill_ptrs {len(hill_ptrs):,}')
+                        hill_ptrs = split_hills(hill_ptrs, hill_data, int_data, hill_split_level=hill_split_level, window = window) #hill lenght is inthere already
+                        logging.info(f'After split hill_ptrs {len(hill_ptrs):,}')
 
-                    hill_data, hill_ptrs = filter_hills(hill_data, hill_ptrs, int_data, hill_check_large = hill_check_large, window=window)
+                        hill_data, hill_ptrs = filter_hills(hill_data, hill_ptrs, int_data, hill_check_large = hill_check_large, window=window)
 
-                    logging.info(f'After filter hill_ptrs {len(hill_ptrs):,}')
+                        logging.info(f'After filter hill_ptrs {len(hill_ptrs):,}')
 
-                    stats, sortindex_, idxs_upper, scan_idx, hill_data, hill_ptrs = get_hill_data(query_data, hill_ptrs, hill_data, hill_nboot_max = hill_nboot_max, hill_nboot = hill_nboot)
-                    logging.info('Extracting hill stats complete')
+                        stats, sortindex_, idxs_upper, scan_idx, hill_data, hill_ptrs = get_hill_data(query_data, hill_ptrs, hill_data, hill_nboot_max = hill_nboot_max, hill_nboot = hill_nboot)
+                        logging.info('Extracting hill stats complete')
 
-                    pre_isotope_patterns = get_pre_isotope_patterns(stats, idxs_upper, sortindex_, hill_ptrs, hill_data, int_data, scan_idx, maximum_offset, iso_charge_min=iso_charge_min, iso_charge_max=iso_charge_max, iso_mass_range=iso_mass_range, cc_cutoff=iso_corr_min)
-                    logging.info('Found {:,} pre isotope patterns.'.format(len(pre_isotope_patterns)))
+                        pre_isotope_patterns = get_pre_isotope_patterns(stats, idxs_upper, sortindex_, hill_ptrs, hill_data, int_data, scan_idx, maximum_offset, iso_charge_min=iso_charge_min, iso_charge_max=iso_charge_max, iso_mass_range=iso_mass_range, cc_cutoff=iso_corr_min)
+                        logging.info('Found {:,} pre isotope patterns.'.format(len(pre_isotope_patterns)))
 
-                    isotope_patterns, iso_idx, isotope_charges = get_isotope_patterns(pre_isotope_patterns, hill_ptrs, hill_data, int_data, scan_idx, stats, sortindex_, averagine_aa, isotopes, iso_charge_min = iso_charge_min, iso_charge_max = iso_charge_max, iso_mass_range = iso_mass_range, iso_n_seeds = iso_n_seeds, cc_cutoff = iso_corr_min, iso_split_level=iso_split_level, callback=None)
-                    logging.info('Extracted {:,} isotope patterns.'.format(len(isotope_charges)))
+                        isotope_patterns, iso_idx, isotope_charges = get_isotope_patterns(pre_isotope_patterns, hill_ptrs, hill_data, int_data, scan_idx, stats, sortindex_, averagine_aa, isotopes, iso_charge_min = iso_charge_min, iso_charge_max = iso_charge_max, iso_mass_range = iso_mass_range, iso_n_seeds = iso_n_seeds, cc_cutoff = iso_corr_min, iso_split_level=iso_split_level, callback=None)
+                        logging.info('Extracted {:,} isotope patterns.'.format(len(isotope_charges)))
 
-                    feature_table, lookup_idx = feature_finder_report(query_data, isotope_patterns, isotope_charges, iso_idx, stats, sortindex_, hill_ptrs, hill_data)
+                        feature_table, lookup_idx = feature_finder_report(query_data, isotope_patterns, isotope_charges, iso_idx, stats, sortindex_, hill_ptrs, hill_data)
                     
-                    lookup_idx_df = pd.DataFrame(lookup_idx, columns = ['isotope_pattern', 'isotope_pattern_hill'])
-                    ms_file.write(lookup_idx_df, dataset_name="feature_table_idx")
+                        lookup_idx_df = pd.DataFrame(lookup_idx, columns = ['isotope_pattern', 'isotope_pattern_hill'])
+                        ms_file.write(lookup_idx_df, dataset_name="feature_table_idx")
                     
-                    feature_cluster_mapping = get_stats(isotope_patterns, iso_idx, stats)
+                        feature_cluster_mapping = get_stats(isotope_patterns, iso_idx, stats)
                     
                     
-                    logging.info('Report complete.')
+                        logging.info('Report complete.')
 
-                elif datatype == 'bruker':
-                    logging.info('Feature finding on {}'.format(file_name))
-                    feature_path = extract_bruker(file_name)
-                    feature_table, feature_cluster_mapping = convert_bruker(feature_path)
+                    elif datatype == 'bruker':
+                        logging.info('Feature finding on {}'.format(file_name))
+                        feature_path = extract_bruker(file_name)
+                        feature_table, feature_cluster_mapping = convert_bruker(feature_path)
                     
-                    logging.info('Bruker featurer finder complete. Extracted {:,} features.'.format(len(feature_table)))
+                        logging.info('Bruker featurer finder complete. Extracted {:,} features.'.format(len(feature_table)))
 
-                # Calculate additional params
-                feature_table['rt_length'] = feature_table['rt_end'] - feature_table['rt_start']
-                feature_table['rt_right'] = feature_table['rt_end'] - feature_table['rt_apex']
-                feature_table['rt_left'] = feature_table['rt_apex'] - feature_table['rt_start']
-                feature_table['rt_tail'] = feature_table['rt_right'] / feature_table['rt_left']
+                    # Calculate additional params
+                    feature_table['rt_length'] = feature_table['rt_end'] - feature_table['rt_start']
+                    feature_table['rt_right'] = feature_table['rt_end'] - feature_table['rt_apex']
+                    feature_table['rt_left'] = feature_table['rt_apex'] - feature_table['rt_start']
+                    feature_table['rt_tail'] = feature_table['rt_right'] / feature_table['rt_left']
 
-                logging.info('Matching features to query data.')
+                    logging.info('Matching features to query data.')
                 
-                if 'mono_mzs2' not in query_data.keys():
-                    logging.info('No MS2-data to match.')
-                    features = pd.DataFrame()
-                else:
-                    features = map_ms2(feature_table, query_data, **settings['features'])
+                    if 'mono_mzs2' not in query_data.keys():
+                        logging.info('No MS2-data to match.')
+                        features = pd.DataFrame()
+                    else:
+                        features = map_ms2(feature_table, query_data, **settings['features'])
                     
-                ms_file.write(feature_cluster_mapping, dataset_name="feature_cluster_mapping")
+                    ms_file.write(feature_cluster_mapping, dataset_name="feature_cluster_mapping")
                     
-                logging.info('Saving feature table.')
-                ms_file.write(feature_table, dataset_name="feature_table")
+                    logging.info('Saving feature table.')
+                    ms_file.write(feature_table, dataset_name="feature_table")
                 
-                logging.info('Feature table saved to {}'.format(out_file))
+                    logging.info('Feature table saved to {}'.format(out_file))
 
 
-            logging.info('Saving features.')
-            ms_file.write(features, dataset_name="features")
-            logging.info(f'Feature finding of file {file_name} complete.')
+                logging.info('Saving features.')
+                ms_file.write(features, dataset_name="features")
+                logging.info(f'Feature finding of file {file_name} complete.')
         return True
     except Exception as e:
         logging.error(f'Feature finding of file {file_name} failed. Exception {e}')
@@ -4,6 +4,7 @@ from alphapept.paths import PROCESSED_PATH
 from alphapept.settings import load_settings
 from alphapept.fasta import read_database
 from alphapept.display import calculate_sequence_coverage
+from alphapept.score import get_fragment_ion_indices
 import os
 import alphapept.io
 import pandas as pd
@@ -87,10 +88,19 @@ def ion_plot(ms_file: MS_Data_File, options: list):
         ms_file (MS_Data_File): Ms data file to be read.
         options (list): List of plot options.
     """
-    if "ions" in options:
+    if ("fragment_ions" in options) and ("peptide_fdr" in options):
         if st.button("Ion calibration"):
             with st.spinner("Creating plot."):
-                ions = ms_file.read(dataset_name="ions")
+                psms = ms_file.read(
+                    dataset_name="peptide_fdr",
+                    columns=["fragment_ion_idx", "n_fragments_matched"],
+                )
+                # Only read the ion hits of the PSMs, they are stored as consecutive slices
+                indptr, indices = get_fragment_ion_indices(psms)
+                ions = ms_file.read(
+                    dataset_name="fragment_ions",
+                    columns=["db_mass", "fragment_ion_mass"],
+                ).iloc[indices]
                 delta_ppm = (
                     (ions["db_mass"] - ions["fragment_ion_mass"])
                     / ((ions["db_mass"] + ions["fragment_ion_mass"]) / 2)
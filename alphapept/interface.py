@@ -1,13 +1,15 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/11_interface.ipynb.
 
 # %% auto 0
-__all__ = ['HEADLESS', 'CONTEXT_SETTINGS', 'CLICK_SETTINGS_OPTION', 'tqdm_wrapper', 'check_version_and_hardware',
-           'wrapped_partial', 'create_database', 'import_raw_data', 'feature_finding', 'search_data',
-           'recalibrate_data', 'score', 'isobaric_labeling', 'protein_grouping', 'align', 'match',
-           'read_label_intensity', 'quantification', 'export', 'run_complete_workflow', 'extract_median_unique',
-           'get_file_summary', 'get_summary', 'parallel_execute', 'bcolors', 'is_port_in_use', 'run_cli',
-           'cli_overview', 'cli_database', 'cli_import', 'cli_feature_finding', 'cli_search', 'cli_recalibrate',
-           'cli_score', 'cli_align', 'cli_match', 'cli_quantify', 'cli_export', 'cli_workflow', 'cli_gui']
+__all__ = ['HEADLESS', 'MEMORY_LIMITS', 'MEMORY_SAFETY_FACTOR', 'MEMORY_MODEL_SIZE', 'VENDORS', 'CONTEXT_SETTINGS',
+           'CLICK_SETTINGS_OPTION', 'tqdm_wrapper', 'check_version_and_hardware', 'wrapped_partial', 'create_database',
+           'import_raw_data', 'feature_finding', 'search_data', 'recalibrate_data', 'score', 'isobaric_labeling',
+           'protein_grouping', 'align', 'match', 'read_label_intensity', 'quantification', 'export',
+           'run_complete_workflow', 'extract_median_unique', 'get_file_summary', 'get_summary', 'get_file_size',
+           'load_memory_model', 'save_memory_model', 'estimate_task_memory', 'memory_aware_imap', 'parallel_execute',
+           'get_file_stages', 'pipeline_execute', 'bcolors', 'is_port_in_use', 'run_cli', 'cli_overview',
+           'cli_database', 'cli_import', 'cli_feature_finding', 'cli_search', 'cli_recalibrate', 'cli_score',
+           'cli_align', 'cli_match', 'cli_quantify', 'cli_export', 'cli_workflow', 'cli_gui']
 
 # %% ../nbs/11_interface.ipynb 4
 import alphapept.utils
@@ -176,28 +178,33 @@ def create_database(
         else:
             cb = callback
 
-        (
-            spectra,
-            pept_dict,
-            fasta_dict
-        ) = alphapept.fasta.generate_database_parallel(
-            temp_settings,
-            callback=cb
-        )
-        logging.info(
-            'Digested {:,} proteins and generated {:,} spectra'.format(
-                len(fasta_dict),
-                len(spectra)
-            )
-        )
+        if settings['fasta'].get('db_cache', False):
+            from alphapept.paths import DATABASE_CACHE_PATH
 
-        alphapept.fasta.save_database(
-            spectra,
-            pept_dict,
-            fasta_dict,
-            database_path = database_path,
-            **settings['fasta']
-        )
+            alphapept.fasta.generate_database_cached(
+                temp_settings,
+                database_path,
+                DATABASE_CACHE_PATH,
+                callback=cb,
+                fragment_index = settings['search'].get('fragment_index', False),
+                cache_size = settings['fasta'].get('db_cache_size', 50)
+            )
+        else:
+            (
+                n_spectra,
+                fasta_dict
+            ) = alphapept.fasta.generate_database_streaming(
+                temp_settings,
+                database_path,
+                callback=cb,
+                fragment_index = settings['search'].get('fragment_index', False)
+            )
+            logging.info(
+                'Digested {:,} proteins and generated {:,} spectra'.format(
+                    len(fasta_dict),
+                    n_spectra
+                )
+            )
         logging.info(
             'Database saved to {}. Filesize of database is {:.2f} GB'.format(
                 database_path,
@@ -479,6 +486,9 @@ def score(
         fasta_dict = db_data['fasta_dict'].item()
         pept_dict = db_data['pept_dict'].item()
 
+    if (settings['score']['method'] == 'random_forest') and (settings['score'].get('ml_model', 'file') == 'experiment'):
+        alphapept.score.train_experiment_RF(settings)
+
     settings = parallel_execute(settings, alphapept.score.score_hdf, callback = cb)
 
     return settings
@@ -878,6 +888,9 @@ def run_complete_workflow(
 ) -> dict:
     """Run all AlphaPept steps from a settings dict.
 
+    Consecutive per-file steps (import, feature finding, search, recalibration and scoring) are pipelined per file with pipeline_execute
+    when multiple files are processed in parallel. Steps across files (alignment, matching, protein grouping and quantification) wait for all files.
+
     Args:
         settings (dict): A dictionary with settings how to process the data.
         progress (bool): Track progress. Defaults to False.
@@ -963,6 +976,9 @@ def run_complete_workflow(
 
     first_search = True
 
+    file_steps = [import_raw_data, feature_finding, search_data, recalibrate_data, score]
+    n_pipelined = 0
+
     time_dict = {}
 
     run_start = time()
@@ -984,49 +1000,97 @@ def run_complete_workflow(
                         settings['fasta'][_].append(mod)                   
             
     for idx, step in enumerate(steps):
-        logging.info(f'==== {step.__name__} ====')
-        if callback_task:
-            callback_task(step.__name__)
+        if idx < n_pipelined:
+            continue
+
+        n_file_steps = 0
+        while (idx + n_file_steps < n_steps) and (steps[idx + n_file_steps] in file_steps):
+            n_file_steps += 1
+
+        # The experiment-level ML model needs the search results of all files before scoring
+        if (score in steps[idx + 1:idx + n_file_steps]) and (settings['score']['method'] == 'random_forest') and (settings['score'].get('ml_model', 'file') == 'experiment'):
+            n_file_steps = steps.index(score) - idx
+
+        pipeline = settings['workflow'].get('pipeline_files', True) and (n_file_steps > 1) and (N_FILES > 1)
+        pipeline &= alphapept.performance.set_worker_count(worker_count=settings['general']['n_processes'], set_global=False) > 1
+        if search_data in steps[idx:idx + n_file_steps]:
+            pipeline &= settings['experiment']['database_path'] is not None
+
+        if pipeline:
+            n_pipelined = idx + n_file_steps
+            pipelined_steps = steps[idx:n_pipelined]
+            step_names = [_.__name__ for _ in pipelined_steps]
+            logging.info(f'==== {" > ".join(step_names)} ====')
+            if callback_task:
+                callback_task(" > ".join(step_names))
+
+            start = time()
+
+            if callback_overall:
+                progress_wrapper(idx, n_steps, 0)
+                # The pipelined steps span n_file_steps steps of the overall progress
+                cb = functools.partial(progress_wrapper, idx/n_file_steps, n_steps/n_file_steps)
+            else:
+                cb = callback
 
-        start = time()
+            stages = get_file_stages(settings, pipelined_steps, first_search=first_search)
+            settings = pipeline_execute(settings, stages, callback=cb)
 
-        if callback_overall:
-            progress_wrapper(idx, n_steps, 0)
-            cb = functools.partial(progress_wrapper, idx, n_steps)
-        elif callback:
-            cb = callback
-        else:
-            cb = None
+            if recalibrate_data in pipelined_steps:
+                first_search = False
 
-        if step is search_data:
-            settings, pept_dict, fasta_dict = step(settings, first_search=first_search, logger_set = True, settings_parsed = True, callback = cb)
+            if callback_overall:
+                progress_wrapper(n_pipelined - 1, n_steps, 1)
 
-        elif (step is score) or (step is protein_grouping):
+            end = time()
 
-            settings = step(settings, pept_dict=pept_dict, fasta_dict=fasta_dict, logger_set = True,  settings_parsed = True, callback = cb)
+            time_dict[f"{' > '.join(step_names)} (min)"] = (end-start)/60 #minutes
+            time_dict['total (min)'] = (end-run_start)/60
 
         else:
-            if step is export:
-                # Get summary information
-                summary = get_summary(settings, summary)
-                settings['summary'] = summary
+            logging.info(f'==== {step.__name__} ====')
+            if callback_task:
+                callback_task(step.__name__)
 
-            settings = step(settings, logger_set = True,  settings_parsed = True, callback = cb)
+            start = time()
 
-        if step is recalibrate_data:
-            first_search = False
+            if callback_overall:
+                progress_wrapper(idx, n_steps, 0)
+                cb = functools.partial(progress_wrapper, idx, n_steps)
+            elif callback:
+                cb = callback
+            else:
+                cb = None
 
-        if callback_overall:
-            progress_wrapper(idx, n_steps, 1)
+            if step is search_data:
+                settings, pept_dict, fasta_dict = step(settings, first_search=first_search, logger_set = True, settings_parsed = True, callback = cb)
 
-        end = time()
+            elif (step is score) or (step is protein_grouping):
 
-        if f"{step.__name__} (min)" in time_dict:
-            time_dict[f"{step.__name__}_2 (min)"] = (end-start)/60 #minutes
-        else:
-            time_dict[f"{step.__name__} (min)"] = (end-start)/60 #minutes
+                settings = step(settings, pept_dict=pept_dict, fasta_dict=fasta_dict, logger_set = True,  settings_parsed = True, callback = cb)
+
+            else:
+                if step is export:
+                    # Get summary information
+                    summary = get_summary(settings, summary)
+                    settings['summary'] = summary
+
+                settings = step(settings, logger_set = True,  settings_parsed = True, callback = cb)
+
+            if step is recalibrate_data:
+                first_search = False
+
+            if callback_overall:
+                progress_wrapper(idx, n_steps, 1)
+
+            end = time()
+
+            if f"{step.__name__} (min)" in time_dict:
+                time_dict[f"{step.__name__}_2 (min)"] = (end-start)/60 #minutes
+            else:
+                time_dict[f"{step.__name__} (min)"] = (end-start)/60 #minutes
 
-        time_dict['total (min)'] = (end-run_start)/60
+            time_dict['total (min)'] = (end-run_start)/60
 
         summary['timing'] = time_dict
         summary['version'] = VERSION_NO
@@ -1181,6 +1245,220 @@ import logging
 import sys
 import numpy as np
 import psutil
+import json
+import multiprocessing
+
+# Default peak memory per file in GB, used as long as no peak memory has been recorded for a step and vendor
+MEMORY_LIMITS = {
+    'find_features': {'thermo': 8, 'mzml': 8, 'sciex': 8, 'bruker': 25},
+    'raw_conversion': {'bruker': 8, 'sciex': 30},
+    'search_db': {'thermo': 8, 'mzml': 8, 'sciex': 8, 'bruker': 8},
+}
+MEMORY_SAFETY_FACTOR = 1.2
+MEMORY_MODEL_SIZE = 100
+
+VENDORS = {'.raw': 'thermo', '.d': 'bruker', '.mzml': 'mzml', '.wiff': 'sciex'}
+
+
+def get_file_size(file_name: str) -> float:
+    """Get the size of a raw file or raw folder in GB.
+
+    Args:
+        file_name (str): The path of the raw file or folder.
+
+    Returns:
+        float: The size in GB, 0 if the file does not exist.
+    """
+    if os.path.isdir(file_name):
+        size = 0
+        for dirpath, dirnames, filenames in os.walk(file_name):
+            for _ in filenames:
+                size += os.path.getsize(os.path.join(dirpath, _))
+    elif os.path.isfile(file_name):
+        size = os.path.getsize(file_name)
+    else:
+        size = 0
+
+    return size / 1024**3
+
+
+def load_memory_model(path: str = None) -> dict:
+    """Load the recorded peak memory of previous tasks.
+
+    Args:
+        path (str): The path of the json file with the memory model. Defaults to None, i.e. MEMORY_MODEL_PATH.
+
+    Returns:
+        dict: A dictionary with a list of (file size, peak memory) in GB for each step and vendor.
+    """
+    if path is None:
+        from alphapept.paths import MEMORY_MODEL_PATH
+        path = MEMORY_MODEL_PATH
+
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_memory_model(memory_model: dict, path: str = None):
+    """Save the recorded peak memory of tasks. Only the last MEMORY_MODEL_SIZE records are kept per step and vendor.
+
+    Args:
+        memory_model (dict): A dictionary with a list of (file size, peak memory) in GB for each step and vendor.
+        path (str): The path of the json file with the memory model. Defaults to None, i.e. MEMORY_MODEL_PATH.
+    """
+    if path is None:
+        from alphapept.paths import MEMORY_MODEL_PATH
+        path = MEMORY_MODEL_PATH
+
+    memory_model = {key: records[-MEMORY_MODEL_SIZE:] for key, records in memory_model.items()}
+    try:
+        with open(path, 'w') as file:
+            json.dump(memory_model, file)
+    except OSError as e:
+        logging.info(f'Could not save memory model to {path}. Exception {e}')
+
+
+def estimate_task_memory(step_name: str, file_name: str, memory_model: dict) -> float:
+    """Estimate the peak memory of a task from the file size and vendor.
+
+    If peak memory has been recorded for the step and vendor, the memory is modeled as the smallest recorded peak
+    plus the largest recorded increase per GB of raw data. Otherwise, the default from MEMORY_LIMITS is used.
+
+    Args:
+        step_name (str): The name of the step.
+        file_name (str): The path of the raw file.
+        memory_model (dict): A dictionary with a list of (file size, peak memory) in GB for each step and vendor.
+
+    Returns:
+        float: The estimated peak memory in GB.
+    """
+    base, ext = os.path.splitext(file_name)
+    vendor = VENDORS.get(ext.lower(), ext.lower())
+    records = memory_model.get(f'{step_name}/{vendor}', [])
+
+    if len(records) > 0:
+        size = get_file_size(file_name)
+        intercept = min(peak for _, peak in records)
+        slope = max(max((peak - intercept) / _, 0) if _ > 0 else 0 for _, peak in records)
+
+        return (intercept + slope * size) * MEMORY_SAFETY_FACTOR
+    else:
+        return MEMORY_LIMITS.get(step_name, {}).get(vendor, 0)
+
+
+def _execute_task(step: callable, to_process: tuple, task_idx: int, started: dict, cancelled: dict):
+    """Register the process of a task and execute it, unless the task was cancelled because it did not start in time."""
+    started[task_idx] = os.getpid()
+    if task_idx in cancelled:
+        return 'Task was not started in time.'
+    return step(to_process)
+
+
+def _get_rss(pid: int) -> float:
+    """Get the resident memory of a process in GB, 0 if it does not exist."""
+    try:
+        return psutil.Process(pid).memory_info().rss / 1024**3
+    except psutil.Error:
+        return 0
+
+
+def memory_aware_imap(
+    step: callable,
+    to_process: list,
+    memory_estimates: list,
+    n_processes: int,
+    poll_interval: float = 0.5,
+    start_timeout: float = 60,
+):
+    """Execute tasks in a process pool and only admit tasks while their projected memory fits in the available memory.
+
+    The memory of running tasks is the larger of their estimate and the resident memory of their worker.
+    Tasks that do not fit are queued and a task that exceeds the available memory on its own is only started when no other task is running.
+    The peak resident memory of each task is monitored. Each task runs in a new worker, so that memory of previous tasks is not attributed to it.
+    Tasks whose worker is terminated or that do not start within start_timeout, e.g. because their worker died before the task was registered, are returned as failed.
+    Tasks that are appended to to_process and memory_estimates while iterating are scheduled as well.
+
+    Args:
+        step (callable): A function that accepts a single element of to_process.
+        to_process (list): The tasks to process.
+        memory_estimates (list): The estimated peak memory of each task in GB.
+        n_processes (int): The maximum number of processes.
+        poll_interval (float): Seconds between two checks of the memory and the running tasks. Defaults to 0.5.
+        start_timeout (float): Seconds after which a submitted task that has not started is considered lost. Defaults to 60.
+
+    Yields:
+        tuple: (task index, the result of step or an error message, the peak memory of the task in GB)
+    """
+    n_workers = max(min(n_processes, 50, psutil.cpu_count()), 1)
+    pending = []
+    running = {}
+    submitted = {}
+    peaks = {}
+    n_submitted = 0
+
+    with multiprocessing.Manager() as manager:
+        started = manager.dict()
+        cancelled = manager.dict()
+        with alphapept.performance.AlphaPool(n_processes, maxtasksperchild=1) as p:
+            while True:
+                pending.extend(range(n_submitted, len(to_process)))
+                n_submitted = len(to_process)
+                if not (pending or running):
+                    break
+
+                rss = {}
+                for task_idx in running:
+                    if task_idx in started:
+                        rss[task_idx] = _get_rss(started[task_idx])
+                        peaks[task_idx] = max(peaks.get(task_idx, 0), rss[task_idx])
+                memory_available = psutil.virtual_memory().available / 1024**3
+                committed = sum(max(memory_estimates[_] - rss.get(_, 0), 0) for _ in running)
+
+                while pending and (len(running) < n_workers):
+                    fits = [_ for _ in pending if memory_estimates[_] <= memory_available - committed]
+                    if fits:
+                        task_idx = fits[0]
+                    elif not running:
+                        task_idx = pending[0]
+                        logging.info(f'Task {task_idx} with an estimated memory of {memory_estimates[task_idx]:.2f} GB exceeds the available memory of {memory_available:.2f} GB. Running it alone.')
+                    else:
+                        break
+                    pending.remove(task_idx)
+                    running[task_idx] = p.apply_async(_execute_task, (step, to_process[task_idx], task_idx, started, cancelled))
+                    submitted[task_idx] = time()
+                    committed += memory_estimates[task_idx]
+
+                for task_idx, result in list(running.items()):
+                    if task_idx in started:
+                        if not psutil.pid_exists(started[task_idx]):
+                            # Workers exit after their task, so give the pool time to return the result
+                            result.wait(poll_interval)
+                            if not result.ready():
+                                # The pool does not return results of workers that were killed, e.g. when running out of memory
+                                del running[task_idx]
+                                yield task_idx, 'Worker process was terminated.', peaks.get(task_idx, 0)
+                                continue
+                    elif time() - submitted[task_idx] > start_timeout:
+                        cancelled[task_idx] = True
+                        if task_idx not in started:
+                            # The pool does not return results of workers that died before the task was registered
+                            del running[task_idx]
+                            yield task_idx, 'Task was not started in time.', peaks.get(task_idx, 0)
+                            continue
+
+                    if result.ready():
+                        del running[task_idx]
+                        try:
+                            success = result.get()
+                        except Exception as e:
+                            success = f"{e}"
+                        yield task_idx, success, peaks.get(task_idx, 0)
+
+                if running:
+                    sleep(poll_interval)
 
 
 def parallel_execute(
@@ -1190,6 +1468,9 @@ def parallel_execute(
 ) -> dict:
     """Generic function to execute worklow steps in parallel on a per-file basis.
 
+    Tasks are only started while their estimated peak memory fits in the available memory, see memory_aware_imap.
+    The peak memory of each task is recorded to improve the estimates of future tasks.
+
     Args:
         settings (dict): The settings for processing the step function.
         step (callable): A function that accepts settings as input parameter.
@@ -1198,25 +1479,12 @@ def parallel_execute(
     Returns:
         dict: The settings after processing.
 
-    Raises:
-        NotImplementedError: When the step is feature finding on files other then Thermo or Bruker.
-
     """
     n_processes = alphapept.performance.set_worker_count(
         worker_count=settings['general']['n_processes'],
         set_global=False
     )
 
-    if False: #TODO Make the loop below more elegant with a dict 
-        MEMORY_LIMITS = {}
-        MEMORY_LIMITS['find_features'] = {}
-        MEMORY_LIMITS['find_features']['thermo'] = 8
-        MEMORY_LIMITS['find_features']['bruker'] = 25
-        MEMORY_LIMITS['raw_conversion']['bruker'] = 8
-        MEMORY_LIMITS['raw_conversion']['sciex'] = 30
-        MEMORY_LIMITS['search_db'] = 8
-    
-
     files = settings['experiment']['file_paths']
     n_files = len(files)
     logging.info(f'Processing {len(files)} files for step {step.__name__}')
@@ -1240,63 +1508,30 @@ def parallel_execute(
                     failed.append(files[i])
                     
     else:
-        #Limit number of processes for Bruker FF
-        if step.__name__ == 'find_features':
-            base, ext = os.path.splitext(files[0])
-            if ext.lower() == '.d':
-                memory_available = psutil.virtual_memory().available/1024**3
-                n_processes_temp = max((int(memory_available //25 ),1))
-                n_processes = min((n_processes, n_processes_temp))
-                logging.info(f'Using Bruker Feature Finder. Setting Process limit to {n_processes}.')
-            elif ext.lower() in ('.raw','.mzml','.wiff'):
-                memory_available = psutil.virtual_memory().available/1024**3
-                n_processes_temp = max((int(memory_available //8 ), 1))
-                n_processes = min((n_processes, n_processes_temp))
-                logging.info(f'Setting Process limit to {n_processes}')
-            else:
-                raise NotImplementedError('Feature Finding: File extension {} not understood.'.format(ext))
-
-        elif step.__name__ == 'search_db':
-            memory_available = psutil.virtual_memory().available/1024**3
-            n_processes_temp = max((int(memory_available //8 ), 1)) # 8 gb per file: Todo: make this better
-            n_processes = min((n_processes, n_processes_temp))
-            n_processes = min((n_processes, n_files)) #not more processes than files.
-            logging.info(f'Searching. Setting Process limit to {n_processes}.')
-
-        elif step.__name__ == 'raw_conversion': #alphatims raw conversion needs enough RAM
-            base, ext = os.path.splitext(files[0])
-            if ext.lower() == '.d':
-                memory_available = psutil.virtual_memory().available/1024**3
-                n_processes_temp = max((int(memory_available //8 ), 1)) # 8 gb per file: Todo: make this better
-                n_processes = min((n_processes, n_processes_temp))
-                n_processes = min((n_processes, n_files)) #not more processes than files.
-                logging.info(f'Importing Raw data with Bruker. Setting Process limit to {n_processes}.')
-            elif ext.lower() == '.wiff':
-                memory_available = psutil.virtual_memory().available/1024**3
-                n_processes_temp = max((int(memory_available //30 ), 1)) # 8 gb per file: Todo: make this better
-                n_processes = min((n_processes, n_processes_temp))
-                n_processes = min((n_processes, n_files)) #not more processes than files.
-                logging.info(f'Importing Raw data with SciEx. Setting Process limit to {n_processes}.')
-        else:
-            pass
+        n_processes = min((n_processes, n_files)) #not more processes than files.
 
+        memory_model = load_memory_model()
+        memory_estimates = [estimate_task_memory(step.__name__, _, memory_model) for _ in files]
+        logging.info(f'Estimated peak memory per file for step {step.__name__}: {max(memory_estimates):.2f} GB. Setting Process limit to {n_processes}.')
 
         failed = []
         rerun = []
-        rerun_map = {}
-        with alphapept.performance.AlphaPool(n_processes) as p:
-            for i, success in enumerate(p.imap(step, to_process)):
-                progress = (i+1)/n_files
-                if success is not True:
-                    failed.append((i, files[i]))
-                    logging.error(f'Processing of {files[i]} for step {step.__name__} failed. Exception {success}')
-                    rerun_map[len(rerun)] = i
-                    rerun.append(to_process[i])
-                else:
-                    logging.error(f'Processing of {files[i]} for step {step.__name__} succeeded. {progress*100:.2f} %')
-
-                if callback:
-                    callback(progress)
+        for i, (task_idx, success, peak) in enumerate(memory_aware_imap(step, to_process, memory_estimates, n_processes)):
+            progress = (i+1)/n_files
+            if success is not True:
+                failed.append((task_idx, files[task_idx]))
+                logging.error(f'Processing of {files[task_idx]} for step {step.__name__} failed. Exception {success}')
+                rerun.append(task_idx)
+            else:
+                logging.error(f'Processing of {files[task_idx]} for step {step.__name__} succeeded. {progress*100:.2f} %')
+                base, ext = os.path.splitext(files[task_idx])
+                key = f'{step.__name__}/{VENDORS.get(ext.lower(), ext.lower())}'
+                # Tasks that finish within one poll, e.g. skipped steps, have no recorded peak
+                if peak > 0:
+                    memory_model.setdefault(key, []).append((get_file_size(files[task_idx]), peak))
+
+            if callback:
+                callback(progress)
         
         n_failed = len(failed)
         if n_failed > 0:
@@ -1305,16 +1540,19 @@ def parallel_execute(
             logging.info(f'Attempting to rerun failed runs with {n_processes_} processes')
 
             failed = []
-            with alphapept.performance.AlphaPool(n_processes_) as p:
-                for i, success in enumerate(p.imap(step, rerun)):
-                    progress = (i+1)/n_failed
-                    if success is not True:
-                        failed.append(files[rerun_map[i]])
-                        logging.error(f'Processing of {files[i]} for step {step.__name__} failed. Exception {success}')
-                    else:
-                        logging.error(f'Processing of {files[i]} for step {step.__name__} succeeded. {progress*100:.2f} %')
-                    if callback:
-                        callback(progress)
+            rerun_estimates = [memory_estimates[_] * 2 for _ in rerun]
+            for i, (task_idx, success, peak) in enumerate(memory_aware_imap(step, [to_process[_] for _ in rerun], rerun_estimates, n_processes_)):
+                progress = (i+1)/n_failed
+                file_name = files[rerun[task_idx]]
+                if success is not True:
+                    failed.append(file_name)
+                    logging.error(f'Processing of {file_name} for step {step.__name__} failed. Exception {success}')
+                else:
+                    logging.error(f'Processing of {file_name} for step {step.__name__} succeeded. {progress*100:.2f} %')
+                if callback:
+                    callback(progress)
+
+        save_memory_model(memory_model)
 
     if step.__name__ not in settings['failed']:
         settings['failed'][step.__name__] = failed
@@ -1323,7 +1561,148 @@ def parallel_execute(
 
     return settings
 
-# %% ../nbs/11_interface.ipynb 23
+def get_file_stages(
+    settings: dict,
+    steps: list,
+    first_search: bool = True,
+) -> list:
+    """Get the per-file functions of consecutive workflow steps.
+
+    Args:
+        settings (dict): A dictionary with settings how to process the data.
+        steps (list): Workflow steps out of import_raw_data, feature_finding, search_data, recalibrate_data and score.
+        first_search (bool): If True, the first search_data step is the first search. Defaults to True.
+
+    Returns:
+        list: Functions that accept a tuple (file index, settings) as input parameter, in order of the steps.
+
+    """
+    stages = []
+
+    for step in steps:
+        if step is import_raw_data:
+            import alphapept.io
+            stages.append(alphapept.io.raw_conversion)
+        elif step is feature_finding:
+            import alphapept.feature_finding
+            stages.append(alphapept.feature_finding.find_features)
+        elif step is search_data:
+            import alphapept.search
+            stages.append(wrapped_partial(alphapept.search.search_db, first_search = first_search))
+        elif step is recalibrate_data:
+            import alphapept.recalibration
+            if settings['search']['calibrate']:
+                stages.append(alphapept.recalibration.calibrate_hdf)
+            first_search = False
+        elif step is score:
+            import alphapept.score
+            stages.append(alphapept.score.score_hdf)
+        else:
+            raise NotImplementedError(f'Step {step.__name__} is not a per-file step.')
+
+    return stages
+
+
+def _execute_stage(task: tuple):
+    """Execute a per-file function on its (file index, settings) tuple."""
+    stage, to_process = task
+    return stage(to_process)
+
+
+def pipeline_execute(
+    settings: dict,
+    stages: list,
+    callback: callable = None,
+) -> dict:
+    """Execute consecutive per-file workflow steps in parallel, streaming each file through the steps.
+
+    A file is submitted to its next step as soon as its previous step finished, so that a slow file does not hold back the other files.
+    Tasks are scheduled by their estimated peak memory as in parallel_execute.
+    A failed step is retried once with twice the estimated memory. If it fails again, the remaining steps of that file are skipped and reported as failed.
+
+    Args:
+        settings (dict): The settings for processing the steps.
+        stages (list): Functions that accept a tuple (file index, settings) as input parameter, executed in order for each file.
+        callback (callable): A function that accepts a float between 0 and 1 as progress. Defaults to None.
+
+    Returns:
+        dict: The settings after processing.
+
+    """
+    n_processes = alphapept.performance.set_worker_count(
+        worker_count=settings['general']['n_processes'],
+        set_global=False
+    )
+
+    files = settings['experiment']['file_paths']
+    n_files = len(files)
+    n_processes = min((n_processes, n_files))
+
+    if 'failed' not in settings:
+        settings['failed'] = {}
+
+    names = []
+    for stage in stages:
+        if (stage.__name__ in settings['failed']) or (stage.__name__ in names):
+            names.append(stage.__name__+'_2')
+        else:
+            names.append(stage.__name__)
+        settings['failed'][names[-1]] = []
+
+    logging.info(f'Processing {n_files} files for steps {", ".join(names)} with {n_processes} processes')
+
+    memory_model = load_memory_model()
+
+    to_process = []
+    memory_estimates = []
+    tasks = []
+
+    def submit(file_idx, stage_idx, attempt):
+        stage = stages[stage_idx]
+        to_process.append((stage, (file_idx, settings)))
+        memory_estimates.append(estimate_task_memory(stage.__name__, files[file_idx], memory_model) * 2**attempt)
+        tasks.append((file_idx, stage_idx, attempt))
+
+    for file_idx in range(n_files):
+        submit(file_idx, 0, 0)
+
+    n_total = n_files * len(stages)
+    n_done = 0
+
+    for task_idx, success, peak in memory_aware_imap(_execute_stage, to_process, memory_estimates, n_processes):
+        file_idx, stage_idx, attempt = tasks[task_idx]
+        file_name = files[file_idx]
+        stage = stages[stage_idx]
+
+        if success is True:
+            n_done += 1
+            logging.info(f'Processing of {file_name} for step {names[stage_idx]} succeeded. {n_done/n_total*100:.2f} %')
+            base, ext = os.path.splitext(file_name)
+            key = f'{stage.__name__}/{VENDORS.get(ext.lower(), ext.lower())}'
+            if peak > 0:
+                memory_model.setdefault(key, []).append((get_file_size(file_name), peak))
+
+            if stage_idx + 1 < len(stages):
+                submit(file_idx, stage_idx + 1, 0)
+
+        elif attempt == 0:
+            logging.error(f'Processing of {file_name} for step {names[stage_idx]} failed. Exception {success}. Attempting to rerun with more memory.')
+            submit(file_idx, stage_idx, 1)
+
+        else:
+            logging.error(f'Processing of {file_name} for step {names[stage_idx]} failed. Exception {success}')
+            for _ in range(stage_idx, len(stages)):
+                settings['failed'][names[_]].append(file_name)
+            n_done += len(stages) - stage_idx
+
+        if callback:
+            callback(n_done/n_total)
+
+    save_memory_model(memory_model)
+
+    return settings
+
+# %% ../nbs/11_interface.ipynb 25
 class bcolors:
     HEADER = '\033[95m'
     OKBLUE = '\033[94m'
@@ -4,7 +4,7 @@
 __all__ = ['get_peaks', 'get_centroid', 'gaussian_estimator', 'centroid_data', 'get_local_intensity', 'get_most_abundant',
            'load_thermo_raw', 'load_bruker_raw', 'one_over_k0_to_CCS', 'import_sciex_as_alphapept', 'load_sciex_raw',
            'check_sanity', 'extract_mzml_info', 'load_mzml_data', 'extract_mq_settings', 'parse_mq_seq',
-           'list_to_numpy_f32', 'HDF_File', 'MS_Data_File', 'index_ragged_list', 'raw_conversion']
+           'list_to_numpy_f32', 'HDF_File', 'MS_Data_File', 'index_ragged_list', 'QueryData', 'raw_conversion']
 
 # %% ../nbs/02_io.ipynb 3
 from numba import njit
@@ -764,8 +764,12 @@ def list_to_numpy_f32(
 import h5py
 import os
 import time
+import contextlib
 from .__main__ import VERSION_NO
 
+# Open sessions by file name, shared by all HDF_Files of this process
+_HDF_SESSIONS = {}
+
 
 class HDF_File(object):
     '''
@@ -898,6 +902,68 @@ class HDF_File(object):
                 )
         return warning_messages
 
+    @contextlib.contextmanager
+    def session(
+        self,
+        mode: str = "r",
+        swmr: bool = False,
+    ):
+        """Keep this HDF_File open to read and write with a single file handle.
+
+        Within the session, all reads and writes of HDF_Files with the same file_name reuse the open handle.
+        The `last_updated` attribute is only written once when the session is closed.
+        Nested sessions reuse the handle of the outermost session.
+
+        Args:
+            mode (str): Open the file with "r" to only read or with "a" to read and write. Defaults to "r".
+            swmr (bool): Open the file in swmr mode. Defaults to False.
+
+        Yields:
+            HDF_File: This HDF_File.
+
+        Raises:
+            ValueError: When the mode is not "r" or "a".
+            IOError: When opening a read-only HDF_File or a file with an open read-only session with mode "a".
+
+        """
+        with self._open(mode, swmr=swmr):
+            yield self
+
+    @contextlib.contextmanager
+    def _open(
+        self,
+        mode: str = "r",
+        swmr: bool = False,
+    ):
+        """Get the session of this HDF_File, which is opened if it does not exist yet."""
+        if mode not in ("r", "a"):
+            raise ValueError(f"Mode {mode} is not supported, use 'r' or 'a'.")
+        if (mode != "r") and self.is_read_only:
+            raise IOError(
+                f"Trying to write to {self}, which is read_only."
+            )
+        session = _HDF_SESSIONS.get(self.file_name)
+        if session is not None:
+            if (mode != "r") and (session["mode"] == "r"):
+                raise IOError(
+                    f"Trying to write to {self}, which has a read-only session."
+                )
+            yield session
+            return
+        with h5py.File(self.file_name, mode, swmr=swmr) as hdf_file:
+            session = {
+                "hdf_file": hdf_file,
+                "mode": mode,
+                "is_updated": False,
+            }
+            _HDF_SESSIONS[self.file_name] = session
+            try:
+                yield session
+            finally:
+                del _HDF_SESSIONS[self.file_name]
+                if session["is_updated"]:
+                    hdf_file.attrs["last_updated"] = time.asctime()
+
 # %% ../nbs/02_io.ipynb 45
 import pandas as pd
 from fastcore.foundation import patch
@@ -913,6 +979,8 @@ def read(
     return_dataset_dtype: bool = False,
     return_dataset_slice: slice = slice(None),
     swmr: bool = False,
+    columns: list = None,
+    row_filter: dict = None,
 ):
     """Read contents of an HDF_File.
 
@@ -934,8 +1002,15 @@ def read(
         return_dataset_dtype (bool): Do not read complete dataset to minimize RAM and IO usage.
             Defaults to False.
         return_dataset_slice (slice): Do not read complete dataset to minimize RAM and IO usage.
+            Can also be a boolean mask or an array with increasing indices of the rows to read.
             Defaults to slice(None).
         swmr (bool): Use swmr mode to read data. Defaults to False.
+        columns (list): Only read these columns of a pd.DataFrame.
+            Defaults to None.
+        row_filter (dict): Only read rows of a pd.DataFrame for which all functions return True.
+            The keys are column names and the values are functions that return a boolean mask for the values of the column,
+            e.g. `{"decoy": lambda x: ~x}`. Only these columns are read for all rows.
+            Defaults to None.
 
     Returns:
         type: Depending on what is requested, a dict, value, np.ndarray or pd.dataframe is returned.
@@ -947,7 +1022,8 @@ def read(
         ValueError: When the requested dataset is not a np.ndarray or pd.dataframe.
 
     """
-    with h5py.File(self.file_name, "r", swmr=swmr) as hdf_file:
+    with self._open("r", swmr=swmr) as session:
+        hdf_file = session["hdf_file"]
         if group_name is None:
             group = hdf_file
             group_name = "/"
@@ -986,38 +1062,50 @@ def read(
                     elif return_dataset_dtype:
                         return dataset.dtype
                     else:
-                        array = dataset[return_dataset_slice]
+                        array = _read_rows(dataset, return_dataset_slice)
                         # TODO: This assumes any object array is a string array
                         if array.dtype == object:
                             array = array.astype(str)
                         return array
+                elif dataset.attrs.get("is_pd_categorical", False):
+                    if return_dataset_shape:
+                        return (_get_n_rows(dataset),)
+                    elif return_dataset_dtype:
+                        return _get_column_dtype(dataset)
+                    else:
+                        return _read_column(dataset, return_dataset_slice)
                 elif dataset.attrs["is_pd_dataframe"]:
+                    if columns is None:
+                        columns = sorted(dataset)
+                    for column in list(columns) + list(row_filter or []):
+                        if column not in dataset:
+                            raise KeyError(
+                                f"Column {column} does not exist for "
+                                f"dataset {dataset_name} of group "
+                                f"{group_name} of {self}."
+                            )
                     if return_dataset_shape:
-                        columns = list(dataset)
                         return (
-                            len(dataset[columns[0]]),
+                            _get_n_rows(dataset[columns[0]]),
                             len(columns)
                         )
                     elif return_dataset_dtype:
                         return [
-                            dataset[column].dtype for column in sorted(
-                                dataset
-                            )
+                            _get_column_dtype(dataset[column]) for column in columns
                         ]
                     else:
+                        rows = return_dataset_slice
+                        if row_filter is not None:
+                            rows = np.arange(_get_n_rows(dataset[columns[0]]))[rows]
+                            for column, function in row_filter.items():
+                                rows = rows[function(_read_column(dataset[column], rows))]
                         df = pd.DataFrame(
                             {
-                                column: dataset[column][
-                                    return_dataset_slice
-                                ] for column in sorted(dataset)
+                                column: _read_column(
+                                    dataset[column], rows
+                                ) for column in columns
                             }
                         )
-                        # TODO: This assumes any object array is a string array
-                        for column in dataset:
-                            if df[column].dtype == object:
-                                df[column] = df[column].apply(
-                                    lambda x: x if isinstance(x, str) else x.decode('UTF-8')
-                                )
                         return df
                 else:
                     raise ValueError(
@@ -1037,6 +1125,49 @@ def read(
                 return dict(dataset.attrs)
 
 
+def _read_rows(dataset: h5py.Dataset, rows) -> np.ndarray:
+    """Read rows of a dataset with a slice, a boolean mask or increasing indices.
+
+    Only the range between the first and last selected row is read from disk.
+    """
+    if isinstance(rows, slice):
+        return dataset[rows]
+    rows = np.asarray(rows)
+    if rows.dtype == np.bool_:
+        rows = np.flatnonzero(rows)
+    if len(rows) == 0:
+        return dataset[0:0]
+    start = rows[0]
+    return dataset[start:rows[-1] + 1][rows - start]
+
+
+def _get_n_rows(column) -> int:
+    """Get the number of rows of a pd.DataFrame column."""
+    if isinstance(column, h5py.Group):
+        return len(column["codes"])
+    return len(column)
+
+
+def _get_column_dtype(column) -> np.dtype:
+    """Get the dtype of a pd.DataFrame column."""
+    if isinstance(column, h5py.Group):
+        return np.dtype('O')
+    return column.dtype
+
+
+def _read_column(column, rows) -> np.ndarray:
+    """Read rows of a pd.DataFrame column.
+
+    String columns are decoded vectorized, either from categorical codes or from variable-length strings.
+    """
+    if isinstance(column, h5py.Group):
+        categories = column["categories"].asstr()[...]
+        return categories[_read_rows(column["codes"], rows)]
+    elif h5py.check_string_dtype(column.dtype) is not None:
+        return _read_rows(column.asstr(), rows)
+    return _read_rows(column, rows)
+
+
 @patch
 def write(
     self:HDF_File,
@@ -1079,7 +1210,8 @@ def write(
         )
     if overwrite is None:
         overwrite = self.is_overwritable
-    with h5py.File(self.file_name, "a", swmr=swmr) as hdf_file:
+    with self._open("a", swmr=swmr) as session:
+        hdf_file = session["hdf_file"]
 
         if group_name is None:
             group = hdf_file
@@ -1136,13 +1268,44 @@ def write(
                         overwrite=overwrite,
                     )
                     for column in value.columns:
-                        self.write(
-                            value[column].values,
-                            group_name=new_group_name,
-                            dataset_name=column,
-                            overwrite=overwrite,
-                            dataset_compression=dataset_compression,
-                        )
+                        values = value[column].values
+                        if (values.dtype == np.dtype('O')) and (pd.api.types.infer_dtype(values, skipna=False) == "string"):
+                            # Strings are stored as categorical codes to decode them vectorized
+                            codes, categories = pd.factorize(values)
+                            column_group_name = f"{new_group_name}/{column}"
+                            self.write(
+                                column,
+                                group_name=new_group_name,
+                                overwrite=overwrite,
+                            )
+                            self.write(
+                                True,
+                                group_name=column_group_name,
+                                attr_name="is_pd_categorical",
+                                overwrite=overwrite,
+                            )
+                            self.write(
+                                codes.astype(np.int32 if len(categories) < 2**31 else np.int64),
+                                group_name=column_group_name,
+                                dataset_name="codes",
+                                overwrite=overwrite,
+                                dataset_compression=dataset_compression,
+                            )
+                            self.write(
+                                np.array(categories, dtype=object),
+                                group_name=column_group_name,
+                                dataset_name="categories",
+                                overwrite=overwrite,
+                                dataset_compression=dataset_compression,
+                            )
+                        else:
+                            self.write(
+                                values,
+                                group_name=new_group_name,
+                                dataset_name=column,
+                                overwrite=overwrite,
+                                dataset_compression=dataset_compression,
+                            )
                 else:
                     dtype = value.dtype
                     if value.dtype == np.dtype('O'):
@@ -1176,7 +1339,7 @@ def write(
                     dataset.attrs[attr_name] = value
                 except TypeError:
                     dataset.attrs[attr_name] = str(value) # e.g. dicts
-        hdf_file.attrs["last_updated"] = time.asctime()
+        session["is_updated"] = True
 
 # %% ../nbs/02_io.ipynb 49
 class MS_Data_File(HDF_File):
@@ -1369,16 +1532,121 @@ def _save_DDA_query_data(
     return
 
 # %% ../nbs/02_io.ipynb 55
+import collections.abc
+
+
+class QueryData(collections.abc.MutableMapping):
+    """Query data of an MS_Data_File that is read lazily.
+
+    Datasets of the MS1 and MS2 scans are only read on first access and cached for the lifetime of this object.
+    Contiguous numeric datasets can be returned as read-only memory-mapped arrays.
+    """
+
+    def __init__(
+        self,
+        ms_file: MS_Data_File,
+        calibrated_fragments: bool = False,
+        swmr: bool = False,
+        mmap: bool = False,
+    ):
+        """Create a lazy query_dict for an MS_Data_File.
+
+        Args:
+            ms_file (MS_Data_File): The MS_Data_File with raw data.
+            calibrated_fragments (bool): If True, the fragment masses are corrected with the corrected_fragment_mzs of the ms_file.
+                Defaults to False.
+            swmr (bool): Open the file in swmr mode. Defaults to False.
+            mmap (bool): If True, contiguous numeric datasets are memory-mapped instead of read into memory.
+                Defaults to False.
+
+        """
+        self.ms_file = ms_file
+        self.calibrated_fragments = calibrated_fragments
+        self.swmr = swmr
+        self._locations = {}
+        self._layouts = {}
+        self._arrays = {}
+        self._values = {}
+        with ms_file._open("r", swmr=swmr) as session:
+            hdf_file = session["hdf_file"]
+            for group_name in ["Raw/MS1_scans", "Raw/MS2_scans"]:
+                for dataset_name, dataset in hdf_file[group_name].items():
+                    location = (group_name, dataset_name)
+                    self._locations[dataset_name] = location
+                    offset = dataset.id.get_offset()
+                    if mmap and (offset is not None) and (dataset.chunks is None) and (dataset.dtype.kind in 'biuf'):
+                        self._layouts[location] = (offset, dataset.dtype, dataset.shape)
+                    else:
+                        self._layouts[location] = None
+            vendor = hdf_file["Raw"].attrs["vendor"]
+        if vendor == "Bruker":
+            self._locations["mobility"] = self._locations["mobility2"]
+            self._locations["prec_id"] = self._locations["prec_id2"]
+
+    def _read(self, group_name: str, dataset_name: str) -> np.ndarray:
+        """Read a dataset from disk or memory-map it."""
+        layout = self._layouts[(group_name, dataset_name)]
+        if layout is not None:
+            offset, dtype, shape = layout
+            array = np.memmap(self.ms_file.file_name, mode="r", dtype=dtype, shape=shape, offset=offset)
+        else:
+            array = self.ms_file.read(
+                dataset_name=dataset_name,
+                group_name=group_name,
+                swmr=self.swmr,
+            )
+        if self.calibrated_fragments and (dataset_name == "mass_list_ms2"):
+            array = np.array(array)
+            array *= (
+                1 - self.ms_file.read(
+                    dataset_name="corrected_fragment_mzs", swmr=self.swmr
+                ) / 10**6
+            )
+        return array
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        if key in self._values:
+            return self._values[key]
+        location = self._locations[key]
+        if location not in self._arrays:
+            self._arrays[location] = self._read(*location)
+        return self._arrays[location]
+
+    def __setitem__(self, key: str, value):
+        self._values[key] = value
+
+    def __delitem__(self, key: str):
+        if key not in self:
+            raise KeyError(key)
+        self._values.pop(key, None)
+        self._locations.pop(key, None)
+
+    def __contains__(self, key: str) -> bool:
+        return (key in self._values) or (key in self._locations)
+
+    def __iter__(self):
+        return iter(dict.fromkeys(list(self._locations) + list(self._values)))
+
+    def __len__(self) -> int:
+        return len(set(self._locations) | set(self._values))
+
+    def __repr__(self) -> str:
+        return f"QueryData({self.ms_file.file_name})"
+
+
 @patch
 def read_DDA_query_data(
     self:MS_Data_File,
     calibrated_fragments:bool=False,
     force_recalibrate:bool=False,
     swmr:bool=False,
+    mmap:bool=False,
     **kwargs
-) -> dict:
+) -> QueryData:
     """Read query data from this ms_data object and return it as a query_dict.
 
+    Datasets are only read when they are accessed, so that only the data that is used is loaded.
+
     Args:
         calibrated_fragments (bool): If True, calibrated fragments are retrieved.
             Calibration offsets can already be present in the ms_data or recalculated.
@@ -1387,48 +1655,14 @@ def read_DDA_query_data(
             recalibrate mzs values even if a recalibration is already provided.
             Defaults to False.
         swmr (bool): Open the file in swmr mode. Defaults to False.
+        mmap (bool): If True, contiguous numeric datasets are returned as read-only memory-mapped arrays.
+            Defaults to False.
         **kwargs (type): Can contain a database file name that was used for recalibration.
 
     Returns:
-        dict: A query_dict with data for MS1 and MS2 scans.
+        QueryData: A lazy query_dict with data for MS1 and MS2 scans.
 
     """
-    query_data = {}
-    for dataset_name in self.read(group_name="Raw/MS1_scans"):
-        values = self.read(
-            dataset_name=dataset_name,
-            group_name="Raw/MS1_scans",
-            swmr=swmr,
-        )
-        query_data[dataset_name] = values
-    for dataset_name in self.read(group_name="Raw/MS2_scans"):
-        values = self.read(
-            dataset_name=dataset_name,
-            group_name="Raw/MS2_scans",
-            swmr=swmr
-        )
-        query_data[dataset_name] = values
-#     indices_ms1 = query_data["indices_ms1"]
-#     mz_ms1 = query_data["mass_list_ms1"]
-#     query_data["mass_list_ms1"] = np.array(
-#         [mz_ms1[s:e] for s,e in zip(indices_ms1[:-1], indices_ms1[1:])]
-#     )
-#     int_ms1 = query_data["int_list_ms1"]
-#     query_data["int_list_ms1"] = np.array(
-#         [int_ms1[s:e] for s,e in zip(indices_ms1[:-1], indices_ms1[1:])]
-#     )
-    indices_ms2 = query_data["indices_ms2"]
-#     mz_ms2 = query_data["mass_list_ms2"]
-#     query_data["mass_list_ms2"] = np.array(
-#         [mz_ms2[s:e] for s,e in zip(indices_ms2[:-1], indices_ms2[1:])]
-#     )
-#     int_ms2 = query_data["int_list_ms2"]
-#     query_data["int_list_ms2"] = np.array(
-#         [int_ms2[s:e] for s,e in zip(indices_ms2[:-1], indices_ms2[1:])]
-#     )
-    if self.read(attr_name="vendor", group_name="Raw") == "Bruker":
-        query_data["mobility"] = query_data["mobility2"]
-        query_data["prec_id"] = query_data["prec_id2"]
     if calibrated_fragments:
         if ("corrected_fragment_mzs" not in self.read()) or force_recalibrate:
 #         if True:
@@ -1438,12 +1672,12 @@ def read_DDA_query_data(
                 kwargs["database_file_name"],
                 self.file_name,
             )
-        query_data["mass_list_ms2"] *= (
-            1 - self.read(
-                dataset_name="corrected_fragment_mzs", swmr=swmr
-            ) / 10**6
-        )
-    return query_data
+    return QueryData(
+        self,
+        calibrated_fragments=calibrated_fragments,
+        swmr=swmr,
+        mmap=mmap,
+    )
 
 # %% ../nbs/02_io.ipynb 58
 def raw_conversion(
@@ -1,8 +1,9 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/09_matching.ipynb.
 
 # %% auto 0
-__all__ = ['calculate_distance', 'calib_table', 'align', 'calculate_deltas', 'align_files', 'align_datasets', 'get_probability',
-           'convert_decoy', 'match_datasets']
+__all__ = ['MATCHING_LIBRARY_KEYS', 'calculate_distance', 'calib_table', 'align', 'get_precursor_matrix', 'calculate_deltas',
+           'get_alignment_pairs', 'align_files', 'align_datasets', 'get_probability', 'get_probabilities',
+           'convert_decoy', 'save_matching_library', 'load_matching_library', 'match_file', 'match_datasets']
 
 # %% ../nbs/09_matching.ipynb 4
 import pandas as pd
@@ -83,69 +84,168 @@ def calib_table(table: pd.DataFrame, delta: pd.Series, offset_dict: dict):
 
 # %% ../nbs/09_matching.ipynb 8
 import logging
-from sklearn.linear_model import LinearRegression
-import sys
+from scipy.sparse import csr_matrix
+from scipy.sparse.linalg import lsqr
+from sklearn.metrics import r2_score
 
 def align(deltas: pd.DataFrame, filenames: list, weights:np.ndarray=None, n_jobs=None) -> np.ndarray:
     """Align multiple datasets.
     This function creates a matrix to represent the shifts from each dataset to another.
-    This effectively is an overdetermined equation system and is solved with a linear regression.
+    This effectively is an overdetermined equation system and is solved with a weighted sparse least squares (LSQR).
+
+    The matrix is built as sparse matrix with the offsets of the datasets relative to the first one as unknowns, so each comparison has two entries.
+    The returned alignment values are the shifts between consecutive datasets.
 
     Args:
         deltas (pd.DataFrame): Distances from each dataset to another.
         filenames (list): The filenames of the datasts that were compared.
         weights (np.ndarray, optional): Distances can be weighted by their number of shared elements. Defaults to None.
-        n_jobs (optional): Number of processes to be used. Defaults to None (=1).
+        n_jobs (optional): Not used by the sparse solver, only kept for compatibility. Defaults to None.
 
     Returns:
         np.ndarray: alignment values.
     """
-    matrix = []
-
-    for i in range(len(deltas)):
-        start, end = deltas.index[i]
-
-        start_idx = filenames.index(start)
-        end_idx = filenames.index(end)
-
-        lines = np.zeros(len(filenames)-1)
-        lines[start_idx:end_idx] = 1
-        matrix.append(lines)
+    file_idx = {_: i for i, _ in enumerate(filenames)}
+    start_idx = np.array([file_idx[start] for start, end in deltas.index], dtype=np.int64)
+    end_idx = np.array([file_idx[end] for start, end in deltas.index], dtype=np.int64)
 
     # Remove nan values
-    not_nan = ~deltas.isnull().any(axis=1)
-    matrix = np.array(matrix)
-    matrix = matrix[not_nan]
-    deltas_ = deltas[not_nan]
+    not_nan = ~deltas.isnull().any(axis=1).values
+    start_idx, end_idx = start_idx[not_nan], end_idx[not_nan]
+    deltas_ = deltas.values[not_nan]
 
-    if len(deltas) < matrix.shape[1]:
+    if len(deltas) < len(filenames) - 1:
         logging.info('Low overlap between datasets detected. Alignment may fail.')
 
+    # Each delta is the offset of the end relative to the start dataset, the first dataset has an offset of 0
+    rows = np.repeat(np.arange(len(deltas_)), 2)
+    cols = np.stack([end_idx, start_idx], axis=1).ravel()
+    values = np.tile([1.0, -1.0], len(deltas_))
+    keep = cols > 0
+
+    matrix = csr_matrix((values[keep], (rows[keep], cols[keep] - 1)), shape=(len(deltas_), len(filenames)-1))
+
     if weights is not None:
-        reg = LinearRegression(fit_intercept=False, n_jobs=n_jobs).fit(matrix, deltas_.values, sample_weight = weights[not_nan])
-        score= reg.score(matrix, deltas_.values)
+        sqrt_weights = np.sqrt(np.asarray(weights, dtype=np.float64)[not_nan])
     else:
-        reg = LinearRegression(fit_intercept=False, n_jobs=n_jobs).fit(matrix, deltas_.values)
-        score= reg.score(matrix, deltas_.values)
+        sqrt_weights = np.ones(len(deltas_))
+
+    matrix_weighted = csr_matrix(matrix.multiply(sqrt_weights[:, None]))
+
+    offsets = np.zeros((len(filenames)-1, deltas_.shape[1]))
+    for col in range(deltas_.shape[1]):
+        offsets[:, col] = lsqr(matrix_weighted, deltas_[:, col] * sqrt_weights, atol=1e-12, btol=1e-12, iter_lim=10*len(filenames)+100)[0]
+
+    score = r2_score(deltas_, matrix @ offsets)
 
     logging.info(f"Regression score is {score}")
 
-    x = reg.predict(np.eye(len(filenames)-1))
+    x = np.diff(offsets, axis=0, prepend=0)
 
     return x
 
-# %% ../nbs/09_matching.ipynb 10
+# %% ../nbs/09_matching.ipynb 11
 import alphapept.io
 import os
 from typing import Callable, Tuple, Dict, List
+import alphapept.performance
+
+
+def get_precursor_matrix(filenames: list, calib: bool = False) -> (dict, np.ndarray, np.ndarray, np.ndarray):
+    """Read the precursors of multiple files as one sparse precursor x file matrix.
+
+    The precursors of each file are averaged and get an id that is shared between all files.
+    The precursors of file i are precursor_ids[indptr[i]:indptr[i+1]], sorted by id, and values has one column per entry of the offset_dict.
+
+    Args:
+        filenames (list): A list with raw file names.
+        calib (bool): Boolean flag to indicate that calibrated data should be read.
+
+    Returns:
+        dict: Offset dictionary which is used for comparing.
+        np.ndarray: Numpy array with the indptr to the precursors of each file.
+        np.ndarray: Numpy array with the precursor ids.
+        np.ndarray: Numpy array with the values of each precursor.
+    """
+    offset_dict = {}
+    precursors = []
+    values = []
+
+    for filename in filenames:
+        ms_file = alphapept.io.MS_Data_File(os.path.splitext(filename)[0] + '.ms_data.hdf')
+
+        if not offset_dict:
+            offset_dict, columns_to_read = _get_offset_dict_and_columns_to_read(
+                ms_file.read(group_name="peptide_fdr"), calib
+            )
+
+        # only reading the necessary columns to save memory
+        df = ms_file.read(dataset_name="peptide_fdr", columns=columns_to_read)
+        df_mean = df[columns_to_read].groupby('precursor').mean()  # index is "precursor" now
+
+        precursors.append(df_mean.index.values)
+        values.append(df_mean.values.astype(np.float64))
+
+    indptr = np.zeros(len(filenames) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(_) for _ in precursors])
+
+    # Sorted ids keep the precursors of each file sorted
+    precursor_ids = pd.factorize(np.concatenate(precursors), sort=True)[0]
+
+    return offset_dict, indptr, precursor_ids, np.concatenate(values)
+
+
+@alphapept.performance.performance_function(compilation_mode="numba-multithread")
+def _calculate_pair_deltas(index: np.ndarray, pairs: np.ndarray, indptr: np.ndarray, precursor_ids: np.ndarray, values: np.ndarray, relative: np.ndarray, deltas: np.ndarray, weights: np.ndarray):
+    """Calculate the median deltas of the shared precursors of a pair of files.
+
+    Args:
+        index (np.ndarray): Input index. Note that we are using the performance function so this is a range.
+        pairs (np.ndarray): Array with the indices of the two files of each pair.
+        indptr (np.ndarray): Array with the indptr to the precursors of each file.
+        precursor_ids (np.ndarray): Array with the sorted precursor ids of each file.
+        values (np.ndarray): Array with the values of each precursor.
+        relative (np.ndarray): Boolean array that is True for columns with a relative distance.
+        deltas (np.ndarray): Buffer array to store the deltas of each pair.
+        weights (np.ndarray): Buffer array to store the number of shared precursors of each pair.
+    """
+    start_1, end_1 = indptr[pairs[index, 0]], indptr[pairs[index, 0] + 1]
+    start_2, end_2 = indptr[pairs[index, 1]], indptr[pairs[index, 1] + 1]
+
+    n_max = min(end_1 - start_1, end_2 - start_2)
+    idx_1 = np.empty(n_max, dtype=np.int64)
+    idx_2 = np.empty(n_max, dtype=np.int64)
+
+    n_shared = 0
+    while start_1 < end_1 and start_2 < end_2:
+        if precursor_ids[start_1] < precursor_ids[start_2]:
+            start_1 += 1
+        elif precursor_ids[start_1] > precursor_ids[start_2]:
+            start_2 += 1
+        else:
+            idx_1[n_shared] = start_1
+            idx_2[n_shared] = start_2
+            n_shared += 1
+            start_1 += 1
+            start_2 += 1
+
+    weights[index] = n_shared
+
+    for col in range(values.shape[1]):
+        values_1 = values[idx_1[:n_shared], col]
+        values_2 = values[idx_2[:n_shared], col]
+
+        if relative[col]:
+            deltas[index, col] = np.nanmedian((values_1 - values_2) / (values_1 + values_2) * 2)
+        else:
+            deltas[index, col] = np.nanmedian(values_1 - values_2)
 
 
 def calculate_deltas(combos: list, calib:bool = False, callback:Callable=None) -> (pd.DataFrame, np.ndarray, dict):
     """Wrapper function to calculate the distances of multiple files.
 
     In here, we define the offset_dict to make a relative comparison for mz and mobility and absolute for rt.
-
-    TODO: This function could be speed-up by parallelization
+    Each file is read once with get_precursor_matrix and the shared precursors of all pairs are compared in parallel.
 
     Args:
         combos (list): A list containing tuples of filenames that should be compared.
@@ -158,52 +258,33 @@ def calculate_deltas(combos: list, calib:bool = False, callback:Callable=None) -
         dict: Offset dictionary whicch was used for comparing.
 
     """
+    filenames = list(dict.fromkeys([_ for combo in combos for _ in combo]))
+    file_idx = {_: i for i, _ in enumerate(filenames)}
+    pairs = np.array([[file_idx[combo[0]], file_idx[combo[1]]] for combo in combos], dtype=np.int64).reshape(-1, 2)
 
-    offset_dict = {}
-    deltas = {}
-    weights = []
-
-    df_cache = {}
-    cache_size_in_kbytes = 0
-
-    for i, combo in enumerate(combos):
-        filename1 = os.path.splitext(combo[0])[0] + '.ms_data.hdf'
-        filename2 = os.path.splitext(combo[1])[0] + '.ms_data.hdf'
+    offset_dict, indptr, precursor_ids, values = get_precursor_matrix(filenames, calib)
 
-        for filename in [filename1, filename2]:
-            if filename not in df_cache:
-                df = alphapept.io.MS_Data_File(filename).read(dataset_name="peptide_fdr")
-
-                if not offset_dict:
-                    offset_dict, columns_to_drop = _get_offset_dict_and_columns_to_drop(df.columns, calib)
-
-                # dropping all unnecessary columns to save memory
-                df.drop(columns=columns_to_drop, inplace=True)
-                df_mean = df.groupby('precursor').mean()  # index is "precursor" now
-                df_cache[filename] = df_mean
-
-                cache_size_in_kbytes += sys.getsizeof(df_mean)/1024
-                if not i % 100:
-                    logging.info(f"cache info: iteration {i} items {len(df_cache)} size {cache_size_in_kbytes:.1f} kB")
+    for col in offset_dict:
+        if offset_dict[col] not in ['absolute', 'relative']:
+            raise NotImplementedError(f"Calculating delta for {offset_dict[col]} not implemented.")
 
-        df_1_mean = df_cache[filename1]
-        df_2_mean = df_cache[filename2]
+    relative = np.array([offset_dict[col] == 'relative' for col in offset_dict])
 
-        dists, weight = calculate_distance(df_1_mean, df_2_mean, offset_dict, calib)
+    deltas = np.zeros((len(pairs), len(offset_dict)))
+    weights = np.zeros(len(pairs), dtype=np.int64)
 
-        deltas[combo] = dists
-        weights.append(weight)
+    _calculate_pair_deltas(range(len(pairs)), pairs, indptr, precursor_ids, values, relative, deltas, weights)
 
-        if callback:
-            callback((i+1)/len(combos))
+    if callback:
+        callback(1)
 
-    df_deltas = pd.DataFrame.from_dict(deltas, orient='index', columns=offset_dict.keys())
+    df_deltas = pd.DataFrame.from_dict(dict(zip(combos, deltas.tolist())), orient='index', columns=offset_dict.keys())
 
-    return df_deltas, np.array(weights), offset_dict,
+    return df_deltas, weights, offset_dict,
 
 
-def _get_offset_dict_and_columns_to_drop(input_data_columns: pd.Index, calib: bool) -> Tuple[Dict[str, str], List[str]]:
-    """Get a dictionary which maps columns names to alignment modes and a list of columns not required for the alignment."""
+def _get_offset_dict_and_columns_to_read(input_data_columns: list, calib: bool) -> Tuple[Dict[str, str], List[str]]:
+    """Get a dictionary which maps columns names to alignment modes and a list of columns required for the alignment."""
 
     offset_dict = {'mz': 'relative', 'rt': 'absolute'}
 
@@ -213,19 +294,68 @@ def _get_offset_dict_and_columns_to_drop(input_data_columns: pd.Index, calib: bo
 
     suffix = "_calib" if calib else ""
     columns_to_align = [f"{key}{suffix}" for key  in offset_dict.keys()]
-    columns_to_keep = columns_to_align + ["precursor"]
-
-    columns_to_drop = [col for col in input_data_columns if col not in columns_to_keep]
+    columns_to_read = ["precursor"] + columns_to_align
 
-    return offset_dict, columns_to_drop
+    return offset_dict, columns_to_read
 
 
-# %% ../nbs/09_matching.ipynb 12
+# %% ../nbs/09_matching.ipynb 13
 import pandas as pd
 from itertools import combinations
 import numpy as np
 import os
 import functools
+from scipy.sparse.csgraph import minimum_spanning_tree
+
+def get_alignment_pairs(filenames: list, align_pairs: str = 'all') -> list:
+    """Get the pairs of files that are compared for the alignment.
+
+    For 'all', each file is compared to each other file, which scales quadratically with the number of files.
+    For 'reference', each file is only compared to the file with the most precursors.
+    For 'spanning_tree', files are compared along a maximum spanning tree of the number of shared precursors.
+
+    Args:
+        filenames (list): A list with raw file names.
+        align_pairs (str): Selection of pairs, either 'all', 'reference' or 'spanning_tree'. Defaults to 'all'.
+
+    Raises:
+        NotImplementedError: If the selection of pairs is not implemented.
+
+    Returns:
+        list: A list containing tuples of filenames that should be compared.
+    """
+    if align_pairs == 'all':
+        return list(combinations(filenames, 2))
+
+    n_files = len(filenames)
+    offset_dict, indptr, precursor_ids, values = get_precursor_matrix(filenames)
+
+    # Number of shared precursors of all files from the sparse precursor x file matrix
+    file_ids = np.repeat(np.arange(n_files), np.diff(indptr))
+    precursor_matrix = csr_matrix((np.ones(len(precursor_ids)), (precursor_ids, file_ids)), shape=(precursor_ids.max() + 1, n_files))
+    shared = (precursor_matrix.T @ precursor_matrix).toarray()
+
+    if align_pairs == 'reference':
+        reference = np.argmax(np.diag(shared))
+        logging.info(f'Using {filenames[reference]} as reference for the alignment.')
+        pairs = [(min(reference, _), max(reference, _)) for _ in range(n_files) if _ != reference]
+
+    elif align_pairs == 'spanning_tree':
+        # The minimum spanning tree of the inverse number of shared precursors, files without shared precursors are not connected
+        distances = np.zeros((n_files, n_files))
+        np.divide(1, shared, out=distances, where=shared > 0)
+        np.fill_diagonal(distances, 0)
+
+        tree = minimum_spanning_tree(distances).tocoo()
+        pairs = sorted((min(a, b), max(a, b)) for a, b in zip(tree.row, tree.col))
+
+        if len(pairs) < n_files - 1:
+            logging.info('Not all files share precursors. Alignment may fail.')
+    else:
+        raise NotImplementedError(align_pairs)
+
+    return [(filenames[a], filenames[b]) for a, b in pairs]
+
 
 #There is no unit test for align_files and align_datasets as they are wrappers and should be covered by the quick_test
 def align_files(filenames: list, alignment: pd.DataFrame, offset_dict: dict):
@@ -270,7 +400,9 @@ def align_datasets(settings:dict, callback:callable=None):
         cb = None
 
     if len(filenames) > 1:
-        combos = list(combinations(filenames, 2))
+        combos = get_alignment_pairs(filenames, settings['matching'].get('align_pairs', 'all'))
+
+        logging.info(f'Comparing {len(combos):,} pairs of files.')
 
         deltas, weights, offset_dict = calculate_deltas(combos, callback=cb)
 
@@ -282,15 +414,9 @@ def align_datasets(settings:dict, callback:callable=None):
         logging.info(f'Total deviation before calibration {before_sum}')
         logging.info(f'Mean deviation before calibration {before_mean}')
         
-        n_jobs = settings['general']['n_processes']
+        logging.info(f'Solving equation system.')
 
-        logging.info(f'Solving equation system with {n_jobs} jobs.')
-        
-        if n_jobs > 60:
-            n_jobs = 60 #See https://github.com/pycaret/pycaret/issues/38
-            logging.info('Capping n_jobs at 60.')
-
-        alignment = pd.DataFrame(align(deltas, filenames, weights, n_jobs), columns = cols)
+        alignment = pd.DataFrame(align(deltas, filenames, weights), columns = cols)
         alignment = pd.concat([alignment, pd.DataFrame(np.zeros((1, alignment.shape[1])), columns= cols)])
                 
         alignment -= alignment.mean()
@@ -322,7 +448,7 @@ def align_datasets(settings:dict, callback:callable=None):
     else:
         logging.info('Only 1 dataset present. Skipping alignment.')
 
-# %% ../nbs/09_matching.ipynb 14
+# %% ../nbs/09_matching.ipynb 16
 from scipy import stats
 def get_probability(df: pd.DataFrame, ref: pd.DataFrame, sigma:pd.DataFrame, index:int)-> float:
     """Probablity estimate of a transfered identification using the Mahalanobis distance.
@@ -357,9 +483,41 @@ def get_probability(df: pd.DataFrame, ref: pd.DataFrame, sigma:pd.DataFrame, ind
 
     return _
 
-# %% ../nbs/09_matching.ipynb 17
+# %% ../nbs/09_matching.ipynb 20
+def get_probabilities(x: np.ndarray, mu: np.ndarray, sigma: np.ndarray)-> np.ndarray:
+    """Probablity estimates of transfered identifications using the Mahalanobis distance, see get_probability.
+
+    Args:
+        x (np.ndarray): Array containing transferered features, one row per feature.
+        mu (np.ndarray): Array containing the matching reference features.
+        sigma (np.ndarray): Array containing the standard deviations of the reference features.
+
+    Returns:
+        np.ndarray: Probabilities, nan for features with a standard deviation of 0.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    mu = np.asarray(mu, dtype=np.float64)
+    sigma = np.asarray(sigma, dtype=np.float64)
+
+    delta = x - mu
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_sigma = 1 / sigma
+
+    m_dist_x = np.sum(delta * inv_sigma * delta, axis=1)
+
+    probabilities = stats.chi2.cdf(m_dist_x, x.shape[1])
+
+    # The inverse of a singular covariance matrix does not exist
+    probabilities[np.any(sigma == 0, axis=1)] = np.nan
+
+    return probabilities
+
+# %% ../nbs/09_matching.ipynb 22
 from sklearn.neighbors import KDTree
 from .utils import assemble_df
+import tempfile
+import shutil
 
 def convert_decoy(float_):
     """
@@ -371,150 +529,223 @@ def convert_decoy(float_):
     else:
         return False
 
-# This function is a wrapper function and has currently has no unit test 
-# The function will be revised when implementing issue #255: https://github.com/MannLabs/alphapept/issues/255
-def match_datasets(settings:dict, callback:Callable = None):
-    """Match datasets: Wrapper function to match datasets based on a settings file.
-    This implementation uses matching groups but not fractions. 
-    
+MATCHING_LIBRARY_KEYS = ['precursor', 'alignment_cols', 'coords', 'std', 'std_range', 'score', 'decoy', 'target', 'sequence', 'sequence_naked', 'db_idx']
+
+def save_matching_library(xx: pd.DataFrame, alignment_cols: list, library_path: str):
+    """Build the reference library for matching and save it as .npy files, so that it can be memory-mapped.
+
+    Precursors are averaged over all files of the matching group, the standard deviations of their coordinates are used to estimate matching probabilities.
+
     Args:
-        settings (dict): Dictionary containg specifications of the run
-        callback (Callable): Callback function to indicate progress.
+        xx (pd.DataFrame): Identified precursors of all files to match from.
+        alignment_cols (list): Columns with the (calibrated) coordinates of the precursors.
+        library_path (str): Folder to save the .npy files to. Is created if it does not exist.
+
+    Returns:
+        int: Number of precursors in the library.
     """
+    os.makedirs(library_path, exist_ok=True)
 
-    logging.info(f"Matching datasets.")
-    
-    if len(settings['experiment']['file_paths']) > 2:
-        
-    
-        if settings['experiment']['matching_group'] == []:
-            settings['experiment']['matching_group'] = [0 for _ in settings['experiment']['shortnames']]
+    grouped = xx[['precursor'] + alignment_cols + ['score', 'decoy', 'target']].groupby('precursor').mean()
 
-        match_p_min = settings['matching']['match_p_min']
-        match_d_min = settings['matching']['match_d_min']
+    grouped['decoy'] = grouped['decoy'].apply(lambda x: convert_decoy(x))
+    grouped['target'] = grouped['target'].apply(lambda x: convert_decoy(x))
 
-        filenames = settings['experiment']['file_paths']
+    std_ = xx[['precursor'] + alignment_cols].groupby('precursor').std()
 
-        shortnames_lookup = dict(zip(settings['experiment']['shortnames'], settings['experiment']['file_paths'])) 
+    sequences = xx.drop_duplicates('precursor', keep='last').set_index('precursor').loc[grouped.index]
 
-        matching_group = np.array(settings['experiment']['matching_group'])
-        n_matching_group = len(set(matching_group))
-        match_tolerance = settings['matching']['match_group_tol']
-        logging.info(f'A total of {n_matching_group} matching groups set.')
+    library = {}
+    library['precursor'] = grouped.index.values.astype(str)
+    library['alignment_cols'] = np.array(alignment_cols)
+    library['coords'] = grouped[alignment_cols].values.astype(np.float64)
+    library['std'] = std_.loc[grouped.index].values.astype(np.float64)
+    library['std_range'] = np.nanmedian(library['std'], axis=0)
+    library['score'] = grouped['score'].values
+    library['decoy'] = grouped['decoy'].values.astype(bool)
+    library['target'] = grouped['target'].values.astype(bool)
+    library['sequence'] = sequences['sequence'].values.astype(str)
+    library['sequence_naked'] = sequences['sequence_naked'].values.astype(str)
+    library['db_idx'] = sequences['db_idx'].values
 
-        x = alphapept.utils.assemble_df(settings, field='peptide_fdr')
+    for key in MATCHING_LIBRARY_KEYS:
+        np.save(os.path.join(library_path, f'{key}.npy'), library[key])
 
-        logging.info(f'A total of {len(x):,} peptides for matching in peptide_fdr.')
+    return len(grouped)
 
-        base_col = ['precursor']
-        alignment_cols = ['mz_calib','rt_calib']
-        extra_cols = ['score','decoy','target']
 
-        if 'mobility' in x.columns:
-            alignment_cols += ['mobility_calib']
-            use_mobility = True
-        else:
-            use_mobility = False
-            
-        for group in set(settings['experiment']['matching_group']):
-            logging.info(f'Matching group {group} with a tolerance of {match_tolerance}.')
-            file_index_from = (matching_group <= (group+match_tolerance)) & (matching_group >= (group-match_tolerance))
-            file_index_to = matching_group == group
-            files_from = np.array(settings['experiment']['shortnames'])[file_index_from].tolist()
-            files_to = np.array(settings['experiment']['shortnames'])[file_index_to].tolist()
-            logging.info(f'Matching from {len(files_from)} files to {len(files_to)} files.')
-            logging.info(f'Matching from {files_from} to {files_to}.')
+def load_matching_library(library_path: str) -> dict:
+    """Load a reference library that was saved with save_matching_library.
+
+    Args:
+        library_path (str): Folder with the .npy files.
+
+    Returns:
+        dict: Memory-mapped arrays of the library.
+    """
+    return {key: np.load(os.path.join(library_path, f'{key}.npy'), mmap_mode='r') for key in MATCHING_LIBRARY_KEYS}
 
-            if len(files_from) > 2:
-                xx = x[x['shortname'].apply(lambda x: x in files_from)].copy()
+# %% ../nbs/09_matching.ipynb 25
+def match_file(to_process: tuple) -> (str, int):
+    """Transfer identifications from a reference library to the features of a single file.
 
-                grouped = xx[base_col + alignment_cols + extra_cols].groupby('precursor').mean()
+    The unidentified precursors of the library are matched to the closest feature, and the matches are appended to the peptide_fdr table of the file.
 
-                grouped['decoy'] = grouped['decoy'].apply(lambda x: convert_decoy(x))
-                grouped['target'] = grouped['target'].apply(lambda x: convert_decoy(x))
+    Args:
+        to_process (tuple): The ms_data file, the folder of the reference library (see save_matching_library), match_d_min and match_p_min.
 
-                std_ = xx[base_col + alignment_cols].groupby('precursor').std()
+    Returns:
+        str: The ms_data file.
+        int: Number of matched features.
+    """
+    file, library_path, match_d_min, match_p_min = to_process
 
-                grouped[[_+'_std' for _ in alignment_cols]] = std_
+    library = load_matching_library(library_path)
+    alignment_cols = library['alignment_cols'].tolist()
 
-                std_range = np.nanmedian(std_.values, axis=0)
+    ms_file = alphapept.io.MS_Data_File(file, is_overwritable=True)
+    df = ms_file.read(dataset_name='peptide_fdr')
+    features = ms_file.read(dataset_name='feature_table')
+    features['feature_idx'] = features.index
 
-                lookup_dict = xx.set_index('precursor')[['sequence','sequence_naked','db_idx']].to_dict()
+    matching_set = np.flatnonzero(~np.isin(library['precursor'], df['precursor'].values.astype(str)))
+    logging.info(f'Trying to match file {file} with database of {len(matching_set):,} unidentified candidates')
 
-                for file_to in files_to:
-                    filename = shortnames_lookup[file_to]
-                    file = os.path.splitext(filename)[0] + '.ms_data.hdf'
+    if 'mobility_calib' in alignment_cols:
+        logging.info("Using mobility")
 
-                    df = alphapept.io.MS_Data_File(file).read(dataset_name='peptide_fdr')
-                    features = alphapept.io.MS_Data_File(file).read(dataset_name='feature_table')
-                    features['feature_idx'] = features.index
+    std_range = library['std_range']
 
-                    matching_set = list(set(grouped.index) - set(df['precursor']))
-                    logging.info(f'Trying to match file {file} with database of {len(matching_set):,} unidentified candidates')
+    tree_points = features[alignment_cols].values / std_range
+    query_points = library['coords'][matching_set] / std_range
 
-                    mz_range = std_range[0]
-                    rt_range = std_range[1]
+    matching_tree = KDTree(tree_points, metric="euclidean")
 
-                    tree_points = features[alignment_cols].values
-                    tree_points[:,0] = tree_points[:,0]/mz_range
-                    tree_points[:,1] = tree_points[:,1]/rt_range
+    dist, idx = matching_tree.query(query_points, k=1)
 
-                    query_points = grouped.loc[matching_set][alignment_cols].values
-                    query_points[:,0] = query_points[:,0]/mz_range
-                    query_points[:,1] = query_points[:,1]/rt_range
+    matched = features.iloc[idx[:,0]].reset_index(drop=True)
 
-                    if use_mobility:
-                        logging.info("Using mobility")
-                        i_range = std_range[2]
+    for _ in ['score', 'decoy', 'target']:
+        matched[_] = library[_][matching_set]
 
-                        tree_points[:,2] = tree_points[:,2]/i_range
-                        query_points[:,2] = query_points[:,2]/i_range
+    to_keep = dist[:,0] < match_d_min
 
-                    matching_tree = KDTree(tree_points, metric="euclidean")
+    matched = matched[to_keep]
+    matching_set = matching_set[to_keep]
 
-                    dist, idx = matching_tree.query(query_points, k=1)
+    logging.info(f'{len(matched):,} possible features for matching based on distance of {match_d_min}')
 
-                    matched = features.iloc[idx[:,0]].reset_index(drop=True)
+    matched['matching_p'] = get_probabilities(matched[alignment_cols].values, library['coords'][matching_set], library['std'][matching_set])
+    matched['precursor'] = library['precursor'][matching_set]
 
-                    for _ in extra_cols:
-                        matched[_] = grouped.loc[matching_set, _].values
+    to_keep = matched['matching_p'].values < match_p_min
 
-                    to_keep = dist < match_d_min
+    matched = matched[to_keep]
+    matching_set = matching_set[to_keep]
 
-                    matched = matched[to_keep]
+    logging.info(f'{len(matched):,} possible features for matching based on probability of {match_p_min}')
 
-                    ref = grouped.loc[matching_set][alignment_cols][to_keep]
-                    sigma = std_.loc[matching_set][to_keep]
+    matched['type'] = 'matched'
 
-                    logging.info(f'{len(matched):,} possible features for matching based on distance of {match_d_min}')
+    for _ in ['sequence', 'sequence_naked', 'db_idx']:
+        matched[_] = library[_][matching_set]
 
-                    matched['matching_p'] = [get_probability(matched[alignment_cols], ref, sigma, i) for i in range(len(matched))]
-                    matched['precursor'] = grouped.loc[matching_set][to_keep].index.values
-                    matched['score'] = grouped.loc[matching_set][to_keep]['score'].values
+    df['type'] = 'msms'
+    df['matching_p'] = np.nan
 
-                    matched = matched[matched['matching_p']< match_p_min]
+    shared_columns = list(set(matched.columns).intersection(set(df.columns)))
 
-                    logging.info(f'{len(matched):,} possible features for matching based on probability of {match_p_min}')
+    df_ = pd.concat([df, matched[shared_columns]], ignore_index=True)
 
-                    matched['type'] = 'matched'
+    logging.info(f"Saving {file} - peptide_fdr.")
+    ms_file.write(df_, dataset_name='peptide_fdr')
 
-                    for _ in lookup_dict.keys():
-                        matched[_] = [lookup_dict[_][x] for x in matched['precursor']]
+    return file, len(matched)
 
-                    df['type'] = 'msms'
-                    df['matching_p'] = np.nan
+# This function is a wrapper function and has currently has no unit test 
+# The function will be revised when implementing issue #255: https://github.com/MannLabs/alphapept/issues/255
+def match_datasets(settings:dict, callback:Callable = None):
+    """Match datasets: Wrapper function to match datasets based on a settings file.
+    This implementation uses matching groups but not fractions. 
 
-                    shared_columns = list(set(matched.columns).intersection(set(df.columns)))
+    For each matching group, a reference library is built once and saved to disk. The files of the group are then matched in parallel, with each process memory-mapping the library.
+    
+    Args:
+        settings (dict): Dictionary containg specifications of the run
+        callback (Callable): Callback function to indicate progress.
+    """
 
-                    df_ = pd.concat([df, matched[shared_columns]], ignore_index=True)
+    logging.info(f"Matching datasets.")
+    
+    if len(settings['experiment']['file_paths']) > 2:
+        
+    
+        if settings['experiment']['matching_group'] == []:
+            settings['experiment']['matching_group'] = [0 for _ in settings['experiment']['shortnames']]
+
+        match_p_min = settings['matching']['match_p_min']
+        match_d_min = settings['matching']['match_d_min']
+
+        filenames = settings['experiment']['file_paths']
 
-                    logging.info(f"Saving {file} - peptide_fdr.")
-                    ms_file = alphapept.io.MS_Data_File(file, is_overwritable=True)
+        shortnames_lookup = dict(zip(settings['experiment']['shortnames'], settings['experiment']['file_paths'])) 
 
-                    ms_file.write(df_, dataset_name='peptide_fdr')
+        matching_group = np.array(settings['experiment']['matching_group'])
+        n_matching_group = len(set(matching_group))
+        match_tolerance = settings['matching']['match_group_tol']
+        logging.info(f'A total of {n_matching_group} matching groups set.')
+
+        x = alphapept.utils.assemble_df(
+            settings,
+            field='peptide_fdr',
+            columns=['precursor', 'mz_calib', 'rt_calib', 'mobility', 'mobility_calib', 'score', 'decoy', 'target', 'sequence', 'sequence_naked', 'db_idx']
+        )
+
+        logging.info(f'A total of {len(x):,} peptides for matching in peptide_fdr.')
+
+        alignment_cols = ['mz_calib','rt_calib']
+
+        if 'mobility' in x.columns:
+            alignment_cols += ['mobility_calib']
 
-            else:
-                logging.info(f'Less than 3 datasets present in matching group {group}. Skipping matching.')
+        library_dir = tempfile.mkdtemp(prefix='matching_library_', dir=os.path.dirname(os.path.abspath(filenames[0])))
+
+        try:
+            for group in set(settings['experiment']['matching_group']):
+                logging.info(f'Matching group {group} with a tolerance of {match_tolerance}.')
+                file_index_from = (matching_group <= (group+match_tolerance)) & (matching_group >= (group-match_tolerance))
+                file_index_to = matching_group == group
+                files_from = np.array(settings['experiment']['shortnames'])[file_index_from].tolist()
+                files_to = np.array(settings['experiment']['shortnames'])[file_index_to].tolist()
+                logging.info(f'Matching from {len(files_from)} files to {len(files_to)} files.')
+                logging.info(f'Matching from {files_from} to {files_to}.')
+
+                if len(files_from) > 2:
+                    xx = x[x['shortname'].isin(files_from)]
+
+                    library_path = os.path.join(library_dir, str(group))
+                    n_library = save_matching_library(xx, alignment_cols, library_path)
+                    logging.info(f'Saved reference library with {n_library:,} precursors for matching group {group}.')
+
+                    to_process = [(os.path.splitext(shortnames_lookup[file_to])[0] + '.ms_data.hdf', library_path, match_d_min, match_p_min) for file_to in files_to]
+
+                    n_processes = alphapept.performance.set_worker_count(
+                        worker_count=settings['general']['n_processes'],
+                        set_global=False
+                    )
+                    n_processes = min(n_processes, len(to_process))
+
+                    with alphapept.performance.AlphaPool(n_processes) as p:
+                        max_ = len(to_process)
+                        for i, (file, n_matched) in enumerate(p.imap_unordered(match_file, to_process)):
+                            logging.info(f'Matched {n_matched:,} features in {file}.')
+                            if callback:
+                                callback((i+1)/max_)
+
+                else:
+                    logging.info(f'Less than 3 datasets present in matching group {group}. Skipping matching.')
+        finally:
+            shutil.rmtree(library_dir, ignore_errors=True)
 
     else:
         logging.info('Less than 3 datasets present. Skipping matching.')
@@ -373,12 +373,13 @@ def performance_function(
 # %% ../nbs/12_performance.ipynb 19
 from multiprocessing import Pool
 
-def AlphaPool(process_count: int) -> multiprocessing.Pool:
+def AlphaPool(process_count: int, maxtasksperchild: int = None) -> multiprocessing.Pool:
     """Create a multiprocessing.Pool object.
 
     Args:
         process_count (int): The number of processes.
             If larger than available cores, it is trimmed to the available maximum.
+        maxtasksperchild (int): Number of tasks after which a worker is replaced by a new one. Defaults to None, i.e. workers live as long as the pool.
 
 
     Returns:
@@ -392,4 +393,4 @@ def AlphaPool(process_count: int) -> multiprocessing.Pool:
         new_max = 1
     logging.info(f"AlphaPool was set to {process_count} processes. Setting max to {new_max}.")
 
-    return Pool(new_max)
+    return Pool(new_max, maxtasksperchild=maxtasksperchild)
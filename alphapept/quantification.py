@@ -3,7 +3,7 @@
 # %% auto 0
 __all__ = ['gaussian', 'return_elution_profile', 'simulate_sample_profiles', 'get_total_error', 'normalize_experiment_SLSQP',
            'normalize_experiment_BFGS', 'delayed_normalization', 'generate_dummy_data', 'get_protein_ratios',
-           'triangle_error', 'solve_profile', 'protein_profile', 'protein_profile_parallel',
+           'triangle_error', 'solve_profile', 'protein_profile', 'get_protein_arrays', 'protein_profile_parallel',
            'protein_profile_parallel_ap', 'protein_profile_parallel_mq']
 
 # %% ../nbs/08_quantification.ipynb 6
@@ -492,14 +492,125 @@ def protein_profile(files: list, minimum_ratios: int, chunk:tuple) -> (np.ndarra
 
 
 # %% ../nbs/08_quantification.ipynb 42
+import alphapept.performance
+
+def get_protein_arrays(df: pd.DataFrame, field: str, proteins: list, samples: list) -> (np.ndarray, np.ndarray, np.ndarray):
+    """Pack the peptide intensities of all proteins into arrays, with the peptides of each protein stored consecutively.
+
+    Args:
+        df (pd.DataFrame): Feature table with the columns protein_group, sample_group, precursor and field.
+        field (str): The field containing the quantitative peptide information (i.e. precursor intensities).
+        proteins (list): Proteins in the order of the output.
+        samples (list): Samples in the order of the output.
+
+    Returns:
+        np.ndarray: Indptr to the peptides of each protein.
+        np.ndarray: np.array[:,:] with the summed intensity of each peptide in each sample, nan if not present or zero.
+        np.ndarray: np.array[:,:] that is True if a protein has a peptide in a sample.
+    """
+    grouped = df[[field, 'sample_group','precursor','protein_group']].groupby(['protein_group','sample_group','precursor'])[field].sum().reset_index()
+
+    protein_idx = pd.Categorical(grouped['protein_group'], categories=proteins).codes.astype(np.int64)
+    sample_idx = pd.Categorical(grouped['sample_group'], categories=samples).codes.astype(np.int64)
+
+    grouped['protein_idx'] = protein_idx
+    peptide_idx = grouped.groupby(['protein_idx', 'precursor'], sort=True).ngroup().values
+
+    n_peptides = np.bincount(grouped.drop_duplicates(['protein_idx', 'precursor'])['protein_idx'].values, minlength=len(proteins))
+    indptr = np.zeros(len(proteins) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(n_peptides)
+
+    intensities = np.full((indptr[-1], len(samples)), np.nan)
+    intensities[peptide_idx, sample_idx] = grouped[field].values
+    intensities[intensities == 0] = np.nan
+
+    present = np.zeros((len(proteins), len(samples)), dtype=np.bool_)
+    present[protein_idx, sample_idx] = True
+
+    return indptr, intensities, present
+
+
+@alphapept.performance.performance_function(compilation_mode="numba-multithread")
+def _get_protein_profiles(index: np.ndarray, indptr: np.ndarray, intensities: np.ndarray, present: np.ndarray, minimum_ratios: int, profiles: np.ndarray, pre_lfq: np.ndarray):
+    """Calculate the LFQ profile of a protein.
+
+    The median peptide ratios between all pairs of samples are fitted with a linear least-squares problem in log-space.
+
+    Args:
+        index (np.ndarray): Input index. Note that we are using the performance function so this is a range.
+        indptr (np.ndarray): Indptr to the peptides of each protein.
+        intensities (np.ndarray): Intensities of each peptide in each sample, nan if not present.
+        present (np.ndarray): Boolean array that is True if a protein has a peptide in a sample.
+        minimum_ratios (int): Minimum number of peptide ratios necessary to derive a protein ratio.
+        profiles (np.ndarray): Buffer array to store the LFQ intensities of each protein.
+        pre_lfq (np.ndarray): Buffer array to store the summed intensities of each protein.
+    """
+    signal = intensities[indptr[index]:indptr[index + 1]]
+
+    n_peptides, n_samples = signal.shape
+
+    pre = np.zeros(n_samples)
+    for j in range(n_samples):
+        for k in range(n_peptides):
+            if not np.isnan(signal[k, j]):
+                pre[j] += signal[k, j]
+
+    pre_lfq[index] = pre
+
+    if np.sum(present[index]) <= 1:
+        profiles[index] = pre
+        return
+
+    laplacian = np.zeros((n_samples, n_samples))
+    log_ratios = np.zeros(n_samples)
+    ratio = np.empty(n_peptides)
+
+    for i in range(n_samples):
+        for j in range(i + 1, n_samples):
+            n_ratios = 0
+            for k in range(n_peptides):
+                if not np.isnan(signal[k, i]) and not np.isnan(signal[k, j]):
+                    ratio[n_ratios] = signal[k, j] / signal[k, i]
+                    n_ratios += 1
+
+            if (n_ratios > 0) and (n_ratios >= minimum_ratios):
+                log_ratio = np.log(np.median(ratio[:n_ratios]))
+                laplacian[i, i] += 1
+                laplacian[j, j] += 1
+                laplacian[i, j] -= 1
+                laplacian[j, i] -= 1
+                log_ratios[j] += log_ratio
+                log_ratios[i] -= log_ratio
+
+    valid = np.diag(laplacian) > 0
+
+    if np.sum(valid) == 0:
+        profiles[index] = 0
+        return
+
+    valid_idx = np.where(valid)[0]
+    laplacian_ = laplacian[valid_idx][:, valid_idx].copy()
+    log_ratios_ = log_ratios[valid_idx].copy()
+
+    # The normal equations are singular, the minimum norm solution fixes the mean of each connected set of samples
+    solution = np.linalg.lstsq(laplacian_, log_ratios_, 1e-10)[0]
+    solution = np.exp(solution - np.max(solution))
+
+    profile = np.zeros(n_samples)
+    profile[valid_idx] = solution * np.sum(pre) / np.sum(solution)
+
+    profiles[index] = profile
+
+# %% ../nbs/08_quantification.ipynb 45
 import os
 import alphapept.performance
-from functools import partial
 
-# This function invokes a parallel pool and has therfore no dedicated test in the notebook
+# This function is a wrapper function and has therfore no dedicated test in the notebook
 def protein_profile_parallel(df: pd.DataFrame, minimum_ratios: int, field: str, callback=None) -> pd.DataFrame:
     """Derives LFQ intensities from the feature table.
 
+    The peptide intensities are packed into arrays once and the profiles of all proteins are solved in parallel, see _get_protein_profiles.
+
     Args:
         df (pd.DataFrame): Feature table by alphapept.
         minimum_ratios (int): Minimum number of peptide ratios necessary to derive a protein ratio.
@@ -515,44 +626,27 @@ def protein_profile_parallel(df: pd.DataFrame, minimum_ratios: int, field: str,
     samples.sort()
     
     columnes_ext = [_+'_LFQ' for _ in samples]
-    protein_table = pd.DataFrame(index=unique_proteins, columns=columnes_ext + samples)
 
-    # Used to be max, now sum() (to group fractions)
-    grouped = df[[field, 'sample_group','precursor','protein_group']].groupby(['protein_group','sample_group','precursor']).sum()
-    
-    
-    results = []
-    
     if len(samples) > 1:
         logging.info('Preparing protein table for parallel processing.')
-        split_df = []
-        
-        for idx, protein in enumerate(unique_proteins):
-            split_df.append((grouped.loc[protein], protein))
-            if callback:
-                callback((idx+1)/len(unique_proteins)*1/5)
-        
-        results = []
-
-        logging.info(f'Starting protein extraction for {len(split_df)} proteins.')
-        n_processes = alphapept.performance.set_worker_count(
-            worker_count=0,
-            set_global=False
-        )
-        with alphapept.performance.AlphaPool(n_processes) as p:
-            max_ = len(split_df)
-            for i, _ in enumerate(p.imap_unordered(partial(protein_profile, samples, minimum_ratios), split_df)):
-                results.append(_)
-                
-                if not _[-1]:
-                    logging.info(f'LFQ profile extraction for protein {_[-2]} did not converge. Setting to zero.')
-                if callback:
-                    callback((i+1)/max_*4/5+1/5)
 
-        for result in results:
-            profile, pre_lfq, protein, success = result
-            protein_table.loc[protein, [_+'_LFQ' for _ in samples]] = profile
-            protein_table.loc[protein, samples] = pre_lfq
+        # Used to be max, now sum() (to group fractions)
+        indptr, intensities, present = get_protein_arrays(df, field, unique_proteins, samples)
+
+        if callback:
+            callback(1/5)
+
+        logging.info(f'Starting protein extraction for {len(unique_proteins)} proteins.')
+
+        profiles = np.zeros((len(unique_proteins), len(samples)))
+        pre_lfq = np.zeros((len(unique_proteins), len(samples)))
+
+        _get_protein_profiles(range(len(unique_proteins)), indptr, intensities, present, minimum_ratios, profiles, pre_lfq)
+
+        if callback:
+            callback(1)
+
+        protein_table = pd.DataFrame(np.hstack([profiles, pre_lfq]), index=unique_proteins, columns=columnes_ext + samples)
 
         protein_table[protein_table == 0] = np.nan
         protein_table = protein_table.astype('float')
@@ -567,7 +661,7 @@ def protein_profile_parallel(df: pd.DataFrame, minimum_ratios: int, field: str,
         
     return protein_table
 
-# %% ../nbs/08_quantification.ipynb 43
+# %% ../nbs/08_quantification.ipynb 46
 # This function invokes a parallel pool and has therfore no dedicated test in the notebook
 def protein_profile_parallel_ap(settings: dict, df : pd.DataFrame, callback=None) -> pd.DataFrame:
     """Derives protein LFQ intensities from the alphapept quantified feature table
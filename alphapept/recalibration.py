@@ -408,9 +408,10 @@ def calibrate_fragments_nn(ms_file_, file_name, settings):
 
             #Read required datasets
 
-            rt_list_ms2 = ms_file_.read_DDA_query_data()['rt_list_ms2']
-            mass_list_ms2 = ms_file_.read_DDA_query_data()['mass_list_ms2']
-            incides_ms2 = ms_file_.read_DDA_query_data()['indices_ms2']
+            query_data = ms_file_.read_DDA_query_data()
+            rt_list_ms2 = query_data['rt_list_ms2']
+            mass_list_ms2 = query_data['mass_list_ms2']
+            incides_ms2 = query_data['indices_ms2']
             scan_idx = np.searchsorted(incides_ms2, np.arange(len(mass_list_ms2)), side='right') - 1
 
             #Estimate offset
@@ -481,58 +482,59 @@ def calibrate_hdf(
         ms_file = base_file_name+".ms_data.hdf"
         ms_file_ = alphapept.io.MS_Data_File(ms_file, is_overwritable=True)
 
-        features = ms_file_.read(dataset_name='features')
+        with ms_file_.session(mode='a'):
+            features = ms_file_.read(dataset_name='features')
 
-        try:
-            psms =  ms_file_.read(dataset_name='first_search')
-        except KeyError: #no elements in search
-            psms = pd.DataFrame()
+            try:
+                psms =  ms_file_.read(dataset_name='first_search')
+            except KeyError: #no elements in search
+                psms = pd.DataFrame()
             
-        df = None
-
-        if len(psms) > 0 :
-            df = score_generic(
-                psms,
-                fdr_level=settings["search"]["peptide_fdr"],
-                plot=False,
-                verbose=False,
-                **settings["search"]
-            )
-            logging.info(f'Precursor mass calibration for file {file_name}.')
-            corrected_mass, prec_offset_ppm_std, prec_offset_ppm_mad = get_calibration(
-                df,
-                features,
-                file_name,
-                settings,
-                **settings["calibration"]
-            )
-            ms_file_.write(
-                corrected_mass,
-                dataset_name="corrected_mass",
-                group_name="features"
-            )
-        else:
+            df = None
+
+            if len(psms) > 0 :
+                df = score_generic(
+                    psms,
+                    fdr_level=settings["search"]["peptide_fdr"],
+                    plot=False,
+                    verbose=False,
+                    **settings["search"]
+                )
+                logging.info(f'Precursor mass calibration for file {file_name}.')
+                corrected_mass, prec_offset_ppm_std, prec_offset_ppm_mad = get_calibration(
+                    df,
+                    features,
+                    file_name,
+                    settings,
+                    **settings["calibration"]
+                )
+                ms_file_.write(
+                    corrected_mass,
+                    dataset_name="corrected_mass",
+                    group_name="features"
+                )
+            else:
+
+                ms_file_.write(
+                    features['mass_matched'],
+                    dataset_name="corrected_mass",
+                    group_name="features"
+                )
+
+                prec_offset_ppm_std = 0
 
             ms_file_.write(
-                features['mass_matched'],
+                prec_offset_ppm_std,
                 dataset_name="corrected_mass",
-                group_name="features"
+                group_name="features",
+                attr_name="estimated_max_precursor_ppm"
             )
-
-            prec_offset_ppm_std = 0
-
-        ms_file_.write(
-            prec_offset_ppm_std,
-            dataset_name="corrected_mass",
-            group_name="features",
-            attr_name="estimated_max_precursor_ppm"
-        )
-        logging.info(f'Precursor calibration of file {ms_file} complete.')
+            logging.info(f'Precursor calibration of file {ms_file} complete.')
 
 
-        # Calibration of fragments
-        calibrate_fragments_nn(ms_file_, file_name, settings)
-        logging.info(f'Fragment calibration of file {ms_file} complete.')
+            # Calibration of fragments
+            calibrate_fragments_nn(ms_file_, file_name, settings)
+            logging.info(f'Fragment calibration of file {ms_file} complete.')
 
 
 
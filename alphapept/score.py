@@ -1,11 +1,14 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/06_score.ipynb.
 
 # %% auto 0
-__all__ = ['ion_dict', 'filter_score', 'filter_precursor', 'get_q_values', 'cut_fdr', 'cut_global_fdr', 'get_x_tandem_score',
-           'score_x_tandem', 'get_generic_score', 'score_generic', 'filter_with_x_tandem', 'filter_with_score',
-           'score_psms', 'get_ML_features', 'train_RF', 'score_ML', 'filter_with_ML', 'assign_proteins',
-           'get_shared_proteins', 'get_protein_groups', 'perform_protein_grouping', 'get_ion', 'ecdf', 'score_hdf',
-           'protein_grouping_all']
+__all__ = ['ML_EXCLUDE_FEATURES', 'ion_dict', 'filter_score', 'filter_precursor', 'get_q_values', 'get_fdr', 'get_cutoff_index',
+           'get_best_analytes', 'get_fdr_mask', 'cut_fdr', 'cut_global_fdr', 'get_x_tandem_score', 'score_x_tandem',
+           'get_generic_score', 'score_generic', 'filter_with_x_tandem', 'filter_with_score', 'score_psms',
+           'get_sequence_features', 'get_ML_features', 'get_training_psms', 'fit_RF', 'train_RF', 'score_ML',
+           'filter_with_ML', 'get_possible_proteins', 'assign_proteins', 'get_shared_proteins', 'get_protein_groups',
+           'perform_protein_grouping', 'get_ion', 'get_fragment_ion_indices', 'get_ion_labels', 'get_ions', 'ecdf',
+           'get_feature_hash', 'get_ML_model_path', 'save_ML_model', 'load_ML_model', 'read_search_psms',
+           'get_pooled_training_psms', 'train_experiment_RF', 'score_hdf', 'protein_grouping_all']
 
 # %% ../nbs/06_score.ipynb 4
 import numpy as np
@@ -103,7 +106,163 @@ def get_q_values(fdr_values: np.ndarray) -> np.ndarray:
 
     return q_values
 
-# %% ../nbs/06_score.ipynb 13
+# %% ../nbs/06_score.ipynb 14
+def get_fdr(scores: np.ndarray, decoys: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray):
+    """
+    Target-decoy competition on arrays. Entries are sorted by decreasing score with decoys first for equal scores.
+
+    Args:
+        scores (np.ndarray): scores, higher is better.
+        decoys (np.ndarray): boolean array that is True for decoys.
+
+    Returns:
+        np.ndarray: order that sorts the entries.
+        np.ndarray: cumulative number of targets in sorted order.
+        np.ndarray: cumulative number of decoys in sorted order.
+        np.ndarray: fdr values in sorted order.
+        np.ndarray: q-values in sorted order.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    decoys = np.asarray(decoys, dtype=bool)
+
+    order = np.lexsort((~decoys, -scores))
+
+    target_cum = np.cumsum(~decoys[order])
+    decoys_cum = np.cumsum(decoys[order])
+
+    with np.errstate(divide='ignore'):
+        fdr_values = decoys_cum / target_cum
+
+    q_values = get_q_values(fdr_values)
+
+    return order, target_cum, decoys_cum, fdr_values, q_values
+
+
+def get_cutoff_index(q_values: np.ndarray, fdr_level: float=0.01) -> int:
+    """
+    Get the index of the last entry within the fdr_level.
+
+    Args:
+        q_values (np.ndarray): q-values sorted by decreasing score, see get_fdr.
+        fdr_level (float, optional): fdr level that should be used for filtering. Defaults to 0.01.
+
+    Returns:
+        int: index of the last entry within the fdr_level.
+    """
+    last_q_value = q_values[-1]
+    first_q_value = q_values[0]
+
+    if last_q_value <= fdr_level:
+        logging.info('Last q_value {:.3f} of dataset is smaller than fdr_level {:.3f}'.format(last_q_value, fdr_level))
+        cutoff_index = len(q_values)-1
+
+    elif first_q_value >= fdr_level:
+        logging.info('First q_value {:.3f} of dataset is larger than fdr_level {:.3f}'.format(last_q_value, fdr_level))
+        cutoff_index = 0
+
+    else:
+        cutoff_index = int(np.argmax(q_values > fdr_level)) - 1
+
+    return cutoff_index
+
+
+def get_best_analytes(scores: np.ndarray, decoys: np.ndarray, group_ids: np.ndarray, run_ids: np.ndarray=None, picked: bool=False) -> (np.ndarray, np.ndarray):
+    """
+    Get the best scoring entry of each analyte.
+    An analyte is a group id with its decoy state or, for picked target-decoy competition, a group id only.
+
+    Args:
+        scores (np.ndarray): scores, higher is better.
+        decoys (np.ndarray): boolean array that is True for decoys.
+        group_ids (np.ndarray): integer id of the group of each entry, e.g. from pd.factorize. Entries with negative ids are ignored.
+        run_ids (np.ndarray, optional): integer id of the run of each entry. If set, analytes are separate for each run. Defaults to None.
+        picked (bool, optional): flag for picked target-decoy competition, where targets and decoys with the same group id are one analyte. Defaults to False.
+
+    Returns:
+        np.ndarray: index of the best entry of each analyte, sorted by run, group id and decoy state.
+        np.ndarray: analyte of each entry, -1 for ignored entries.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    decoys = np.asarray(decoys, dtype=bool)
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+
+    if run_ids is None:
+        run_ids = np.zeros(len(scores), dtype=np.int64)
+
+    keys = [np.asarray(run_ids), group_ids]
+    if not picked:
+        keys.append(decoys)
+
+    valid = np.flatnonzero(group_ids >= 0)
+    order = valid[np.lexsort([~decoys[valid], -scores[valid]] + [_[valid] for _ in keys[::-1]])]
+
+    first = np.zeros(len(order), dtype=bool)
+    first[:1] = True
+    for key in keys:
+        key = key[order]
+        first[1:] |= key[1:] != key[:-1]
+
+    analytes = np.full(len(scores), -1, dtype=np.int64)
+    analytes[order] = np.cumsum(first) - 1
+
+    return order[first], analytes
+
+
+def get_fdr_mask(scores: np.ndarray, decoys: np.ndarray, fdr_level: float=0.01, group_ids: np.ndarray=None, run_ids: np.ndarray=None, picked: bool=False) -> np.ndarray:
+    """
+    Filter entries with a given fdr level without creating dataframes.
+
+    Args:
+        scores (np.ndarray): scores, higher is better.
+        decoys (np.ndarray): boolean array that is True for decoys.
+        fdr_level (float, optional): fdr level that should be used for filtering. The value should lie between 0 and 1. Defaults to 0.01.
+        group_ids (np.ndarray, optional): integer id of the analyte of each entry, e.g. precursor or protein group. If set, the fdr is estimated on the best entry of each analyte and all entries of the analytes within fdr are kept. Defaults to None.
+        run_ids (np.ndarray, optional): integer id of the run of each entry. If set, the fdr is estimated for each run separately (run-specific), otherwise across all runs (global). Defaults to None.
+        picked (bool, optional): flag for picked target-decoy competition. Targets and decoys with the same group id compete and only the better one is kept. Defaults to False.
+
+    Returns:
+        np.ndarray: boolean mask that is True for entries within the fdr_level.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    decoys = np.asarray(decoys, dtype=bool)
+
+    if group_ids is not None:
+        best, analytes = get_best_analytes(scores, decoys, group_ids, run_ids=run_ids, picked=picked)
+        analyte_mask = get_fdr_mask(scores[best], decoys[best], fdr_level, run_ids=None if run_ids is None else np.asarray(run_ids)[best])
+
+        mask = analytes >= 0
+        mask[mask] = analyte_mask[analytes[mask]]
+        if picked:
+            mask[mask] = decoys[mask] == decoys[best][analytes[mask]]
+
+        return mask
+
+    elif picked:
+        raise ValueError('Picked target-decoy competition requires group_ids.')
+
+    if run_ids is None:
+        runs = [np.arange(len(scores))]
+    else:
+        run_ids = np.asarray(run_ids)
+        run_order = np.argsort(run_ids, kind='stable')
+        runs = np.split(run_order, np.flatnonzero(np.diff(run_ids[run_order])) + 1)
+
+    mask = np.zeros(len(scores), dtype=bool)
+    for idx in runs:
+        if len(idx) == 0:
+            continue
+
+        order, target_cum, decoys_cum, fdr_values, q_values = get_fdr(scores[idx], decoys[idx])
+        cutoff_index = get_cutoff_index(q_values, fdr_level)
+        cutoff_value = scores[idx[order[cutoff_index]]]
+
+        logging.info(f"{target_cum[cutoff_index]:,} target ({decoys_cum[cutoff_index]:,} decoy) of {len(idx):,} PSMs. FDR {fdr_values[cutoff_index]:.6f} for a cutoff of {cutoff_value:.2f} (set FDR was {fdr_level}).")
+
+        mask[idx] = scores[idx] >= cutoff_value
+
+    return mask
+
+# %% ../nbs/06_score.ipynb 15
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -127,40 +286,30 @@ def cut_fdr(df: pd.DataFrame, fdr_level:float=0.01, plot:bool=True, cut:bool=Tru
 
     df["target"] = ~df["decoy"]
 
-    df = df.sort_values(by=["score","decoy"], ascending=False)
-    df = df.reset_index()
-
-    df["target_cum"] = np.cumsum(df["target"])
-    df["decoys_cum"] = np.cumsum(df["decoy"])
-
-    df["fdr"] = df["decoys_cum"] / df["target_cum"]
-    df["q_value"] = get_q_values(df["fdr"].values)
+    order, target_cum, decoys_cum, fdr_values, q_values = get_fdr(df["score"].values, df["decoy"].values)
 
-    last_q_value = df["q_value"].iloc[-1]
-    first_q_value = df["q_value"].iloc[0]
+    df = df.iloc[order]
+    df = df.reset_index()
 
-    if last_q_value <= fdr_level:
-        logging.info('Last q_value {:.3f} of dataset is smaller than fdr_level {:.3f}'.format(last_q_value, fdr_level))
-        cutoff_index = len(df)-1
+    df["target_cum"] = target_cum
+    df["decoys_cum"] = decoys_cum
 
-    elif first_q_value >= fdr_level:
-        logging.info('First q_value {:.3f} of dataset is larger than fdr_level {:.3f}'.format(last_q_value, fdr_level))
-        cutoff_index = 0
+    df["fdr"] = fdr_values
+    df["q_value"] = q_values
 
-    else:
-        cutoff_index = df[df["q_value"].gt(fdr_level)].index[0] - 1
+    cutoff_index = get_cutoff_index(q_values, fdr_level)
 
-    cutoff_value = df.loc[cutoff_index]["score"]
+    cutoff_value = df["score"].values[cutoff_index]
     
     if cut:
         cutoff = df[df["score"] >= cutoff_value]
     else:
         cutoff= df
 
-    targets = df.loc[cutoff_index, "target_cum"]
-    decoy = df.loc[cutoff_index, "decoys_cum"]
+    targets = target_cum[cutoff_index]
+    decoy = decoys_cum[cutoff_index]
 
-    fdr = df.loc[cutoff_index, "fdr"]
+    fdr = fdr_values[cutoff_index]
 
     
     logging.info(f"{targets:,} target ({decoy:,} decoy) of {len(df):,} PSMs. FDR {fdr:.6f} for a cutoff of {cutoff_value:.2f} (set FDR was {fdr_level}).")
@@ -191,8 +340,8 @@ def cut_fdr(df: pd.DataFrame, fdr_level:float=0.01, plot:bool=True, cut:bool=Tru
     cutoff = cutoff.reset_index(drop=True)
     return cutoff_value, cutoff
 
-# %% ../nbs/06_score.ipynb 30
-def cut_global_fdr(data: pd.DataFrame, analyte_level: str='sequence', fdr_level: float=0.01, plot: bool=True, **kwargs) -> pd.DataFrame:
+# %% ../nbs/06_score.ipynb 32
+def cut_global_fdr(data: pd.DataFrame, analyte_level: str='sequence', fdr_level: float=0.01, plot: bool=True, run_level: str=None, **kwargs) -> pd.DataFrame:
     """
     Function to estimate and filter by global peptide or protein fdr
     
@@ -201,35 +350,60 @@ def cut_global_fdr(data: pd.DataFrame, analyte_level: str='sequence', fdr_level:
         analyte_level (str, optional): string specifying the analyte level to apply the fdr threshold. Options include: 'precursor', 'sequence', 'protein_group' and 'protein'. Defaults to 'sequence'.
         fdr_level (float, optional): fdr level that should be used for filtering. The value should lie between 0 and 1. Defaults to 0.01.
         plot (bool, optional): flag to enable plot. Defaults to 'True'.
+        run_level (str, optional): column with the run of each psm, e.g. 'filename'. If set, the fdr is estimated for each run separately instead of across the entire dataset. Defaults to None.
 
     Returns:
         pd.DataFrame: df with filtered results
 
     """
     logging.info('Global FDR on {}'.format(analyte_level))
-    data_sub = data[[analyte_level,'score','decoy']]
-    data_sub_unique = data_sub.groupby([analyte_level,'decoy'], as_index=False).agg({"score": "max"})
 
     analyte_levels = ['precursor', 'sequence', 'protein_group','protein']
 
-    if analyte_level in analyte_levels:
-        agg_score = data_sub_unique.groupby([analyte_level,'decoy'])['score'].max().reset_index()
-    else:
+    if analyte_level not in analyte_levels:
         raise Exception('analyte_level should be either sequence or protein. The selected analyte_level was: {}'.format(analyte_level))
 
-    agg_cval, agg_cutoff = cut_fdr(agg_score, fdr_level=fdr_level, plot=plot)
-    
-    logging.info(f'Global FDR cutoff at {agg_cval:.3f}.')
-
-    agg_report = data.reset_index().merge(
-                        agg_cutoff,
-                        how = 'inner',
-                        on = [analyte_level,'decoy'],
-                        suffixes=('', '_'+analyte_level),
-                        validate="many_to_one").set_index('index') #retain the original index
+    # Only the score and decoy arrays are used, sorted group ids give the analytes in the order of a groupby
+    group_ids = pd.factorize(data[analyte_level], sort=True)[0]
+    run_ids = None if run_level is None else pd.factorize(data[run_level], sort=True)[0]
+    scores = data['score'].values
+    decoys = data['decoy'].values.astype(bool)
+
+    best, analytes = get_best_analytes(scores, decoys, group_ids, run_ids=run_ids)
+    agg_score = pd.DataFrame({'score': scores[best], 'decoy': decoys[best]})
+
+    if run_ids is None:
+        agg_cval, agg_cutoff = cut_fdr(agg_score, fdr_level=fdr_level, plot=plot)
+
+        logging.info(f'Global FDR cutoff at {agg_cval:.3f}.')
+    else:
+        agg_cutoffs = []
+        for run_id, agg_score_ in agg_score.groupby(run_ids[best]):
+            agg_cval, agg_cutoff = cut_fdr(agg_score_, fdr_level=fdr_level, plot=plot)
+            agg_cutoffs.append(agg_cutoff)
+
+            logging.info(f'FDR cutoff for run {run_id} at {agg_cval:.3f}.')
+        agg_cutoff = pd.concat(agg_cutoffs, ignore_index=True)
+
+    # The index column of agg_cutoff is the analyte
+    rows = np.full(len(best), -1, dtype=np.int64)
+    rows[agg_cutoff['index'].values] = np.arange(len(agg_cutoff))
+
+    mask = analytes >= 0
+    mask[mask] = rows[analytes[mask]] >= 0
+    rows = rows[analytes[mask]]
+
+    columns = {}
+    for column in agg_cutoff.columns.drop('decoy'):
+        name = column + '_' + analyte_level if column in data.columns or column == 'index' else column
+        columns[name] = agg_cutoff[column].values[rows]
+
+    agg_report = data[mask].assign(**columns)
+
     return agg_report
 
-# %% ../nbs/06_score.ipynb 42
+# %% ../nbs/06_score.ipynb 44
+import math
 import networkx as nx
 
 def get_x_tandem_score(df: pd.DataFrame) -> np.ndarray:
@@ -243,9 +417,14 @@ def get_x_tandem_score(df: pd.DataFrame) -> np.ndarray:
         np.ndarray: np.ndarray with x_tandem scores
 
     """
-    b = df['hits_b'].astype('int').apply(lambda x: np.math.factorial(x)).values
-    y = df['hits_y'].astype('int').apply(lambda x: np.math.factorial(x)).values
-    x_tandem = np.log(b.astype('float')*y.astype('float')*df['fragments_matched_int_sum'].values)
+    hits_b = df['hits_b'].values.astype('int')
+    hits_y = df['hits_y'].values.astype('int')
+
+    # Lookup table so that each factorial is only calculated once
+    n_max = max(hits_b.max(initial=0), hits_y.max(initial=0))
+    factorials = np.array([float(math.factorial(_)) for _ in range(n_max + 1)])
+
+    x_tandem = np.log(factorials[hits_b]*factorials[hits_y]*df['fragments_matched_int_sum'].values)
 
     x_tandem[x_tandem==-np.inf] = 0
 
@@ -355,7 +534,7 @@ def filter_with_score(df: pd.DataFrame):
 
     return df
 
-# %% ../nbs/06_score.ipynb 45
+# %% ../nbs/06_score.ipynb 47
 def score_psms(df: pd.DataFrame, score: str='hits_y', fdr_level: float=0.01, plot: bool=True, **kwargs) -> pd.DataFrame:
     """
     Uses the specified score in df to filter psms and to apply the fdr_level threshold.
@@ -382,7 +561,7 @@ def score_psms(df: pd.DataFrame, score: str='hits_y', fdr_level: float=0.01, plo
 
     return cutoff
 
-# %% ../nbs/06_score.ipynb 48
+# %% ../nbs/06_score.ipynb 50
 import numpy as np
 import pandas as pd
 import sys
@@ -399,6 +578,37 @@ import matplotlib.pyplot as plt
 from .fasta import count_missed_cleavages, count_internal_cleavages
 
 
+def get_sequence_features(sequences: np.ndarray, protease: str='trypsin') -> pd.DataFrame:
+    """
+    Calculates the sequence-dependent features once per unique sequence and maps them back to all sequences.
+
+    Args:
+        sequences (np.ndarray): array of (modified) peptide sequences.
+        protease (str, optional): string specifying the protease that was used for proteolytic digestion. Defaults to 'trypsin'.
+
+    Returns:
+        pd.DataFrame: dataframe with the columns decoy, sequence_naked, n_AA, n_missed and n_internal, aligned with sequences.
+
+    """
+    codes, unique_sequences = pd.factorize(sequences)
+
+    decoy = np.array([_[-1].islower() for _ in unique_sequences], dtype=bool)
+    sequence_naked = np.array([''.join([_ for _ in x if _.isupper()]) for x in unique_sequences], dtype=object)
+    n_AA = np.array([len(_) for _ in sequence_naked], dtype=np.int64)
+    n_missed = np.array([count_missed_cleavages(_, protease) for _ in sequence_naked], dtype=np.int64)
+    n_internal = np.array([count_internal_cleavages(_, protease) for _ in sequence_naked], dtype=np.int64)
+
+    sequence_features = pd.DataFrame({
+        'decoy': decoy[codes],
+        'sequence_naked': sequence_naked[codes],
+        'n_AA': n_AA[codes],
+        'n_missed': n_missed[codes],
+        'n_internal': n_internal[codes],
+    })
+
+    return sequence_features
+
+
 def get_ML_features(df: pd.DataFrame, protease: str='trypsin', **kwargs) -> pd.DataFrame:
     """
     Uses the specified score in df to filter psms and to apply the fdr_level threshold.
@@ -411,15 +621,17 @@ def get_ML_features(df: pd.DataFrame, protease: str='trypsin', **kwargs) -> pd.D
         pd.DataFrame: df including additional scores for subsequent ML. 
 
     """
-    df['decoy'] = df['sequence'].str[-1].str.islower()
+    sequence_features = get_sequence_features(df['sequence'].values, protease)
+
+    df['decoy'] = sequence_features['decoy'].values
 
     df['delta_m_ppm_abs'] = np.abs(df['delta_m_ppm'])
-    df['sequence_naked'] = df['sequence'].apply(lambda x: ''.join([_ for _ in x if _.isupper()]))
-    df['n_AA']= df['sequence_naked'].str.len()
+    df['sequence_naked'] = sequence_features['sequence_naked'].values
+    df['n_AA']= sequence_features['n_AA'].values
     df['fragments_matched_n_ratio'] = df['hits']/(2*df['n_AA'])
 
-    df['n_missed'] = df['sequence_naked'].apply(lambda x: count_missed_cleavages(x, protease))
-    df['n_internal'] = df['sequence_naked'].apply(lambda x: count_internal_cleavages(x, protease))
+    df['n_missed'] = sequence_features['n_missed'].values
+    df['n_internal'] = sequence_features['n_internal'].values
     
     df['x_tandem'] = get_x_tandem_score(df)
     df['generic_score'] = get_generic_score(df)
@@ -427,55 +639,28 @@ def get_ML_features(df: pd.DataFrame, protease: str='trypsin', **kwargs) -> pd.D
     return df
 
 
-def train_RF(df: pd.DataFrame,
-             exclude_features: list = ['precursor_idx', 'fragment_ion_idx', 'fasta_index', 'feature_rank', 'raw_rank',
-                                       'score_rank', 'db_idx', 'feature_idx', 'precursor', 'query_idx', 'raw_idx',
-                                       'sequence', 'decoy', 'sequence_naked', 'target'],
-             train_fdr_level: float = 0.1,
-             ini_score: str = 'hits',
-             min_train: int = 1000,
-             test_size: float = 0.8,
-             max_depth: list = [5, 25, 50],
-             max_leaf_nodes: list = [150, 200, 250],
-             n_jobs: int = -1,
-             scoring: str = 'accuracy',
-             plot: bool = False,
-             random_state: int = 42,
-             **kwargs) -> (GridSearchCV, list):
+ML_EXCLUDE_FEATURES = ['precursor_idx', 'fragment_ion_idx', 'fasta_index', 'feature_rank', 'raw_rank',
+                       'score_rank', 'db_idx', 'feature_idx', 'precursor', 'query_idx', 'raw_idx',
+                       'sequence', 'decoy', 'sequence_naked', 'target']
+
+
+def get_training_psms(df: pd.DataFrame,
+                      train_fdr_level: float = 0.1,
+                      ini_score: str = 'hits',
+                      random_state: int = 42) -> pd.DataFrame:
     """
-    Function to train a random forest classifier to separate targets from decoys via semi-supervised learning.
+    Selects a balanced set of high scoring targets and decoys for semi-supervised learning.
 
     Args:
         df (pd.DataFrame): psms table of search results from alphapept.
-        exclude_features (list, optional): list with column names of features to exclude for ML. Defaults to ['precursor_idx','fragment_ion_idx','fasta_index','feature_rank','raw_rank','score_rank','db_idx', 'feature_idx', 'precursor', 'query_idx', 'raw_idx','sequence','decoy','sequence_naked','target'].
         train_fdr_level (float, optional): Only targets below the train_fdr_level cutoff are considered for training the classifier. Defaults to 0.1.
-        ini_score (str, optional): Initial score to select psms set for semi-supervised learning. Defaults to 'x_tandem'.
-        min_train (int, optional): Minimum number of psms in the training set. Defaults to 1000.
-        test_size (float, optional): Fraction of psms used for testing. Defaults to 0.8.
-        max_depth (list, optional): List of clf__max_depth parameters to test in the grid search. Defaults to [5,25,50].
-        max_leaf_nodes (list, optional): List of clf__max_leaf_nodes parameters to test in the grid search. Defaults to [150,200,250].
-        n_jobs (int, optional): Number of jobs to use for parallelizing the gridsearch. Defaults to -1, which in GridSearchCV corresponds to 'use all available cores'.
-        scoring (str, optional): Scoring method for the gridsearch. Defaults to 'accuracy'.
-        plot (bool, optional): flag to enable plot. Defaults to 'False'.
-        random_state (int, optional): Random state for initializing the RandomForestClassifier. Defaults to 42.
+        ini_score (str, optional): Initial score to select psms set for semi-supervised learning. Defaults to 'hits'.
+        random_state (int, optional): Random state for sampling the psms. Defaults to 42.
 
     Returns:
-        [GridSearchCV, list]: GridSearchCV: GridSearchCV object with trained RandomForestClassifier. list: list of features used for training the classifier.
+        pd.DataFrame: psms table with the same number of high scoring targets and decoys.
 
     """
-
-    features = [col for col in df.columns if col not in exclude_features]
-
-    # Setup ML pipeline
-    scaler = StandardScaler()
-    rfc = RandomForestClassifier(random_state=random_state)  # class_weight={False:1,True:5},
-    ## Initiate scaling + classification pipeline
-    pipeline = Pipeline([('scaler', scaler), ('clf', rfc)])
-    parameters = {'clf__max_depth': max_depth, 'clf__max_leaf_nodes': max_leaf_nodes}
-    ## Setup grid search framework for parameter selection and internal cross validation
-    cv = GridSearchCV(pipeline, param_grid=parameters, cv=5, scoring=scoring,
-                      verbose=0, return_train_score=True, n_jobs=_get_limited_n_jobs(n_jobs))
-
     # Prepare target and decoy df
     df['decoy'] = df['sequence'].str[-1].str.islower()
     df['target'] = ~df['decoy']
@@ -486,8 +671,8 @@ def train_RF(df: pd.DataFrame,
     # Select high scoring targets (<= train_fdr_level)
     df_prescore = filter_score(df)
     df_prescore = filter_precursor(df_prescore)
-    scored = cut_fdr(df_prescore, fdr_level=train_fdr_level, plot=False)[1]
-    highT = scored[scored.decoy == False]
+    scored = get_fdr_mask(df_prescore['score'].values, df_prescore['decoy'].values, fdr_level=train_fdr_level)
+    highT = df_prescore[scored & ~df_prescore['decoy'].values]
     dfT_high = dfT[dfT['query_idx'].isin(highT.query_idx)]
     dfT_high = dfT_high[dfT_high['db_idx'].isin(highT.db_idx)]
 
@@ -496,13 +681,57 @@ def train_RF(df: pd.DataFrame,
     if dfD.shape[0] < n_train:
         n_train = int(dfD.shape[0])
         logging.info("The total number of available decoys is lower than the initial set of high scoring targets.")
-    if n_train < min_train:
-        raise ValueError("There are fewer high scoring targets or decoys than required by 'min_train'.")
 
     # Subset the targets and decoys datasets to result in a balanced dataset
     df_training = pd.concat(
         [dfT_high.sample(n=n_train, random_state=random_state), dfD.sample(n=n_train, random_state=random_state)])
 
+    return df_training
+
+
+def fit_RF(df_training: pd.DataFrame,
+           features: list,
+           min_train: int = 1000,
+           test_size: float = 0.8,
+           max_depth: list = [5, 25, 50],
+           max_leaf_nodes: list = [150, 200, 250],
+           n_jobs: int = -1,
+           scoring: str = 'accuracy',
+           plot: bool = False,
+           random_state: int = 42) -> GridSearchCV:
+    """
+    Function to fit a random forest classifier on a balanced set of targets and decoys.
+
+    Args:
+        df_training (pd.DataFrame): psms table with targets and decoys, e.g. from get_training_psms.
+        features (list): list of features used for training the classifier.
+        min_train (int, optional): Minimum number of psms in the training set. Defaults to 1000.
+        test_size (float, optional): Fraction of psms used for testing. Defaults to 0.8.
+        max_depth (list, optional): List of clf__max_depth parameters to test in the grid search. Defaults to [5,25,50].
+        max_leaf_nodes (list, optional): List of clf__max_leaf_nodes parameters to test in the grid search. Defaults to [150,200,250].
+        n_jobs (int, optional): Number of jobs to use for parallelizing the gridsearch. Defaults to -1, which in GridSearchCV corresponds to 'use all available cores'.
+        scoring (str, optional): Scoring method for the gridsearch. Defaults to 'accuracy'.
+        plot (bool, optional): flag to enable plot. Defaults to 'False'.
+        random_state (int, optional): Random state for initializing the RandomForestClassifier. Defaults to 42.
+
+    Returns:
+        GridSearchCV: GridSearchCV object with trained RandomForestClassifier.
+
+    """
+    # Setup ML pipeline
+    scaler = StandardScaler()
+    rfc = RandomForestClassifier(random_state=random_state)  # class_weight={False:1,True:5},
+    ## Initiate scaling + classification pipeline
+    pipeline = Pipeline([('scaler', scaler), ('clf', rfc)])
+    parameters = {'clf__max_depth': max_depth, 'clf__max_leaf_nodes': max_leaf_nodes}
+    ## Setup grid search framework for parameter selection and internal cross validation
+    cv = GridSearchCV(pipeline, param_grid=parameters, cv=5, scoring=scoring,
+                      verbose=0, return_train_score=True, n_jobs=_get_limited_n_jobs(n_jobs))
+
+    n_train = min(int(df_training['target'].sum()), int((~df_training['target']).sum()))
+    if n_train < min_train:
+        raise ValueError("There are fewer high scoring targets or decoys than required by 'min_train'.")
+
     # Select training and test sets
     X = df_training[features]
     y = df_training['target'].astype(int)
@@ -544,6 +773,51 @@ def train_RF(df: pd.DataFrame,
         g.set_title("Feature importance")
         plt.show()
 
+    return cv
+
+
+def train_RF(df: pd.DataFrame,
+             exclude_features: list = ML_EXCLUDE_FEATURES,
+             train_fdr_level: float = 0.1,
+             ini_score: str = 'hits',
+             min_train: int = 1000,
+             test_size: float = 0.8,
+             max_depth: list = [5, 25, 50],
+             max_leaf_nodes: list = [150, 200, 250],
+             n_jobs: int = -1,
+             scoring: str = 'accuracy',
+             plot: bool = False,
+             random_state: int = 42,
+             **kwargs) -> (GridSearchCV, list):
+    """
+    Function to train a random forest classifier to separate targets from decoys via semi-supervised learning.
+
+    Args:
+        df (pd.DataFrame): psms table of search results from alphapept.
+        exclude_features (list, optional): list with column names of features to exclude for ML. Defaults to ['precursor_idx','fragment_ion_idx','fasta_index','feature_rank','raw_rank','score_rank','db_idx', 'feature_idx', 'precursor', 'query_idx', 'raw_idx','sequence','decoy','sequence_naked','target'].
+        train_fdr_level (float, optional): Only targets below the train_fdr_level cutoff are considered for training the classifier. Defaults to 0.1.
+        ini_score (str, optional): Initial score to select psms set for semi-supervised learning. Defaults to 'x_tandem'.
+        min_train (int, optional): Minimum number of psms in the training set. Defaults to 1000.
+        test_size (float, optional): Fraction of psms used for testing. Defaults to 0.8.
+        max_depth (list, optional): List of clf__max_depth parameters to test in the grid search. Defaults to [5,25,50].
+        max_leaf_nodes (list, optional): List of clf__max_leaf_nodes parameters to test in the grid search. Defaults to [150,200,250].
+        n_jobs (int, optional): Number of jobs to use for parallelizing the gridsearch. Defaults to -1, which in GridSearchCV corresponds to 'use all available cores'.
+        scoring (str, optional): Scoring method for the gridsearch. Defaults to 'accuracy'.
+        plot (bool, optional): flag to enable plot. Defaults to 'False'.
+        random_state (int, optional): Random state for initializing the RandomForestClassifier. Defaults to 42.
+
+    Returns:
+        [GridSearchCV, list]: GridSearchCV: GridSearchCV object with trained RandomForestClassifier. list: list of features used for training the classifier.
+
+    """
+
+    features = [col for col in df.columns if col not in exclude_features]
+
+    df_training = get_training_psms(df, train_fdr_level=train_fdr_level, ini_score=ini_score, random_state=random_state)
+
+    cv = fit_RF(df_training, features, min_train=min_train, test_size=test_size, max_depth=max_depth, max_leaf_nodes=max_leaf_nodes,
+                n_jobs=n_jobs, scoring=scoring, plot=plot, random_state=random_state)
+
     return cv, features
 
 
@@ -629,8 +903,36 @@ def filter_with_ML(df: pd.DataFrame,
 
     return df_new
 
-# %% ../nbs/06_score.ipynb 50
-import networkx as nx
+# %% ../nbs/06_score.ipynb 53
+import heapq
+import alphapept.fasta
+import alphapept.performance
+from scipy.sparse import csr_matrix, bmat
+from scipy.sparse.csgraph import connected_components
+
+def get_possible_proteins(sequences: np.ndarray, pept_dict: dict) -> (np.ndarray, np.ndarray):
+    """
+    Get the proteins of sequences in CSR layout, the proteins of sequence i are indices[indptr[i]:indptr[i+1]].
+    A PeptideIndex is looked up vectorized, other peptide dicts per sequence.
+
+    Args:
+        sequences (np.ndarray): peptide sequences.
+        pept_dict (dict): dictionary or alphapept.fasta.PeptideIndex that matches peptide sequences to proteins
+
+    Returns:
+        np.ndarray: indptr to the proteins of each sequence.
+        np.ndarray: protein indices.
+    """
+    if isinstance(pept_dict, alphapept.fasta.PeptideIndex):
+        return pept_dict.get_proteins(sequences)
+
+    possible_proteins = [pept_dict[_] for _ in sequences]
+    indptr = np.zeros(len(possible_proteins) + 1, dtype=np.int64)
+    np.cumsum([len(_) for _ in possible_proteins], out=indptr[1:])
+    indices = np.fromiter((_ for proteins in possible_proteins for _ in proteins), dtype=np.int64, count=indptr[-1])
+
+    return indptr, indices
+
 
 def assign_proteins(data: pd.DataFrame, pept_dict: dict) -> (pd.DataFrame, dict):
     """
@@ -649,30 +951,46 @@ def assign_proteins(data: pd.DataFrame, pept_dict: dict) -> (pd.DataFrame, dict)
     """
     
     data = data.reset_index(drop=True)
-    
-    data['n_possible_proteins'] = data['sequence'].apply(lambda x: len(pept_dict[x]))
+
+    indptr, protein_indices = get_possible_proteins(data['sequence'].values, pept_dict)
+
+    data['n_possible_proteins'] = np.diff(indptr)
     unique_peptides = (data['n_possible_proteins'] == 1).sum()
     shared_peptides = (data['n_possible_proteins'] > 1).sum()
 
     logging.info(f'A total of {unique_peptides:,} unique and {shared_peptides:,} shared peptides.')
-    
-    sub = data[data['n_possible_proteins']==1]
-    psms_to_protein = sub['sequence'].apply(lambda x: pept_dict[x])
+
+    unique_idx = np.flatnonzero(data['n_possible_proteins'].values == 1)
+    unique_proteins = protein_indices[indptr[unique_idx]]
+
+    # Group the psms by protein, the stable sort keeps the psms of each protein in order
+    order = np.argsort(unique_proteins, kind='stable')
+    proteins, starts = np.unique(unique_proteins[order], return_index=True)
 
     found_proteins = {}
-    for idx, _ in enumerate(psms_to_protein):
-        idx_ = psms_to_protein.index[idx]
-        p_str = 'p' + str(_[0])
-        if p_str in found_proteins:
-            found_proteins[p_str] = found_proteins[p_str] + [str(idx_)]
-        else:
-            found_proteins[p_str] = [str(idx_)] 
-    
+    for protein, psms in zip(proteins, np.split(unique_idx[order], starts[1:])):
+        found_proteins['p' + str(protein)] = [str(_) for _ in psms]
+
     return data, found_proteins
 
+def _pop_protein(heap: list, counts: np.ndarray) -> int:
+    """Pop the protein with the most peptides from a heap with (-count, -rank, protein) entries.
+    Entries with outdated counts are pushed again with their current count.
+    """
+    while True:
+        count, rank, protein = heapq.heappop(heap)
+        if -count == counts[protein]:
+            return protein
+        heapq.heappush(heap, (-counts[protein], rank, protein))
+
+
 def get_shared_proteins(data: pd.DataFrame, found_proteins: dict, pept_dict: dict) -> dict:
     """
     Assign peptides to razor proteins. 
+
+    Shared peptides and their proteins are stored as a sparse incidence matrix. Independent sets of proteins are the connected components of this matrix.
+    Within each set, the protein with the most remaining peptides is selected with a priority queue and gets all of them assigned.
+    Proteins with identical peptides are reported as protein group.
     
     Args:
         data (pd.DataFrame): psms table of scored and filtered search results from alphapept, appended with `n_possible_proteins`.
@@ -683,69 +1001,79 @@ def get_shared_proteins(data: pd.DataFrame, found_proteins: dict, pept_dict: dic
         dict: dictionary mapping peptides to razor proteins
     
     """
-    
-    G = nx.Graph()
-
     sub = data[data['n_possible_proteins']>1]
+    peptide_names = np.array([str(_) for _ in sub.index], dtype=object)
+    n_peptides = len(sub)
 
-    for i in range(len(sub)):
-        seq, score = sub.iloc[i][['sequence','score']]
-        idx = sub.index[i]
-        possible_proteins = pept_dict[seq]
+    if n_peptides == 0:
+        logging.info('A total of 0 ambigious proteins')
+        return {}
 
-        for p in possible_proteins:
-            G.add_edge(str(idx), 'p'+str(p), score=score)
-            
-    connected_groups = np.array([list(c) for c in sorted(nx.connected_components(G), key=len, reverse=True)], dtype=object)
-    n_groups = len(connected_groups)
-
-    logging.info('A total of {} ambigious proteins'.format(len(connected_groups)))
-
-    #Solving with razor:
-    found_proteins_razor = {}
-    for a in connected_groups[::-1]:
-        H = G.subgraph(a).copy()
-        shared_proteins = list(np.array(a)[np.array(list(i[0] == 'p' for i in a))])
+    indptr, protein_ids = get_possible_proteins(sub['sequence'].values, pept_dict)
 
-        while len(shared_proteins) > 0:
-            neighbors_list = []
+    # Proteins that are listed multiple times for a peptide only have one edge
+    peptide_ids = np.repeat(np.arange(n_peptides), np.diff(indptr))
+    order = np.lexsort((protein_ids, peptide_ids))
+    peptide_ids, protein_ids = peptide_ids[order], protein_ids[order]
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = (peptide_ids[1:] != peptide_ids[:-1]) | (protein_ids[1:] != protein_ids[:-1])
+    peptide_ids, protein_ids = peptide_ids[keep], protein_ids[keep]
 
-            for node in shared_proteins:
-                shared_peptides = list(H.neighbors(node))
+    indptr = np.zeros(n_peptides + 1, dtype=np.int64)
+    np.cumsum(np.bincount(peptide_ids, minlength=n_peptides), out=indptr[1:])
 
-                if node in G:
-                    if node in found_proteins.keys():
-                        shared_peptides += found_proteins[node]
+    # Local protein indices for the incidence matrix
+    proteins, protein_idx = np.unique(protein_ids, return_inverse=True)
+    n_proteins = len(proteins)
+    protein_names = np.array(['p'+str(_) for _ in proteins], dtype=object)
 
-                n_neigbhors = len(shared_peptides)
+    incidence = csr_matrix((np.ones(len(protein_idx), dtype=np.int8), protein_idx.ravel(), indptr), shape=(n_peptides, n_proteins))
+    incidence_T = incidence.T.tocsr()
 
-                neighbors_list.append((n_neigbhors, node, shared_peptides))
+    n_groups, labels = connected_components(bmat([[None, incidence], [incidence_T, None]], format='csr'), directed=False)
 
+    logging.info('A total of {} ambigious proteins'.format(n_groups))
 
-            #Check if we have a protein_group (e.g. they share the same everythin)
-            neighbors_list.sort()
+    # Ties are resolved by the protein name
+    rank = np.empty(n_proteins, dtype=np.int64)
+    rank[np.argsort(protein_names.astype(str))] = np.arange(n_proteins)
 
-            # Check for protein group
-            node_ = [neighbors_list[-1][1]]
-            idx = 1
-            while idx < len(neighbors_list): #Check for protein groups
-                if neighbors_list[-idx][0] == neighbors_list[-idx-1][0]: #lenght check
-                    if set(neighbors_list[-idx][2]) == set(neighbors_list[-idx-1][2]): #identical peptides
-                        node_.append(neighbors_list[-idx-1][1])
-                        idx += 1
-                    else:
-                        break   
-                else:
-                    break
+    unique_peptides = [found_proteins.get(_, []) for _ in protein_names]
+    counts = np.diff(incidence_T.indptr) + np.array([len(_) for _ in unique_peptides], dtype=np.int64)
+    remaining = np.ones(n_peptides, dtype=bool)
 
-            #Remove the last entry:  
-            shared_peptides = neighbors_list[-1][2]
-            for node in node_:
-                shared_proteins.remove(node)
+    protein_labels = labels[n_peptides:]
+    order = np.argsort(protein_labels, kind='stable')
+    bounds = np.flatnonzero(np.diff(protein_labels[order])) + 1
 
-            for _ in shared_peptides:
-                if _ in H:
-                    H.remove_node(_)
+    #Solving with razor:
+    found_proteins_razor = {}
+    for group in np.split(order, bounds):
+        heap = [(-counts[_], -rank[_], _) for _ in group]
+        heapq.heapify(heap)
+
+        while len(heap) > 0:
+            protein = _pop_protein(heap, counts)
+            peptides = incidence_T.indices[incidence_T.indptr[protein]:incidence_T.indptr[protein+1]]
+            peptides = peptides[remaining[peptides]]
+            shared_peptides = list(peptide_names[peptides]) + unique_peptides[protein]
+
+            # Check for protein group, i.e. proteins with identical peptides
+            node_ = [protein_names[protein]]
+            while len(heap) > 0:
+                protein_ = _pop_protein(heap, counts)
+                if counts[protein_] == counts[protein]:
+                    peptides_ = incidence_T.indices[incidence_T.indptr[protein_]:incidence_T.indptr[protein_+1]]
+                    peptides_ = peptides_[remaining[peptides_]]
+                    if set(peptide_names[peptides_]).union(unique_peptides[protein_]) == set(shared_peptides):
+                        node_.append(protein_names[protein_])
+                        continue
+                heapq.heappush(heap, (-counts[protein_], -rank[protein_], protein_))
+                break
+
+            remaining[peptides] = False
+            for peptide in peptides:
+                counts[incidence.indices[incidence.indptr[peptide]:incidence.indptr[peptide+1]]] -= 1
 
             if len(shared_peptides) > 0:
                 if len(node_) > 1:
@@ -828,6 +1156,13 @@ def get_protein_groups(data: pd.DataFrame, pept_dict: dict, fasta_dict: dict, de
 
     return report
 
+def _get_protein_groups(to_process: tuple) -> pd.DataFrame:
+    """Helper function to call get_protein_groups from a process pool."""
+    data, pept_dict, fasta_dict, decoy, kwargs = to_process
+
+    return get_protein_groups(data, pept_dict, fasta_dict, decoy=decoy, **kwargs)
+
+
 def perform_protein_grouping(data: pd.DataFrame, pept_dict: dict, fasta_dict: dict, **kwargs) -> pd.DataFrame:
     """
     Wrapper function to perform protein grouping by razor approach
@@ -845,14 +1180,32 @@ def perform_protein_grouping(data: pd.DataFrame, pept_dict: dict, fasta_dict: di
 
     targets = data_sub_unique[data_sub_unique.decoy == False]
     targets = targets.reset_index(drop=True)
-    protein_targets = get_protein_groups(targets, pept_dict, fasta_dict, **kwargs)
-    
-    protein_targets['decoy_protein'] = False
 
     decoys = data_sub_unique[data_sub_unique.decoy == True]
     decoys = decoys.reset_index(drop=True)
-    protein_decoys = get_protein_groups(decoys, pept_dict, fasta_dict, decoy=True, **kwargs)
 
+    n_processes = alphapept.performance.set_worker_count(worker_count=2, set_global=False)
+
+    if n_processes > 1:
+        # Only send the peptides and proteins that are needed to the worker processes
+        to_process = []
+        for df, decoy in [(targets, False), (decoys, True)]:
+            if isinstance(pept_dict, alphapept.fasta.PeptideIndex):
+                pept_dict_ = pept_dict.subset(df['sequence'].values)
+                proteins = np.unique(pept_dict_.protein_indices).tolist()
+            else:
+                pept_dict_ = {_: pept_dict[_] for _ in df['sequence']}
+                proteins = set().union(*pept_dict_.values())
+            fasta_dict_ = {_: fasta_dict[_] for _ in proteins}
+            to_process.append((df, pept_dict_, fasta_dict_, decoy, kwargs))
+
+        with alphapept.performance.AlphaPool(n_processes) as p:
+            protein_targets, protein_decoys = p.map(_get_protein_groups, to_process)
+    else:
+        protein_targets = get_protein_groups(targets, pept_dict, fasta_dict, **kwargs)
+        protein_decoys = get_protein_groups(decoys, pept_dict, fasta_dict, decoy=True, **kwargs)
+
+    protein_targets['decoy_protein'] = False
     protein_decoys['decoy_protein'] = True
 
     protein_groups = pd.concat([protein_targets, protein_decoys])
@@ -866,7 +1219,7 @@ def perform_protein_grouping(data: pd.DataFrame, pept_dict: dict, fasta_dict: di
     
     return protein_report
 
-# %% ../nbs/06_score.ipynb 53
+# %% ../nbs/06_score.ipynb 57
 ion_dict = {}
 ion_dict[0] = ''
 ion_dict[1] = '-H20'
@@ -897,7 +1250,73 @@ def get_ion(i: int, df: pd.DataFrame, fragment_ions: pd.DataFrame)-> (list, np.n
     
     return ion, ints
 
-# %% ../nbs/06_score.ipynb 55
+
+def get_fragment_ion_indices(df: pd.DataFrame) -> (np.ndarray, np.ndarray):
+    """
+    Gathers the rows of the ion hits of all PSMs in CSR layout.
+    The ion hits of PSM i are the rows indices[indptr[i]:indptr[i+1]] of the fragment_ions table.
+    PSMs without ion hits (e.g. from matching) have no entries.
+
+    Args:
+        df (pd.DataFrame): DataFrame with PSMs
+    
+    Returns:
+        np.ndarray: Pointer array with the start of each PSM and the total number of ion hits as last entry.
+        np.ndarray: Row indices of the ion hits in the fragment_ions table.
+    """
+    starts = np.nan_to_num(df['fragment_ion_idx'].values.astype(np.float64)).astype(np.int64)
+    counts = np.nan_to_num(df['n_fragments_matched'].values.astype(np.float64)).astype(np.int64)
+
+    indptr = np.zeros(len(df) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = np.repeat(starts - indptr[:-1], counts) + np.arange(indptr[-1])
+
+    return indptr, indices
+
+
+def get_ion_labels(fragment_ions: pd.DataFrame) -> np.ndarray:
+    """
+    Helper function to label ion hits, e.g. 'b1' or 'y2-NH3'.
+    Each combination of ion index and ion type is only converted to a string once.
+
+    Args:
+        fragment_ions (pd.DataFrame): DataFrame with ion hits
+
+    Returns:
+        np.ndarray: Array with strings that describe the ion type.
+    """
+    ion_index = fragment_ions['ion_index'].values.astype(np.int64)
+    ion_type = fragment_ions['fragment_ion_type'].values.astype(np.int64)
+
+    combinations, inverse = np.unique(np.stack([ion_index, ion_type], axis=1), axis=0, return_inverse=True)
+    labels = np.array([('b'+str(a)).replace('b-','y') + ion_dict[b] for a, b in combinations], dtype=object)
+
+    return labels[inverse.ravel()]
+
+
+def get_ions(df: pd.DataFrame, fragment_ions: pd.DataFrame) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Extracts the ion-hits of all PSMs in CSR layout, the vectorized version of get_ion.
+    The ion hits of PSM i are ions[indptr[i]:indptr[i+1]] and ints[indptr[i]:indptr[i+1]].
+
+    Args:
+        df (pd.DataFrame): DataFrame with PSMs
+        fragment_ions (pd.DataFrame): DataFrame with ion hits
+
+    Returns:
+        np.ndarray: Pointer array with the start of each PSM and the total number of ion hits as last entry.
+        np.ndarray: Array with strings that describe the ion type.
+        np.ndarray: Array with intensity information
+    """
+    indptr, indices = get_fragment_ion_indices(df)
+    ions_ = fragment_ions.iloc[indices]
+
+    ions = get_ion_labels(ions_)
+    ints = ions_['fragment_ion_int'].values.astype('int')
+
+    return indptr, ions, ints
+
+# %% ../nbs/06_score.ipynb 60
 def ecdf(data:np.ndarray)-> (np.ndarray, np.ndarray):
     """Compute ECDF.
     Helper function to calculate the ECDF of a score distribution.
@@ -917,11 +1336,191 @@ def ecdf(data:np.ndarray)-> (np.ndarray, np.ndarray):
 
     return (x,y)
 
-# %% ../nbs/06_score.ipynb 58
+# %% ../nbs/06_score.ipynb 63
 import os
 from multiprocessing import Pool
 from scipy.interpolate import interp1d
 from typing import Callable, Union
+import alphapept.performance
+
+import pickle
+import hashlib
+
+def get_feature_hash(features: list) -> str:
+    """Compatibility hash of a list of ML features.
+
+    Args:
+        features (list): List of feature names.
+
+    Returns:
+        str: Hash that does not depend on the order of the features.
+    """
+    return hashlib.md5(','.join(sorted(features)).encode()).hexdigest()
+
+
+def get_ML_model_path(settings: dict) -> str:
+    """Get the path of the experiment-level ML model.
+
+    Args:
+        settings (dict): Settings file for the experiment.
+
+    Returns:
+        str: The persisted model path if set, otherwise a path next to the results file.
+    """
+    if settings['score'].get('ml_model_path'):
+        return settings['score']['ml_model_path']
+
+    if settings['experiment'].get('results_path'):
+        base, ext = os.path.splitext(settings['experiment']['results_path'])
+    else:
+        base, ext = os.path.splitext(settings['experiment']['file_paths'][0])
+
+    return base + '_ml_model.pkl'
+
+
+def save_ML_model(path: str, classifier: GridSearchCV, features: list):
+    """Save a trained classifier together with its features and their compatibility hash.
+
+    Args:
+        path (str): Path of the model file.
+        classifier (GridSearchCV): Trained classifier.
+        features (list): List of features used for training the classifier.
+    """
+    model = {'classifier': classifier, 'features': features, 'feature_hash': get_feature_hash(features)}
+
+    with open(path, 'wb') as f:
+        pickle.dump(model, f)
+
+
+_ML_MODEL_CACHE = {}
+
+def load_ML_model(path: str) -> Union[dict, None]:
+    """Load a model saved with save_ML_model. Models are only read once per process.
+
+    Args:
+        path (str): Path of the model file.
+
+    Returns:
+        Union[dict, None]: Dictionary with classifier, features and feature_hash or None if there is no model.
+    """
+    if not os.path.isfile(path):
+        return None
+
+    key = (path, os.path.getmtime(path))
+    if key not in _ML_MODEL_CACHE:
+        with open(path, 'rb') as f:
+            _ML_MODEL_CACHE[key] = pickle.load(f)
+
+    return _ML_MODEL_CACHE[key]
+
+
+def read_search_psms(ms_file_: alphapept.io.MS_Data_File) -> pd.DataFrame:
+    """Read the psms of the second search or, if not present, of the first search.
+
+    Args:
+        ms_file_ (alphapept.io.MS_Data_File): The ms_data file.
+
+    Returns:
+        pd.DataFrame: psms table of search results from alphapept, empty if no search was performed.
+    """
+    try:
+        df = ms_file_.read(dataset_name='second_search')
+        logging.info('Found second search psms for scoring.')
+    except KeyError:
+        try:
+            df = ms_file_.read(dataset_name='first_search')
+            logging.info('No second search psms for scoring found. Using first search.')
+        except KeyError:
+            df = pd.DataFrame()
+
+    return df
+
+
+def get_pooled_training_psms(to_process: tuple) -> Union[pd.DataFrame, None]:
+    """Select the training psms of one file for the experiment-level ML model.
+
+    Args:
+        to_process (int, dict, int): Tuple containing a file index, the settings and the maximum number of targets and of decoys.
+
+    Returns:
+        Union[pd.DataFrame, None]: Balanced targets and decoys with the ML features and the target column or None if the file has no psms.
+    """
+    index, settings, n_max = to_process
+
+    file_name = settings['experiment']['file_paths'][index]
+    base_file_name, ext = os.path.splitext(file_name)
+    ms_file_ = alphapept.io.MS_Data_File(base_file_name+".ms_data.hdf")
+
+    df = read_search_psms(ms_file_)
+    if len(df) == 0:
+        return None
+
+    df = get_ML_features(df, **settings['fasta'])
+    features = [col for col in df.columns if col not in ML_EXCLUDE_FEATURES]
+
+    df_training = get_training_psms(df, ini_score=settings['score']['ml_ini_score'])
+    df_training = df_training.groupby('target', group_keys=False).apply(lambda x: x.sample(n=min(len(x), n_max), random_state=42))
+
+    return df_training[features + ['target']]
+
+
+def train_experiment_RF(settings: dict) -> Union[str, None]:
+    """Train one random forest on psms pooled from all files of an experiment.
+    A persisted model set in the settings is reused if its features match the pooled psms, otherwise it is retrained and overwritten.
+
+    Args:
+        settings (dict): Settings file for the experiment.
+
+    Returns:
+        Union[str, None]: Path of the model or None if the training failed and files need to be scored with their own model.
+    """
+    model_path = get_ML_model_path(settings)
+    persisted = bool(settings['score'].get('ml_model_path'))
+
+    if not persisted and os.path.isfile(model_path):
+        os.remove(model_path)
+
+    file_paths = settings['experiment']['file_paths']
+    n_max = int(np.ceil(settings['score']['ml_train_size'] / len(file_paths)))
+    to_process = [(idx, settings, n_max) for idx in range(len(file_paths))]
+
+    n_processes = alphapept.performance.set_worker_count(
+        worker_count=settings['general']['n_processes'],
+        set_global=False
+    )
+
+    logging.info(f'Pooling up to {n_max:,} targets and decoys per file for the experiment-level ML model.')
+
+    with alphapept.performance.AlphaPool(n_processes) as p:
+        dfs = [_ for _ in p.imap(get_pooled_training_psms, to_process) if _ is not None]
+
+    if len(dfs) == 0:
+        logging.info('No psms found for the experiment-level ML model.')
+        return None
+
+    df_training = pd.concat(dfs, join='inner', ignore_index=True)
+    features = [col for col in df_training.columns if col != 'target']
+
+    if persisted:
+        model = load_ML_model(model_path)
+        if (model is not None) and (model['feature_hash'] == get_feature_hash(features)):
+            logging.info(f'Using persisted ML model {model_path}.')
+            return model_path
+        elif model is not None:
+            logging.info(f'Features do not match the persisted ML model {model_path}. Retraining.')
+
+    try:
+        classifier = fit_RF(df_training, features, n_jobs=settings['general']['n_processes'])
+    except ValueError as e:
+        logging.info('Experiment-level ML failed. Training per file.')
+        logging.info(f"{e}")
+        return None
+
+    save_ML_model(model_path, classifier, features)
+    logging.info(f'Saved experiment-level ML model to {model_path}.')
+
+    return model_path
+
 
 #This function has no unit test and is covered by the quick_test
 def score_hdf(to_process: tuple, callback: Callable = None, parallel: bool=False) -> Union[bool, str]:
@@ -951,106 +1550,93 @@ def score_hdf(to_process: tuple, callback: Callable = None, parallel: bool=False
 
         ms_file_ = alphapept.io.MS_Data_File(ms_file, is_overwritable=True)
 
-        try:
-            df = ms_file_.read(dataset_name='second_search')
-            logging.info('Found second search psms for scoring.')
-        except KeyError:
-            try:
-                df = ms_file_.read(dataset_name='first_search')
-                logging.info('No second search psms for scoring found. Using first search.')
-            except KeyError:
-                df = pd.DataFrame()    
-
-        if len(df) == 0:
-            skip = True
-            logging.info('Dataframe does not contain data. Skipping scoring step.')
-
-        if not skip:
-            df_ = get_ML_features(df, **settings['fasta'])
+        with ms_file_.session(mode='a'):
+            df = read_search_psms(ms_file_)
+
+            if len(df) == 0:
+                skip = True
+                logging.info('Dataframe does not contain data. Skipping scoring step.')
+
+            if not skip:
+                df_ = get_ML_features(df, **settings['fasta'])
             
-            if settings["score"]["method"] == 'random_forest':
-                try:
-                    classifier, features = train_RF(df_, n_jobs = settings['general']['n_processes'], ini_score= settings['score']['ml_ini_score'])
-                    df_['score'] = classifier.predict_proba(df_[features])[:,1]
-                except ValueError as e:
-                    logging.info('ML failed. Defaulting to morpheus score')
-                    logging.info(f"{e}")
+                if settings["score"]["method"] == 'random_forest':
+                    try:
+                        model = None
+                        if settings['score'].get('ml_model', 'file') == 'experiment':
+                            model = load_ML_model(get_ML_model_path(settings))
+
+                        features = [col for col in df_.columns if col not in ML_EXCLUDE_FEATURES]
+
+                        if (model is not None) and (model['feature_hash'] == get_feature_hash(features)):
+                            logging.info('Using experiment-level ML model.')
+                            classifier, features = model['classifier'], model['features']
+                        else:
+                            if model is not None:
+                                logging.info('Features do not match the experiment-level ML model. Training per file.')
+                            classifier, features = train_RF(df_, n_jobs = settings['general']['n_processes'], ini_score= settings['score']['ml_ini_score'])
+                        df_['score'] = classifier.predict_proba(df_[features])[:,1]
+                    except ValueError as e:
+                        logging.info('ML failed. Defaulting to morpheus score')
+                        logging.info(f"{e}")
                     
-                    logging.info('Converting morpheus score to probabilities')
+                        logging.info('Converting morpheus score to probabilities')
                     
-                    x_, y_ = ecdf(df_['score'].values)
-                    f = interp1d(x_, y_, bounds_error = False, fill_value=(y_.min(), y_.max()))
+                        x_, y_ = ecdf(df_['score'].values)
+                        f = interp1d(x_, y_, bounds_error = False, fill_value=(y_.min(), y_.max()))
                 
-                    df_['score'] = df_['x_tandem'].apply(lambda x: f(x))
+                        df_['score'] = df_['x_tandem'].apply(lambda x: f(x))
                     
-            elif settings["score"]["method"] == 'x_tandem':
-                df_['score'] = df_['x_tandem']
-            elif settings["score"]["method"] == 'generic_score':
-                df_['score'] = df_['generic_score']
-            elif settings["score"]["method"] == 'morpheus':
-                df_['score'] = df_['hits']
-            else:
-                try:
-                    import importlib
-                    alphapept_plugin = importlib.import_module(settings["score"]["method"]+".alphapept_plugin")
-                    df = alphapept_plugin.score_alphapept(df, index, settings)
-                except Exception as e:
-                    raise NotImplementedError('Scoring method {} not implemented. Other exception info: {}'.format(settings["score"]["method"], e))
+                elif settings["score"]["method"] == 'x_tandem':
+                    df_['score'] = df_['x_tandem']
+                elif settings["score"]["method"] == 'generic_score':
+                    df_['score'] = df_['generic_score']
+                elif settings["score"]["method"] == 'morpheus':
+                    df_['score'] = df_['hits']
+                else:
+                    try:
+                        import importlib
+                        alphapept_plugin = importlib.import_module(settings["score"]["method"]+".alphapept_plugin")
+                        df = alphapept_plugin.score_alphapept(df, index, settings)
+                    except Exception as e:
+                        raise NotImplementedError('Scoring method {} not implemented. Other exception info: {}'.format(settings["score"]["method"], e))
             
             
-            #Save identifications
-            ids = df_.copy()
-            ids = filter_score(ids)
+                #Save identifications
+                ids = df_.copy()
+                ids = filter_score(ids)
             
-            agg_cval, ids = cut_fdr(ids, plot=False, cut=False)
+                agg_cval, ids = cut_fdr(ids, plot=False, cut=False)
 
-            logging.info('Saving identifications to ms_data file.')  
-            ms_file_.write(ids, dataset_name="identifications")
-            logging.info('Saving identifications to ms_data file complete.')  
-            ids.to_csv(base_file_name+'_ids.csv')
-            logging.info('Saving identifications to csv file complete.')
+                logging.info('Saving identifications to ms_data file.')  
+                ms_file_.write(ids, dataset_name="identifications")
+                logging.info('Saving identifications to ms_data file complete.')  
+                ids.to_csv(base_file_name+'_ids.csv')
+                logging.info('Saving identifications to csv file complete.')
             
             
-            df = filter_with_score(df_)
+                df = filter_with_score(df_)
                  
-            df_pfdr = cut_global_fdr(df, analyte_level='precursor',  plot=False, fdr_level = settings["search"]["peptide_fdr"], **settings['search'])
+                df_pfdr = cut_global_fdr(df, analyte_level='precursor',  plot=False, fdr_level = settings["search"]["peptide_fdr"], **settings['search'])
 
-            logging.info('FDR on peptides complete. For {} FDR found {:,} targets and {:,} decoys.'.format(settings["search"]["peptide_fdr"], df_pfdr['target'].sum(), df_pfdr['decoy'].sum()) )
+                logging.info('FDR on peptides complete. For {} FDR found {:,} targets and {:,} decoys.'.format(settings["search"]["peptide_fdr"], df_pfdr['target'].sum(), df_pfdr['decoy'].sum()) )
                     
-            df = df_pfdr
+                df = df_pfdr
 
-            try:
-                logging.info('Extracting fragment_ions')
-                fragment_ions = ms_file_.read(dataset_name='fragment_ions')
+                # Ion hits stay in the fragment_ions table, fragment_ion_idx and n_fragments_matched point to them (see get_ions)
+                df = df.drop(columns=['fragment_ion_int', 'fragment_ion_type'], errors='ignore')
 
-                ion_list = []
-                ion_ints = []
-
-                for i in range(len(df)):
-                    ion, ints = get_ion(i, df, fragment_ions)
-                    ion_list.append(ion)
-                    ion_ints.append(ints)
-
-                df['fragment_ion_int'] = ion_ints
-                df['fragment_ion_type'] = ion_list
-
-
-                logging.info('Extracting fragment_ions complete.')
-
-            except KeyError:
-                logging.info('No fragment_ions present.')
-                    
-            export_df = df.reset_index(drop=True)
+                export_df = df.reset_index(drop=True)
             
-            #if 'level_0' in export_df.keys(): #Todo: Why is this in here?
-            #    export_df.drop(columns=['level_0'])
-            #   logging.info('Dropped level_0 from df.')
+                #if 'level_0' in export_df.keys(): #Todo: Why is this in here?
+                #    export_df.drop(columns=['level_0'])
+                #   logging.info('Dropped level_0 from df.')
 
-            #Note: Peptide FDR can be misleading here as we don't filter here, so this has not the set peptide fdr.
-            logging.info(f'Exporting peptide_fdr on {file_name}.')
-            ms_file_.write(export_df, dataset_name="peptide_fdr")
+                #Note: Peptide FDR can be misleading here as we don't filter here, so this has not the set peptide fdr.
+                logging.info(f'Exporting peptide_fdr on {file_name}.')
+                ms_file_.write(export_df, dataset_name="peptide_fdr")
 
-            logging.info(f'Scoring of files {file_name} complete.')
+                logging.info(f'Scoring of files {file_name} complete.')
         return True
     except Exception as e:
         logging.info(f'Scoring of file {index} failed. Exception {e}')
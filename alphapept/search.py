@@ -1,10 +1,13 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/05_search.ipynb.
 
 # %% auto 0
-__all__ = ['FRAG_DTYPE', 'LOSS_DICT', 'LOSSES', 'mass_dict', 'compare_frags', 'ppm_to_dalton', 'get_idxs',
-           'compare_spectrum_parallel', 'query_data_to_features', 'get_psms', 'frag_delta', 'intensity_fraction',
-           'add_column', 'remove_column', 'get_hits', 'score', 'get_sequences', 'get_score_columns', 'plot_psms',
-           'store_hdf', 'search_db', 'search_fasta_block', 'filter_top_n', 'ion_extractor', 'search_parallel']
+__all__ = ['FRAG_DTYPE', 'LOSS_DICT', 'LOSSES', 'QUERY_CACHE_KEYS', 'mass_dict', 'compare_frags', 'ppm_to_dalton', 'get_idxs',
+           'compare_spectrum_parallel', 'compare_spectrum_indexed', 'query_data_to_features', 'gather_query_fragments',
+           'get_query_fragments', 'get_fragment_index', 'get_psms', 'frag_delta', 'intensity_fraction', 'add_column',
+           'remove_column', 'get_hits', 'count_fragment_ions', 'fill_fragment_ions', 'score', 'get_sequences',
+           'get_score_columns', 'plot_psms', 'store_hdf', 'search_db', 'save_query_cache', 'load_query_cache',
+           'clear_query_cache', 'search_fasta_block', 'filter_top_n', 'merge_top_n', 'TopNAccumulator', 'ion_extractor',
+           'search_parallel']
 
 # %% ../nbs/05_search.ipynb 5
 import logging
@@ -184,6 +187,134 @@ def compare_spectrum_parallel(query_idx:int, query_masses:np.ndarray, idxs_lower
                 break
 
 # %% ../nbs/05_search.ipynb 18
+@alphapept.performance.performance_function(compilation_mode="numba-multithread")
+def compare_spectrum_indexed(query_idx:int, idxs_lower:np.ndarray, idxs_higher:np.ndarray, query_indices:np.ndarray, query_frags:np.ndarray, query_ints:np.ndarray, db_indices:np.ndarray, db_frags:np.ndarray, index_indptr:np.ndarray, index_db_idx:np.ndarray, index_frags:np.ndarray, bin_width:float, best_hits:np.ndarray, score:np.ndarray, frag_tol:float, ppm:bool, min_frag_hits:int):
+    """Compares a spectrum with the candidates preselected by a fragment index and writes to the best_hits and score.
+
+    Args:
+        query_idx (int): Integer to the query_spectrum that should be compared.
+        idxs_lower (np.ndarray): Array with indices for lower search boundary.
+        idxs_higher (np.ndarray): Array with indices for upper search boundary.
+        query_indices (np.ndarray): Array with indices to the query data.
+        query_frags (np.ndarray): Array with frag types of the query data.
+        query_ints (np.ndarray): Array with fragment intensities from the query.
+        db_indices (np.ndarray):  Array with indices to the database data.
+        db_frags (np.ndarray): Array with frag types of the db data.
+        index_indptr (np.ndarray): Array with indices to the entries of each fragment bucket.
+        index_db_idx (np.ndarray): Array with the database index of each fragment index entry.
+        index_frags (np.ndarray): Array with the fragment mass of each fragment index entry.
+        bin_width (float): Width of the fragment buckets in Dalton.
+        best_hits (np.ndarray): Reporting array which stores indices to the best hits.
+        score (np.ndarray): Reporting array that stores the scores of the best hits.
+        frag_tol (float): Fragment tolerance for search.
+        ppm (bool): Flag to use ppm instead of Dalton.
+        min_frag_hits (int): Minimum number of frag hits to report a PSMs.
+    """
+    idx_low = idxs_lower[query_idx]
+    idx_high = idxs_higher[query_idx]
+
+    n_candidates = idx_high - idx_low
+    if n_candidates <= 0:
+        return
+
+    query_idx_start = query_indices[query_idx]
+    query_idx_end = query_indices[query_idx + 1]
+    query_frag = query_frags[query_idx_start:query_idx_end]
+    query_int = query_ints[query_idx_start:query_idx_end]
+
+    query_int_sum = 0
+    for qi in query_int:
+        query_int_sum += qi
+
+    n_bins = len(index_indptr) - 1
+
+    # Count query fragments that have at least one match per candidate
+    counts = np.zeros(n_candidates, dtype=np.int64)
+    last_q = np.zeros(n_candidates, dtype=np.int64) - 1
+
+    for q in range(len(query_frag)):
+        mass1 = query_frag[q]
+
+        if ppm:
+            offset = 2 * mass1 * frag_tol / 1e6 # Wider than needed, exact check below
+        else:
+            offset = frag_tol
+
+        bin_low = max(int((mass1 - offset) / bin_width), 0)
+        bin_high = min(int((mass1 + offset) / bin_width), n_bins - 1)
+
+        for b in range(bin_low, bin_high + 1):
+            start = index_indptr[b]
+            end = index_indptr[b + 1]
+            if start == end:
+                continue
+            bucket = index_db_idx[start:end]
+            k_start = start + np.searchsorted(bucket, idx_low)
+            k_end = start + np.searchsorted(bucket, idx_high)
+
+            for k in range(k_start, k_end):
+                mass2 = index_frags[k]
+                delta_mass = mass1 - mass2
+
+                if ppm:
+                    sum_mass = mass1 + mass2
+                    mass_difference = 2 * delta_mass / sum_mass * 1e6
+                else:
+                    mass_difference = delta_mass
+
+                if abs(mass_difference) <= frag_tol:
+                    c = index_db_idx[k] - idx_low
+                    if last_q[c] != q:
+                        last_q[c] = q
+                        counts[c] += 1
+
+    len_ = best_hits.shape[1]
+
+    for c in range(n_candidates):
+        if counts[c] < min_frag_hits:
+            continue
+
+        db_idx = idx_low + c
+        db_frag = db_frags[db_indices[db_idx]:db_indices[db_idx + 1]]
+
+        q_max = len(query_frag)
+        d_max = len(db_frag)
+
+        hits = 0
+
+        q, d = 0, 0  # q > query, d > database
+        while q < q_max and d < d_max:
+            mass1 = query_frag[q]
+            mass2 = db_frag[d]
+            delta_mass = mass1 - mass2
+
+            if ppm:
+                sum_mass = mass1 + mass2
+                mass_difference = 2 * delta_mass / sum_mass * 1e6
+            else:
+                mass_difference = delta_mass
+
+            if abs(mass_difference) <= frag_tol:
+                hits += 1
+                hits += query_int[q]/query_int_sum
+                d += 1
+                q += 1  # Only one query for each db element
+            elif delta_mass < 0:
+                q += 1
+            elif delta_mass > 0:
+                d += 1
+
+        for i in range(len_):
+            if score[query_idx, i] < hits:
+                for k in range(len_ - 1, i, -1):
+                    score[query_idx, k] = score[query_idx, k-1]
+                    best_hits[query_idx, k] = best_hits[query_idx, k-1]
+
+                score[query_idx, i] = hits
+                best_hits[query_idx, i] = db_idx
+                break
+
+# %% ../nbs/05_search.ipynb 21
 import pandas as pd
 import logging
 from .fasta import read_database
@@ -211,7 +342,101 @@ def query_data_to_features(query_data: dict)->pd.DataFrame:
 
     return features
 
-# %% ../nbs/05_search.ipynb 20
+# %% ../nbs/05_search.ipynb 23
+@njit
+def gather_query_fragments(query_indices: np.ndarray, query_frags: np.ndarray, query_ints: np.ndarray, query_selection: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+    """Gather the fragment masses and intensities of selected queries into new contiguous arrays.
+
+    Args:
+        query_indices (np.ndarray): Start and end index of each query in query_frags and query_ints.
+        query_frags (np.ndarray): Fragment masses of all queries.
+        query_ints (np.ndarray): Fragment intensities of all queries.
+        query_selection (np.ndarray): Indices of the queries to gather, may contain duplicates.
+
+    Returns:
+        np.ndarray: Start and end index of each selected query in the gathered arrays.
+        np.ndarray: Gathered fragment masses.
+        np.ndarray: Gathered fragment intensities.
+    """
+    n_selected = len(query_selection)
+    indices = np.zeros(n_selected + 1, np.int64)
+
+    for i in range(n_selected):
+        query_idx = query_selection[i]
+        indices[i + 1] = indices[i] + query_indices[query_idx + 1] - query_indices[query_idx]
+
+    frags = np.empty(indices[-1], query_frags.dtype)
+    ints = np.empty(indices[-1], query_ints.dtype)
+
+    for i in range(n_selected):
+        start = query_indices[query_selection[i]]
+        for j in range(indices[i + 1] - indices[i]):
+            frags[indices[i] + j] = query_frags[start + j]
+            ints[indices[i] + j] = query_ints[start + j]
+
+    return indices, frags, ints
+
+
+def get_query_fragments(query_data: dict, features: pd.DataFrame) -> (np.ndarray, np.ndarray, np.ndarray):
+    """Get the fragment masses and intensities of the spectra to search, ordered by feature.
+
+    Args:
+        query_data (dict): Data structure containing the query data.
+        features (pd.DataFrame): Pandas dataframe containing feature data. If None, all spectra of the query data are used.
+
+    Returns:
+        np.ndarray: Start and end index of each spectrum.
+        np.ndarray: Fragment masses.
+        np.ndarray: Fragment intensities.
+    """
+    query_indices = query_data["indices_ms2"]
+    query_frags = query_data['mass_list_ms2']
+    query_ints = query_data['int_list_ms2']
+
+    if features is None:
+        return query_indices, query_frags, query_ints
+
+    return gather_query_fragments(
+        np.asarray(query_indices),
+        np.asarray(query_frags),
+        np.asarray(query_ints),
+        features['query_idx'].values
+    )
+
+# %% ../nbs/05_search.ipynb 25
+from typing import Union
+from .fasta import build_fragment_index, FRAGMENT_INDEX_BIN_WIDTH, MappedDatabase
+
+def get_fragment_index(db_data: Union[dict, str], db_frags: np.ndarray, db_indices: np.ndarray) -> tuple:
+    """Get the fragment index of a database. If the database does not contain a fragment index, it is built in memory.
+
+    Args:
+        db_data (Union[dict, str]): Data structure containing the database data, a MappedDatabase or path to database.
+        db_frags (np.ndarray): Array with the fragment masses of the database.
+        db_indices (np.ndarray): Array with indices to the database data.
+
+    Returns:
+        np.ndarray: Array with indices to the entries of each fragment bucket.
+        np.ndarray: Array with the database index of each fragment index entry.
+        np.ndarray: Array with the fragment mass of each fragment index entry.
+        float: Width of the fragment buckets in Dalton.
+    """
+    if isinstance(db_data, str):
+        db_data = MappedDatabase(db_data)
+
+    if 'fragment_index_indptr' in db_data:
+        bin_width = FRAGMENT_INDEX_BIN_WIDTH
+        if isinstance(db_data, MappedDatabase):
+            bin_width = float(db_data.attrs['fragment_index_indptr']['bin_width'])
+
+        return db_data['fragment_index_indptr'], db_data['fragment_index_db_idx'], db_data['fragment_index_fragmasses'], bin_width
+
+    logging.info('No fragment index present in database. Building fragment index.')
+    index_indptr, index_db_idx, index_frags = build_fragment_index(db_frags, db_indices)
+
+    return index_indptr, index_db_idx, index_frags, FRAGMENT_INDEX_BIN_WIDTH
+
+# %% ../nbs/05_search.ipynb 26
 from typing import Callable
 
 #this wrapper function is covered by the quick_test
@@ -228,13 +453,15 @@ def get_psms(
     prec_tol_calibrated:float = None,
     frag_tol_calibrated:float = None,
     top_n: int = 10,
+    fragment_index: bool = False,
+    query_fragments: tuple = None,
     **kwargs
 )->(np.ndarray, int):
     """[summary]
 
     Args:
         query_data (dict): Data structure containing the query data.
-        db_data (dict): Data structure containing the database data.
+        db_data (dict): Data structure containing the database data, a MappedDatabase or path to database.
         features (pd.DataFrame): Pandas dataframe containing feature data.
         parallel (bool): Flag to use parallel processing.
         frag_tol (float): Fragment tolerance for search.
@@ -245,6 +472,8 @@ def get_psms(
         prec_tol_calibrated (float, optional): Precursor tolerance if calibration exists. Defaults to None.
         frag_tol_calibrated (float, optional): Fragment tolerance if calibration exists. Defaults to None.
         top_n (int): Number of top-n hits to keep.
+        fragment_index (bool): Flag to preselect candidates with a fragment index. Defaults to False.
+        query_fragments (tuple, optional): Fragment indices, masses and intensities per feature as returned by get_query_fragments. Computed if None. Defaults to None.
 
     Returns:
         np.ndarray: Numpy recordarray storing the PSMs.
@@ -252,17 +481,15 @@ def get_psms(
     """
 
     if isinstance(db_data, str):
-        db_masses = read_database(db_data, array_name = 'precursors')
-        db_frags = read_database(db_data, array_name = 'fragmasses')
-        db_indices = read_database(db_data, array_name = 'indices')
-    else:
-        db_masses = db_data['precursors']
-        db_frags = db_data['fragmasses']
-        db_indices = db_data['indices']
+        db_data = MappedDatabase(db_data)
 
-    query_indices = query_data["indices_ms2"]
-    query_frags = query_data['mass_list_ms2']
-    query_ints = query_data['int_list_ms2']
+    db_masses = db_data['precursors']
+    db_frags = db_data['fragmasses']
+    db_indices = db_data['indices']
+
+    if query_fragments is None:
+        query_fragments = get_query_fragments(query_data, features)
+    query_indices, query_frags, query_ints = query_fragments
     
     if frag_tol_calibrated:
         frag_tol = frag_tol_calibrated
@@ -275,26 +502,6 @@ def get_psms(
             query_masses = features['mass_matched'].values
         query_mz = features['mz_matched'].values
         query_rt = features['rt_matched'].values
-        query_selection = features['query_idx'].values
-        indices = np.zeros(len(query_selection) + 1, np.int64)
-        indices[1:] = np.diff(query_indices)[query_selection]
-        indices = np.cumsum(indices)
-        query_frags = np.concatenate(
-            [
-                query_frags[s: e] for s, e in zip(
-                    query_indices[query_selection], query_indices[query_selection + 1]
-                )
-            ]
-        )
-
-        query_ints = np.concatenate(
-            [
-                query_ints[s: e] for s, e in zip(
-                    query_indices[query_selection], query_indices[query_selection + 1]
-                )
-            ]
-        )
-        query_indices = indices
     else:
         if prec_tol_calibrated:
             prec_tol = prec_tol_calibrated
@@ -313,6 +520,13 @@ def get_psms(
     n_queries = len(query_masses)
     n_db = len(db_masses)
 
+    if fragment_index and alphapept.performance.COMPILATION_MODE == "cuda":
+        logging.info('Fragment index is not supported with cuda. Using regular search.')
+        fragment_index = False
+
+    if fragment_index:
+        index_indptr, index_db_idx, index_frags, bin_width = get_fragment_index(db_data, db_frags, db_indices)
+
     if alphapept.performance.COMPILATION_MODE == "cuda":
         import cupy
         cupy = cupy
@@ -335,7 +549,10 @@ def get_psms(
 
     logging.info(f'Performing search on {n_queries:,} query and {n_db:,} db entries with frag_tol = {frag_tol:.2f} and prec_tol = {prec_tol:.2f}.')
 
-    compare_spectrum_parallel(cupy.arange(n_queries), cupy.arange(n_queries), idxs_lower, idxs_higher, query_indices, query_frags, query_ints, db_indices, db_frags, best_hits, score, frag_tol, ppm)
+    if fragment_index:
+        compare_spectrum_indexed(cupy.arange(n_queries), idxs_lower, idxs_higher, query_indices, query_frags, query_ints, db_indices, db_frags, index_indptr, index_db_idx, index_frags, bin_width, best_hits, score, frag_tol, ppm, min_frag_hits)
+    else:
+        compare_spectrum_parallel(cupy.arange(n_queries), cupy.arange(n_queries), idxs_lower, idxs_higher, query_indices, query_frags, query_ints, db_indices, db_frags, best_hits, score, frag_tol, ppm)
 
     query_idx, db_idx_ = cupy.where(score > min_frag_hits)
     db_idx = best_hits[query_idx, db_idx_]
@@ -354,7 +571,7 @@ def get_psms(
 
     return psms, 0
 
-# %% ../nbs/05_search.ipynb 23
+# %% ../nbs/05_search.ipynb 31
 @njit
 def frag_delta(query_frag:np.ndarray, db_frag:np.ndarray, hits:np.ndarray)-> (float, float):
     """Calculates the mass difference for a given array of hits in Dalton and ppm.
@@ -375,7 +592,7 @@ def frag_delta(query_frag:np.ndarray, db_frag:np.ndarray, hits:np.ndarray)-> (fl
 
     return delta_m, delta_m_ppm
 
-# %% ../nbs/05_search.ipynb 26
+# %% ../nbs/05_search.ipynb 34
 @njit
 def intensity_fraction(query_int:np.ndarray, hits:np.ndarray)->float:
     """Calculate the fraction of matched intensity
@@ -397,7 +614,7 @@ def intensity_fraction(query_int:np.ndarray, hits:np.ndarray)->float:
 
     return i_frac
 
-# %% ../nbs/05_search.ipynb 29
+# %% ../nbs/05_search.ipynb 37
 from numpy.lib.recfunctions import append_fields, drop_fields
 
 
@@ -434,7 +651,7 @@ def remove_column(recarray:np.ndarray, name:str)->np.ndarray:
         recarray = drop_fields(recarray, name, usemask=False, asrecarray=True)
     return recarray
 
-# %% ../nbs/05_search.ipynb 32
+# %% ../nbs/05_search.ipynb 40
 from numba.typed import List
 
 FRAG_DTYPE = np.dtype([('ion_index', 'int64'), ('fragment_ion_type', 'int64'), ('fragment_ion_int', 'int64'), ('db_int', 'int64'),
@@ -494,13 +711,209 @@ def get_hits(query_frag:np.ndarray, query_int:np.ndarray, db_frag:np.ndarray, db
     return fragment_ions
 
 
-# %% ../nbs/05_search.ipynb 34
+# %% ../nbs/05_search.ipynb 42
 from . import constants
 LOSS_DICT = constants.loss_dict
 LOSSES = np.array(list(LOSS_DICT.values()))
 
+@alphapept.performance.performance_function(compilation_mode="numba-multithread")
+def count_fragment_ions(psm_idx:int, query_idxs:np.ndarray, db_idxs:np.ndarray, query_indices:np.ndarray, query_frags:np.ndarray, db_indices:np.ndarray, db_frags:np.ndarray, mtol:float, ppm:bool, losses:np.ndarray, n_ions:np.ndarray):
+    """Counts the fragment ions of a PSM that are matched for any of the losses, see get_hits.
+
+    Args:
+        psm_idx (int): Index of the PSM.
+        query_idxs (np.ndarray): Array with the query index of each PSM.
+        db_idxs (np.ndarray): Array with the database index of each PSM.
+        query_indices (np.ndarray): Array with indices to the query data.
+        query_frags (np.ndarray): Array with fragment masses of the query data.
+        db_indices (np.ndarray): Array with indices to the database array.
+        db_frags (np.ndarray): Array with fragment masses of the database.
+        mtol (float): Mass tolerance.
+        ppm (bool): Flag to use ppm instead of Dalton.
+        losses (np.ndarray): Array with losses.
+        n_ions (np.ndarray): Reporting array that stores the number of matched fragment ions per PSM.
+    """
+    query_idx = query_idxs[psm_idx]
+    db_idx = db_idxs[psm_idx]
+
+    count = 0
+
+    for off in losses:
+        q, d = query_indices[query_idx], db_indices[db_idx]
+        while q < query_indices[query_idx + 1] and d < db_indices[db_idx + 1]:
+            mass1 = query_frags[q]
+            mass2 = db_frags[d] - off
+            delta_mass = mass1 - mass2
+
+            if ppm:
+                sum_mass = mass1 + mass2
+                mass_difference = 2 * delta_mass / sum_mass * 1e6
+            else:
+                mass_difference = delta_mass
+
+            if abs(mass_difference) <= mtol:
+                count += 1
+                d += 1
+                q += 1  # Only one query for each db element
+            elif delta_mass < 0:
+                q += 1
+            elif delta_mass > 0:
+                d += 1
+
+    n_ions[psm_idx] = count
+
+
+@alphapept.performance.performance_function(compilation_mode="numba-multithread")
+def fill_fragment_ions(psm_idx:int, query_idxs:np.ndarray, db_idxs:np.ndarray, query_masses:np.ndarray, query_masses_raw:np.ndarray, query_frags:np.ndarray, query_ints:np.ndarray, query_indices:np.ndarray, db_masses:np.ndarray, db_frags:np.ndarray, frag_types:np.ndarray, db_ints:np.ndarray, use_db_ints:bool, db_indices:np.ndarray, mtol:float, ppm:bool, losses:np.ndarray, ion_offsets:np.ndarray, psms_:np.ndarray, ions_:np.ndarray):
+    """Writes the matched fragment ions of a PSM to ions_ starting at its offset and the derived score columns to psms_.
+
+    The matching is identical to get_hits and count_fragment_ions. Only the first three losses are reported in the hits columns.
+
+    Args:
+        psm_idx (int): Index of the PSM.
+        query_idxs (np.ndarray): Array with the query index of each PSM.
+        db_idxs (np.ndarray): Array with the database index of each PSM.
+        query_masses (np.ndarray): Array with query masses.
+        query_masses_raw (np.ndarray): Array with raw query masses.
+        query_frags (np.ndarray): Array with fragment masses of the query data.
+        query_ints (np.ndarray): Array with fragment intensities from the query.
+        query_indices (np.ndarray): Array with indices to the query data.
+        db_masses (np.ndarray): Array with database masses.
+        db_frags (np.ndarray): Array with fragment masses of the database.
+        frag_types (np.ndarray): Array with fragment types.
+        db_ints (np.ndarray): Array with database intensities per fragment. Only used if use_db_ints.
+        use_db_ints (bool): Flag to use db_ints instead of an intensity of 1 for all database fragments.
+        db_indices (np.ndarray): Array with indices to the database array.
+        mtol (float): Mass tolerance.
+        ppm (bool): Flag to use ppm instead of Dalton.
+        losses (np.ndarray): Array with losses.
+        ion_offsets (np.ndarray): Array with the position of the first fragment ion of each PSM in ions_.
+        psms_ (np.ndarray): Reporting recordarray for the score columns.
+        ions_ (np.ndarray): Reporting recordarray for the fragment ions.
+    """
+    query_idx = query_idxs[psm_idx]
+    db_idx = db_idxs[psm_idx]
+    query_idx_start = query_indices[query_idx]
+    query_idx_end = query_indices[query_idx + 1]
+    db_idx_start = db_indices[db_idx]
+    db_idx_end = db_indices[db_idx + 1]
+
+    psm = psms_[psm_idx]
+
+    psm['mass_db'] = db_masses[db_idx]
+    psm['n_frags_db'] = db_idx_end - db_idx_start
+
+    psm['prec_offset'] = query_masses[query_idx] - db_masses[db_idx]
+    psm['prec_offset_ppm'] = 2 * psm['prec_offset'] / (query_masses[query_idx]  + db_masses[db_idx] ) * 1e6
+
+    psm['prec_offset_raw'] = query_masses_raw[query_idx] - db_masses[db_idx]
+    psm['prec_offset_raw_ppm'] = 2 * psm['prec_offset_raw'] / (query_masses_raw[query_idx]  + db_masses[db_idx] ) * 1e6
+
+    pointer = ion_offsets[psm_idx]
+
+    n_by = 0
+    delta_m_sum = np.float32(0)
+    matched_int_sum = 0
+    int_ratio_sum = 0.
+    hits_b, hits_y, hits_b_h2o, hits_y_h2o, hits_b_nh3, hits_y_nh3 = 0, 0, 0, 0, 0, 0
+
+    for loss_idx, off in enumerate(losses):
+        q, d = query_idx_start, db_idx_start
+        while q < query_idx_end and d < db_idx_end:
+            mass1 = query_frags[q]
+            mass2 = db_frags[d] - off
+            delta_mass = mass1 - mass2
+
+            if ppm:
+                sum_mass = mass1 + mass2
+                mass_difference = 2 * delta_mass / sum_mass * 1e6
+            else:
+                mass_difference = delta_mass
+
+            if abs(mass_difference) <= mtol:
+                ion = ions_[pointer]
+                ion['ion_index'] = frag_types[d]
+                ion['fragment_ion_type'] = loss_idx
+                ion['fragment_ion_int'] = query_ints[q]
+                if use_db_ints:
+                    ion['db_int'] = db_ints[d]
+                else:
+                    ion['db_int'] = 1
+                ion['fragment_ion_mass'] = mass1
+                ion['db_mass'] = mass2
+                ion['query_idx'] = q - query_idx_start
+                ion['db_idx'] = d - db_idx_start
+                ion['psms_idx'] = psm_idx
+
+                matched_int_sum += ion['fragment_ion_int']
+                int_ratio_sum += ion['fragment_ion_int'] / ion['db_int']
+
+                if loss_idx == 0:
+                    n_by += 1
+                    delta_m_sum += ion['fragment_ion_mass'] - ion['db_mass']
+                    if ion['ion_index'] > 0:
+                        hits_b += 1
+                    elif ion['ion_index'] < 0:
+                        hits_y += 1
+                elif loss_idx == 1:
+                    if ion['ion_index'] > 0:
+                        hits_b_h2o += 1
+                    elif ion['ion_index'] < 0:
+                        hits_y_h2o += 1
+                elif loss_idx == 2:
+                    if ion['ion_index'] > 0:
+                        hits_b_nh3 += 1
+                    elif ion['ion_index'] < 0:
+                        hits_y_nh3 += 1
+
+                pointer += 1
+                d += 1
+                q += 1  # Only one query for each db element
+            elif delta_mass < 0:
+                q += 1
+            elif delta_mass > 0:
+                d += 1
+
+    n_fragments_matched = pointer - ion_offsets[psm_idx]
+
+    if n_by > 0:
+        psm['delta_m'] = delta_m_sum / n_by
+        delta_m_ppm_sum = 0.
+        for i in range(ion_offsets[psm_idx], ion_offsets[psm_idx] + n_by):
+            delta_m_ppm_sum += 2 * psm['delta_m'] / (ions_[i]['fragment_ion_mass'] + ions_[i]['db_mass']) * 1e6
+        psm['delta_m_ppm'] = delta_m_ppm_sum / n_by
+    else:
+        psm['delta_m'] = np.nan
+        psm['delta_m_ppm'] = np.nan
+
+    int_sum = np.float32(0)
+    for q in range(query_idx_start, query_idx_end):
+        int_sum += query_ints[q]
+    psm['fragments_int_sum'] = int_sum
+    psm['fragments_matched_int_sum'] = matched_int_sum
+
+    if psm['fragments_int_sum'] != 0:
+        psm['fragments_matched_int_ratio'] = psm['fragments_matched_int_sum'] / psm['fragments_int_sum']
+    else:
+        psm['fragments_matched_int_ratio'] = np.nan
+
+    if n_fragments_matched > 0:
+        psm['fragments_int_ratio'] = int_ratio_sum / n_fragments_matched
+    else:
+        psm['fragments_int_ratio'] = np.nan
+
+    psm['hits_b'] = hits_b
+    psm['hits_y'] = hits_y
+    psm['hits_b-H2O'] = hits_b_h2o
+    psm['hits_y-H2O'] = hits_y_h2o
+    psm['hits_b-NH3'] = hits_b_nh3
+    psm['hits_y-NH3'] = hits_y_nh3
+
+    psm['n_fragments_matched'] = n_fragments_matched
+    psm['fragment_ion_idx'] = ion_offsets[psm_idx]
+
+
 #This function is a wrapper and ist tested by the quick_test
-@njit
 def score(
     psms: np.recarray,
     query_masses: np.ndarray,
@@ -520,6 +933,8 @@ def score(
 ) -> (np.ndarray, np.ndarray):
     """Function to extract score columns when giving a recordarray with PSMs.
 
+    The fragment ions of all PSMs are counted in parallel first, so that each PSM can write its ions to a precomputed offset in a second parallel pass.
+
     Args:
         psms (np.recarray): Recordarray containing PSMs.
         query_masses (np.ndarray): Array with query masses.
@@ -534,82 +949,37 @@ def score(
         db_indices (np.ndarray): Array with indices to the database array.
         ppm (bool): Flag to use ppm instead of Dalton.
         psms_dtype (list): List describing the dtype of the PSMs record array.
-        db_ints (np.ndarray, optional): Array with database intensities. Defaults to None.
+        db_ints (np.ndarray, optional): Array with database intensities per fragment. Defaults to None.
         parallel (bool, optional): Flag to use parallel processing. Defaults to False.
 
     Returns:
         np.recarray: Recordarray containing PSMs with additional columns.
         np.ndarray: NumPy array containing ion information.
     """
+    query_idxs = np.ascontiguousarray(psms['query_idx'])
+    db_idxs = np.ascontiguousarray(psms['db_idx'])
+    query_frags = np.asarray(query_frags)
+    query_ints = np.asarray(query_ints)
+    query_indices = np.asarray(query_indices)
 
-    psms_ = np.zeros(len(psms), dtype=psms_dtype)
-    ions_ = np.zeros(np.sum(psms['hits'].astype('int')*len(LOSSES)), dtype=FRAG_DTYPE)
-    
-    ion_count = 0
-
-    for i in range(len(psms)):
-        query_idx = psms[i]["query_idx"]
-        db_idx = psms[i]["db_idx"]
-        query_idx_start = query_indices[query_idx]
-        query_idx_end = query_indices[query_idx + 1]
-        query_frag = query_frags[query_idx_start:query_idx_end]
-        query_int = query_ints[query_idx_start:query_idx_end]
-        db_frag = db_frags[db_indices[db_idx]:db_indices[db_idx+1]]
-        frag_type = frag_types[db_indices[db_idx]:db_indices[db_idx+1]]
-
-        if db_ints is None:
-            db_int = np.ones(len(db_frag))
-        else:
-            db_int = db_ints[i]
-
-        fragment_ions = get_hits(query_frag, query_int, db_frag, db_int, frag_type, mtol, ppm, LOSSES)
-        
-        psms_['mass_db'][i] = db_masses[db_idx]
-        
-        psms_['n_frags_db'][i] = len(db_frag)
-        
-        psms_['prec_offset'][i] = query_masses[query_idx] - db_masses[db_idx]
-        psms_['prec_offset_ppm'][i] = 2 * psms_['prec_offset'][i] / (query_masses[query_idx]  + db_masses[db_idx] ) * 1e6
-
-        psms_['prec_offset_raw'][i] = query_masses_raw[query_idx] - db_masses[db_idx]
-        psms_['prec_offset_raw_ppm'][i] = 2 * psms_['prec_offset_raw'][i] / (query_masses_raw[query_idx]  + db_masses[db_idx] ) * 1e6
-
-        ions_by = fragment_ions[fragment_ions['fragment_ion_type']==0]
-        ions_h2o = fragment_ions[fragment_ions['fragment_ion_type']==1]
-        ions_nh3 = fragment_ions[fragment_ions['fragment_ion_type']==2]
+    n_ions = np.zeros(len(psms), dtype=np.int64)
+    count_fragment_ions(range(len(psms)), query_idxs, db_idxs, query_indices, query_frags, db_indices, db_frags, mtol, ppm, LOSSES, n_ions)
 
-        psms_['delta_m'][i] = np.mean(ions_by['fragment_ion_mass']-ions_by['db_mass'])
-        psms_['delta_m_ppm'][i] = np.mean(2 * psms_['delta_m'][i] / (ions_by['fragment_ion_mass']  + ions_by['db_mass'] ) * 1e6)
+    ion_offsets = np.zeros(len(psms) + 1, dtype=np.int64)
+    np.cumsum(n_ions, out=ion_offsets[1:])
 
-        psms_['fragments_int_sum'][i] = np.sum(query_int)
-        psms_['fragments_matched_int_sum'][i] = np.sum(fragment_ions['fragment_ion_int'])
-        psms_['fragments_matched_int_ratio'][i] = psms_['fragments_matched_int_sum'][i] / psms_['fragments_int_sum'][i]
-        psms_['fragments_int_ratio'][i] = np.mean(fragment_ions['fragment_ion_int']/fragment_ions['db_int']) #3 is db_int, 2 is query_int
-
-        psms_['hits_b'][i] = np.sum(ions_by['ion_index']>0)
-        psms_['hits_y'][i] = np.sum(ions_by['ion_index']<0)
-
-        psms_['hits_b-H2O'][i] = np.sum(ions_h2o['ion_index']>0)
-        psms_['hits_y-H2O'][i] = np.sum(ions_h2o['ion_index']<0)
-
-        psms_['hits_b-NH3'][i] = np.sum(ions_nh3['ion_index']>0)
-        psms_['hits_y-NH3'][i] = np.sum(ions_nh3['ion_index']<0)
+    psms_ = np.zeros(len(psms), dtype=psms_dtype)
+    ions_ = np.zeros(ion_offsets[-1], dtype=FRAG_DTYPE)
 
-        n_fragments_matched = len(fragment_ions)
+    use_db_ints = db_ints is not None
+    if not use_db_ints:
+        db_ints = np.ones(1)
 
-        psms_['n_fragments_matched'][i] = n_fragments_matched
-        psms_['fragment_ion_idx'][i] = ion_count
-        fragment_ions['psms_idx'][:] = i #Save psms index
-        
-        ions_[ion_count:ion_count+len(fragment_ions)] = fragment_ions
-
-        ion_count += n_fragments_matched
-    
-    ions_ = ions_[:ion_count]
+    fill_fragment_ions(range(len(psms)), query_idxs, db_idxs, query_masses, query_masses_raw, query_frags, query_ints, query_indices, db_masses, db_frags, frag_types, db_ints, use_db_ints, db_indices, mtol, ppm, LOSSES, ion_offsets, psms_, ions_)
 
     return psms_, ions_
 
-# %% ../nbs/05_search.ipynb 35
+# %% ../nbs/05_search.ipynb 44
 from numba.typed import Dict
 def get_sequences(psms: np.recarray, db_seqs:np.ndarray)-> np.ndarray:
     """Get sequences to add them to a recarray
@@ -625,7 +995,7 @@ def get_sequences(psms: np.recarray, db_seqs:np.ndarray)-> np.ndarray:
 
     return sequence_list
 
-# %% ../nbs/05_search.ipynb 37
+# %% ../nbs/05_search.ipynb 46
 from typing import Union
 
 #This function is a wrapper and ist tested by the quick_test
@@ -640,6 +1010,7 @@ def get_score_columns(
     ppm:bool,
     prec_tol_calibrated:Union[None, float]=None,
     frag_tol_calibrated:float = None,
+    query_fragments: tuple = None,
     **kwargs
 ) -> (np.ndarray, np.ndarray):
     """Wrapper function to extract score columns.
@@ -647,7 +1018,7 @@ def get_score_columns(
     Args:
         psms (np.recarray): Recordarray containing PSMs.
         query_data (dict): Data structure containing the query data.
-        db_data: Union[dict, str]: Data structure containing the database data or path to database.
+        db_data: Union[dict, str]: Data structure containing the database data, a MappedDatabase or path to database.
         features (pd.DataFrame): Pandas dataframe containing feature data.
         parallel (bool): Flag to use parallel processing.
         frag_tol (float): Fragment tolerance for search.
@@ -655,16 +1026,17 @@ def get_score_columns(
         ppm (bool): Flag to use ppm instead of Dalton.
         prec_tol_calibrated (Union[None, float], optional): Calibrated offset mass. Defaults to None.
         frag_tol_calibrated (float, optional): Fragment tolerance if calibration exists. Defaults to None.
+        query_fragments (tuple, optional): Fragment indices, masses and intensities per feature as returned by get_query_fragments. Computed if None. Defaults to None.
 
     Returns:
         np.recarray: Recordarray containing PSMs with additional columns.
         np.ndarray: NumPy array containing ion information.
     """
     logging.info('Extracting columns for scoring.')
-    query_indices = query_data["indices_ms2"]
+    if query_fragments is None:
+        query_fragments = get_query_fragments(query_data, features)
+    query_indices, query_frags, query_ints = query_fragments
     query_charges = query_data['charge2']
-    query_frags = query_data['mass_list_ms2']
-    query_ints = query_data['int_list_ms2']
     query_scans = query_data['scan_list_ms2']
     
     if frag_tol_calibrated:
@@ -677,26 +1049,17 @@ def get_score_columns(
         bruker = False
 
     if isinstance(db_data, str):
-        db_masses = read_database(db_data, array_name = 'precursors')
-        db_frags = read_database(db_data, array_name = 'fragmasses')
-        db_indices = read_database(db_data, array_name = 'indices')
-        frag_types = read_database(db_data, array_name = 'fragtypes')
+        db_data = MappedDatabase(db_data)
 
-        try:
-            db_ints = read_database(db_data, array_name = 'db_ints')
-        except KeyError:
-            db_ints = None
+    db_masses = db_data['precursors']
+    db_frags = db_data['fragmasses']
+    db_indices = db_data['indices']
+    frag_types = db_data['fragtypes']
 
+    if 'db_ints' in db_data.keys():
+        db_ints = db_data['db_ints']
     else:
-        db_masses = db_data['precursors']
-        db_frags = db_data['fragmasses']
-        db_indices = db_data['indices']
-        frag_types = db_data['fragtypes']
-
-        if 'db_ints' in db_data.keys():
-            db_ints = db_data['db_ints']
-        else:
-            db_ints = None
+        db_ints = None
 
     if features is not None:
         if prec_tol_calibrated:
@@ -713,26 +1076,6 @@ def get_score_columns(
 
         if bruker:
             query_prec_id = query_prec_id[features['query_idx'].values]
-
-        query_selection = features['query_idx'].values
-        indices = np.zeros(len(query_selection) + 1, np.int64)
-        indices[1:] = np.diff(query_indices)[query_selection]
-        indices = np.cumsum(indices)
-        query_frags = np.concatenate(
-            [
-                query_frags[s: e] for s, e in zip(
-                    query_indices[query_selection], query_indices[query_selection + 1]
-                )
-            ]
-        )
-        query_ints = np.concatenate(
-            [
-                query_ints[s: e] for s, e in zip(
-                    query_indices[query_selection], query_indices[query_selection + 1]
-                )
-            ]
-        )
-        query_indices = indices
     else:
         #TODO: This code is outdated, callin with features = None will crash.
         query_masses = query_data['prec_mass_list2']
@@ -766,10 +1109,7 @@ def get_score_columns(
     rts = np.array(query_rt)[psms["query_idx"]]
     psms = add_column(psms, rts, 'rt')
 
-    if isinstance(db_data, str):
-        db_seqs = read_database(db_data, array_name = 'seqs').astype(str)
-    else:
-        db_seqs = db_data['seqs']
+    db_seqs = db_data['seqs']
 
     seqs = get_sequences(psms, db_seqs)
 
@@ -807,7 +1147,7 @@ def get_score_columns(
 
     return psms, fragment_ions
 
-# %% ../nbs/05_search.ipynb 39
+# %% ../nbs/05_search.ipynb 48
 import matplotlib.pyplot as plt
 
 def plot_psms(index, ms_file):
@@ -865,7 +1205,7 @@ def plot_psms(index, ms_file):
     plt.title(figure_title)
     plt.show()
 
-# %% ../nbs/05_search.ipynb 42
+# %% ../nbs/05_search.ipynb 51
 import os
 import pandas as pd
 import copy
@@ -924,7 +1264,7 @@ def search_db(to_process:tuple, callback:Callable = None, parallel:bool=False, f
         feature_calibration = False
 
         ms_file_ = alphapept.io.MS_Data_File(
-            f"{ms_file}"
+            f"{ms_file}", is_overwritable=True
         )
 
         if not first_search:
@@ -950,19 +1290,22 @@ def search_db(to_process:tuple, callback:Callable = None, parallel:bool=False, f
                 logging.info(f'{e}')                
      
         if not skip:
-            db_data_path = settings['experiment']['database_path']
+            db_data = MappedDatabase(settings['experiment']['database_path'])
 
     #         TODO calibrated_fragments should be included in settings
-            query_data = ms_file_.read_DDA_query_data(
-                calibrated_fragments=True,
-                database_file_name=settings['experiment']['database_path']
-            )
+            with ms_file_.session(mode='a'):
+                query_data = ms_file_.read_DDA_query_data(
+                    calibrated_fragments=True,
+                    database_file_name=settings['experiment']['database_path']
+                )
+
+                features = ms_file_.read(dataset_name="features")
 
-            features = ms_file_.read(dataset_name="features")
+            query_fragments = get_query_fragments(query_data, features)
 
-            psms, num_specs_compared = get_psms(query_data, db_data_path, features, **settings["search"])
+            psms, num_specs_compared = get_psms(query_data, db_data, features, query_fragments=query_fragments, **settings["search"])
             if len(psms) > 0:
-                psms, fragment_ions = get_score_columns(psms, query_data, db_data_path, features, **settings["search"])
+                psms, fragment_ions = get_score_columns(psms, query_data, db_data, features, query_fragments=query_fragments, **settings["search"])
 
                 if first_search:
                     logging.info('Saving first_search results to {}'.format(ms_file))
@@ -971,8 +1314,9 @@ def search_db(to_process:tuple, callback:Callable = None, parallel:bool=False, f
                     logging.info('Saving second_search results to {}'.format(ms_file))
                     save_field = 'second_search'
 
-                store_hdf(pd.DataFrame(psms), ms_file_, save_field, replace=True)
-                store_hdf(pd.DataFrame.from_records(fragment_ions), ms_file_, 'fragment_ions', replace=True)
+                with ms_file_.session(mode='a'):
+                    store_hdf(pd.DataFrame(psms), ms_file_, save_field, replace=True)
+                    store_hdf(pd.DataFrame.from_records(fragment_ions), ms_file_, 'fragment_ions', replace=True)
             else:
                 logging.info('No psms found.')
 
@@ -982,10 +1326,91 @@ def search_db(to_process:tuple, callback:Callable = None, parallel:bool=False, f
         logging.error(f'Search of file {file_name} failed. Exception {e}.')
         return f"{e}" #Can't return exception object, cast as string
 
-# %% ../nbs/05_search.ipynb 44
+# %% ../nbs/05_search.ipynb 53
+import tempfile
+import shutil
+
+QUERY_CACHE_KEYS = ['indices_ms2', 'mass_list_ms2', 'int_list_ms2', 'charge2', 'scan_list_ms2', 'prec_mass_list2', 'mono_mzs2', 'rt_list_ms2', 'prec_id2']
+
+_QUERY_CACHE = {}
+
+def save_query_cache(ms_file: str, cache_path: str):
+    """Save the query data and features of an ms_data file that are needed for a search as .npy files, so that they can be memory-mapped.
+
+    The fragments of the features are gathered once, see get_query_fragments.
+
+    Args:
+        ms_file (str): Path to the ms_data file.
+        cache_path (str): Folder to save the .npy files to. Is created if it does not exist.
+    """
+    os.makedirs(cache_path, exist_ok=True)
+
+    ms_file_ = alphapept.io.MS_Data_File(ms_file)
+    query_data = ms_file_.read_DDA_query_data(swmr=True, mmap=True)
+
+    try:
+        features = ms_file_.read(dataset_name="features", swmr=True)
+    except (FileNotFoundError, KeyError):
+        features = None
+
+    for key in QUERY_CACHE_KEYS:
+        if key in query_data:
+            np.save(os.path.join(cache_path, f'{key}.npy'), query_data[key])
+
+    if features is not None:
+        np.save(os.path.join(cache_path, 'features.npy'), features.to_records(index=False))
+
+    for key, values in zip(['query_indices', 'query_frags', 'query_ints'], get_query_fragments(query_data, features)):
+        np.save(os.path.join(cache_path, f'{key}.npy'), values)
+
+
+def load_query_cache(cache_path: str) -> (dict, pd.DataFrame, tuple):
+    """Load the query data and features that were saved with save_query_cache.
+
+    Arrays are memory-mapped and loaded only once per process, until they are released with clear_query_cache.
+
+    Args:
+        cache_path (str): Folder with the .npy files.
+
+    Returns:
+        dict: Query data.
+        pd.DataFrame: Features, None if the ms_data file had no features.
+        tuple: Fragment indices, masses and intensities per feature as returned by get_query_fragments.
+    """
+    if cache_path not in _QUERY_CACHE:
+        query_data = {}
+        for key in QUERY_CACHE_KEYS:
+            file_name = os.path.join(cache_path, f'{key}.npy')
+            if os.path.isfile(file_name):
+                query_data[key] = np.load(file_name, mmap_mode='r')
+
+        file_name = os.path.join(cache_path, 'features.npy')
+        if os.path.isfile(file_name):
+            features = pd.DataFrame(np.load(file_name))
+        else:
+            features = None
+
+        query_fragments = tuple(np.load(os.path.join(cache_path, f'{key}.npy'), mmap_mode='r') for key in ['query_indices', 'query_frags', 'query_ints'])
+
+        _QUERY_CACHE[cache_path] = query_data, features, query_fragments
+
+    return _QUERY_CACHE[cache_path]
+
+
+def clear_query_cache(keep: list = None):
+    """Release the memory-mapped query caches of this process, so that their files can be deleted.
+
+    Args:
+        keep (list, optional): Cache folders that are still in use and are kept. Defaults to None.
+    """
+    for cache_path in list(_QUERY_CACHE):
+        if (keep is None) or (cache_path not in keep):
+            del _QUERY_CACHE[cache_path]
+
+# %% ../nbs/05_search.ipynb 55
 from .fasta import blocks, generate_peptides, add_to_pept_dict
 from .io import list_to_numpy_f32
-from .fasta import block_idx, generate_fasta_list, generate_spectra, check_peptide
+from .fasta import block_idx, generate_fasta_list, generate_spectra_flat, check_peptide
 from . import constants
 mass_dict = constants.mass_dict
 import os
@@ -997,7 +1422,7 @@ def search_fasta_block(to_process:tuple) -> (list, int):
     For searches with big fasta files or unspecific searches.
 
     Args:
-        to_process (tuple): Tuple containing a fasta_index, fasta_block, a list of files and a list of experimental settings.
+        to_process (tuple): Tuple containing a fasta_index, fasta_block, a list of files, a list of experimental settings and optionally a list of query caches, see save_query_cache.
 
     Returns:
         list: A list of dataframes when searching the respective file.
@@ -1005,7 +1430,12 @@ def search_fasta_block(to_process:tuple) -> (list, int):
     """   
 
     try:
-        fasta_index, fasta_block, ms_files, settings = to_process
+        fasta_index, fasta_block, ms_files, settings = to_process[:4]
+        query_caches = to_process[4] if len(to_process) > 4 else None
+
+        if query_caches is not None:
+            # Release caches of previous searches, e.g. inherited from the parent process
+            clear_query_cache(keep=query_caches)
 
         settings_ = settings[0]
         spectra_block = settings_['fasta']['spectra_block']
@@ -1031,61 +1461,40 @@ def search_fasta_block(to_process:tuple) -> (list, int):
         if len(to_add) > 0:
             for seq_block in blocks(to_add, spectra_block):
 
-                spectra = generate_spectra(seq_block, mass_dict)
-
-                precmasses, seqs, fragmasses, fragtypes = zip(*spectra)
-                sortindex = np.argsort(precmasses)
-
-                fragmasses = np.array(fragmasses, dtype=object)[sortindex]
-                fragtypes = np.array(fragtypes, dtype=object)[sortindex]
-
-                lens = [len(_) for _ in fragmasses]
-
-                n_frags = sum(lens)
-
-                frags = np.zeros(n_frags, dtype=fragmasses[0].dtype)
-                frag_types = np.zeros(n_frags, dtype=fragtypes[0].dtype)
+                db_data = generate_spectra_flat(seq_block, mass_dict)
 
-                indices = np.zeros(len(lens) + 1, np.int64)
-                indices[1:] = lens
-                indices = np.cumsum(indices)
-
-                #Fill data
-
-                for _ in range(len(indices)-1):
-                    start = indices[_]
-                    end = indices[_+1]
-                    frags[start:end] = fragmasses[_]
-                    frag_types[start:end] = fragtypes[_]
-
-                db_data = {}
-
-                db_data["precursors"] = np.array(precmasses)[sortindex]
-                db_data["seqs"] = np.array(seqs)[sortindex]
-
-                db_data["fragmasses"] = frags
-                db_data["fragtypes"] = frag_types
-                db_data["indices"] = indices
+                if settings_['search'].get('fragment_index', False):
+                    # Build the fragment index once, all files reuse it in get_psms
+                    (
+                        db_data['fragment_index_indptr'],
+                        db_data['fragment_index_db_idx'],
+                        db_data['fragment_index_fragmasses']
+                    ) = build_fragment_index(db_data['fragmasses'], db_data['indices'])
 
                 for file_idx, ms_file in enumerate(ms_files):
-                    query_data = alphapept.io.MS_Data_File(
-                        f"{ms_file}"
-                    ).read_DDA_query_data(swmr=True)
+                    if query_caches is not None:
+                        query_data, features, query_fragments = load_query_cache(query_caches[file_idx])
+                    else:
+                        query_data = alphapept.io.MS_Data_File(
+                            f"{ms_file}"
+                        ).read_DDA_query_data(swmr=True, mmap=True)
 
-                    try:
-                        features = alphapept.io.MS_Data_File(
-                            ms_file
-                        ).read(dataset_name="features",swmr=True)
-                    except FileNotFoundError:
-                        features = None
-                    except KeyError:
-                        features = None
+                        try:
+                            features = alphapept.io.MS_Data_File(
+                                ms_file
+                            ).read(dataset_name="features",swmr=True)
+                        except FileNotFoundError:
+                            features = None
+                        except KeyError:
+                            features = None
 
-                    psms, num_specs_compared = get_psms(query_data, db_data, features, **settings[file_idx]["search"])
+                        query_fragments = get_query_fragments(query_data, features)
+
+                    psms, num_specs_compared = get_psms(query_data, db_data, features, query_fragments=query_fragments, **settings[file_idx]["search"])
 
                     if len(psms) > 0:
                         #This could be speed up..
-                        psms, fragment_ions = get_score_columns(psms, query_data, db_data, features, **settings[file_idx]["search"])
+                        psms, fragment_ions = get_score_columns(psms, query_data, db_data, features, query_fragments=query_fragments, **settings[file_idx]["search"])
 
                         fasta_indices = [set(x for x in pept_dict[_]) for _ in psms['sequence']]
 
@@ -1102,7 +1511,7 @@ def search_fasta_block(to_process:tuple) -> (list, int):
     
     return psms_container, len(to_add), success
 
-# %% ../nbs/05_search.ipynb 45
+# %% ../nbs/05_search.ipynb 56
 def filter_top_n(temp:pd.DataFrame, top_n:int = 10)-> pd.DataFrame:
     """Takes a dataframe and keeps only the top n entries (based on hits).
     Combines fasta indices for sequences.
@@ -1136,7 +1545,201 @@ def filter_top_n(temp:pd.DataFrame, top_n:int = 10)-> pd.DataFrame:
     return temp
 
 
-# %% ../nbs/05_search.ipynb 47
+# %% ../nbs/05_search.ipynb 58
+@njit
+def merge_top_n(raw_idxs: np.ndarray, hits: np.ndarray, seq_ids: np.ndarray, feature_idxs: np.ndarray, row_ids: np.ndarray, top_hits: np.ndarray, top_rows: np.ndarray, top_seq_ids: np.ndarray, top_feature_idxs: np.ndarray, top_count: np.ndarray):
+    """Merges PSMs into per-spectrum min-heaps that keep the top_n PSMs with the most hits.
+
+    A PSM with the same spectrum, sequence, hits and feature as a kept PSM is a duplicate and skipped.
+    On ties, PSMs that were merged first are kept.
+
+    Args:
+        raw_idxs (np.ndarray): Raw spectrum index of each PSM.
+        hits (np.ndarray): Hits of each PSM.
+        seq_ids (np.ndarray): Sequence id of each PSM.
+        feature_idxs (np.ndarray): Feature index of each PSM.
+        row_ids (np.ndarray): Row id of each PSM.
+        top_hits (np.ndarray): 2D array (spectrum x top_n) with the hits of the kept PSMs, ordered as a min-heap per spectrum.
+        top_rows (np.ndarray): 2D array (spectrum x top_n) with the row ids of the kept PSMs.
+        top_seq_ids (np.ndarray): 2D array (spectrum x top_n) with the sequence ids of the kept PSMs.
+        top_feature_idxs (np.ndarray): 2D array (spectrum x top_n) with the feature indices of the kept PSMs.
+        top_count (np.ndarray): Number of kept PSMs per spectrum.
+    """
+    top_n = top_hits.shape[1]
+
+    for i in range(len(raw_idxs)):
+        r = raw_idxs[i]
+        n = top_count[r]
+
+        duplicate = False
+        for j in range(n):
+            if (top_seq_ids[r, j] == seq_ids[i]) and (top_hits[r, j] == hits[i]) and (top_feature_idxs[r, j] == feature_idxs[i]):
+                duplicate = True
+                break
+        if duplicate:
+            continue
+
+        if n < top_n:
+            # Sift up from the first empty position
+            j = n
+            top_count[r] += 1
+            while j > 0:
+                parent = (j - 1) // 2
+                if top_hits[r, parent] <= hits[i]:
+                    break
+                top_hits[r, j] = top_hits[r, parent]
+                top_rows[r, j] = top_rows[r, parent]
+                top_seq_ids[r, j] = top_seq_ids[r, parent]
+                top_feature_idxs[r, j] = top_feature_idxs[r, parent]
+                j = parent
+        elif hits[i] > top_hits[r, 0]:
+            # Replace the minimum and sift down
+            j = 0
+            while True:
+                child = 2 * j + 1
+                if child >= top_n:
+                    break
+                if (child + 1 < top_n) and (top_hits[r, child + 1] < top_hits[r, child]):
+                    child += 1
+                if top_hits[r, child] >= hits[i]:
+                    break
+                top_hits[r, j] = top_hits[r, child]
+                top_rows[r, j] = top_rows[r, child]
+                top_seq_ids[r, j] = top_seq_ids[r, child]
+                top_feature_idxs[r, j] = top_feature_idxs[r, child]
+                j = child
+        else:
+            continue
+
+        top_hits[r, j] = hits[i]
+        top_rows[r, j] = row_ids[i]
+        top_seq_ids[r, j] = seq_ids[i]
+        top_feature_idxs[r, j] = feature_idxs[i]
+
+
+class TopNAccumulator():
+    """Accumulates the PSMs of a file over FASTA blocks and only keeps the top_n PSMs with the most hits per raw spectrum.
+
+    This keeps the same PSMs as filter_top_n on all PSMs at once, apart from ties, but merges each block in O(n_psms * top_n).
+    The fasta indices of all PSMs are combined per sequence, and a DataFrame is only created at the end with to_df.
+    Each sequence gets a fixed id in the order it is first seen. The seen sequences are kept as sorted array with the permutation to their ids, so that only unseen sequences are inserted and stored ids never change.
+    The (sequence id, fasta index) pairs are stored per block and only combined once in to_df.
+
+    Args:
+        top_n (int, optional): Number of top-n entries to be kept. Defaults to 10.
+    """
+    def __init__(self, top_n: int = 10):
+        self.top_n = top_n
+        self.top_hits = np.zeros((0, top_n), dtype=np.float64)
+        self.top_rows = np.zeros((0, top_n), dtype=np.int64)
+        self.top_seq_ids = np.zeros((0, top_n), dtype=np.int64)
+        self.top_feature_idxs = np.zeros((0, top_n), dtype=np.int64)
+        self.top_count = np.zeros(0, dtype=np.int64)
+        self.sequences = np.zeros(0, dtype=str)
+        self.sequence_ids = np.zeros(0, dtype=np.int64)
+        self.pair_seq_ids = []
+        self.pair_fasta_indices = []
+        self.rows = []
+        self.n_rows = 0
+
+    def _resize(self, n_raw: int):
+        """Grow the per-spectrum arrays to hold at least n_raw spectra."""
+        n_raw_ = len(self.top_count)
+        if n_raw > n_raw_:
+            n_raw = max(n_raw, 2 * n_raw_)
+            for name in ['top_hits', 'top_rows', 'top_seq_ids', 'top_feature_idxs']:
+                array = getattr(self, name)
+                array_ = np.zeros((n_raw, self.top_n), dtype=array.dtype)
+                array_[:n_raw_] = array
+                setattr(self, name, array_)
+            self.top_count = np.concatenate([self.top_count, np.zeros(n_raw - n_raw_, dtype=np.int64)])
+
+    def _get_seq_ids(self, sequences: np.ndarray) -> np.ndarray:
+        """Get the ids of sequences, unseen sequences are inserted into the sorted sequence array."""
+        unique_sequences, inverse = np.unique(sequences, return_inverse=True)
+
+        positions = np.searchsorted(self.sequences, unique_sequences)
+        seen = positions < len(self.sequences)
+        seen[seen] = self.sequences[positions[seen]] == unique_sequences[seen]
+
+        unseen_ids = np.arange(len(self.sequences), len(self.sequences) + np.sum(~seen))
+
+        if len(unseen_ids) > 0:
+            # np.insert casts to the dtype of the array, which would truncate longer sequences
+            self.sequences = np.insert(self.sequences.astype(np.result_type(self.sequences, unique_sequences)), positions[~seen], unique_sequences[~seen])
+            self.sequence_ids = np.insert(self.sequence_ids, positions[~seen], unseen_ids)
+
+        unique_ids = np.empty(len(unique_sequences), dtype=np.int64)
+        unique_ids[~seen] = unseen_ids
+        unique_ids[seen] = self.sequence_ids[np.searchsorted(self.sequences, unique_sequences[seen])]
+
+        return unique_ids[inverse.ravel()]
+
+    def _compact(self):
+        """Drop all stored rows that are not kept anymore."""
+        mask = np.arange(self.top_n)[None, :] < self.top_count[:, None]
+        rows = pd.concat(self.rows, ignore_index=True) if len(self.rows) > 1 else self.rows[0]
+        self.rows = [rows.iloc[self.top_rows[mask]].reset_index(drop=True)]
+        self.top_rows[mask] = np.arange(mask.sum())
+        self.n_rows = len(self.rows[0])
+
+    def add(self, psms: pd.DataFrame):
+        """Merge the PSMs of a block.
+
+        Args:
+            psms (pd.DataFrame): Pandas DataFrame containing PSMs with a fasta_index column of sets.
+        """
+        if len(psms) == 0:
+            return
+
+        seq_ids = self._get_seq_ids(psms['sequence'].values.astype(str))
+
+        fasta_indices = psms['fasta_index'].values
+        n_fasta_indices = np.array([len(_) for _ in fasta_indices], dtype=np.int64)
+        self.pair_seq_ids.append(np.repeat(seq_ids, n_fasta_indices))
+        self.pair_fasta_indices.append(np.fromiter((_ for x in fasta_indices for _ in x), dtype=np.int64, count=n_fasta_indices.sum()))
+
+        if 'raw_idx' in psms:
+            raw_idxs = psms['raw_idx'].values.astype(np.int64)
+        else:
+            raw_idxs = psms['query_idx'].values.astype(np.int64)
+
+        if 'feature_idx' in psms:
+            feature_idxs = psms['feature_idx'].values.astype(np.int64)
+        else:
+            feature_idxs = np.full(len(psms), -1, dtype=np.int64)
+
+        self._resize(raw_idxs.max() + 1)
+
+        row_ids = np.arange(self.n_rows, self.n_rows + len(psms))
+        self.rows.append(psms.drop(columns='fasta_index').reset_index(drop=True))
+        self.n_rows += len(psms)
+
+        merge_top_n(raw_idxs, psms['hits'].values.astype(np.float64), seq_ids, feature_idxs, row_ids, self.top_hits, self.top_rows, self.top_seq_ids, self.top_feature_idxs, self.top_count)
+
+        if self.n_rows > 2 * self.top_count.sum():
+            self._compact()
+
+    def to_df(self) -> pd.DataFrame:
+        """Get the kept PSMs.
+
+        Returns:
+            pd.DataFrame: The kept PSMs sorted by hits, with the combined fasta indices of their sequence.
+        """
+        if self.n_rows == 0:
+            return pd.DataFrame()
+
+        self._compact()
+        df = self.rows[0]
+        pair_seq_ids, pair_fasta_indices = np.unique(np.stack([np.concatenate(self.pair_seq_ids), np.concatenate(self.pair_fasta_indices)]), axis=1)
+        indptr = np.searchsorted(pair_seq_ids, np.arange(len(self.sequences) + 1))
+        seq_ids = self.sequence_ids[np.searchsorted(self.sequences, df['sequence'].values.astype(str))]
+        df['fasta_index'] = [set(pair_fasta_indices[indptr[_]:indptr[_+1]].tolist()) for _ in seq_ids]
+        df = df.sort_values('hits', ascending=False, kind='mergesort').reset_index(drop=True)
+
+        return df
+
+# %% ../nbs/05_search.ipynb 60
 import psutil
 import alphapept.constants as constants
 from .fasta import get_fragmass, parse
@@ -1235,80 +1838,86 @@ def search_parallel(settings: dict, calibration:Union[list, None] = None, fragme
         
         
     logging.info(f"Number of FASTA entries: {len(fasta_list):,} - FASTA settings {settings['fasta']}")
-    to_process = [(idx_start, fasta_list[idx_start:idx_end], ms_file_path, custom_settings) for idx_start, idx_end in block_idx(len(fasta_list), fasta_block)]
 
-    memory_available = psutil.virtual_memory().available/1024**3
+    # Query data is read once per file and memory-mapped by all blocks
+    query_cache_dir = tempfile.mkdtemp(prefix='query_cache_', dir=os.path.dirname(os.path.abspath(ms_file_path[0])))
+    query_caches = [os.path.join(query_cache_dir, str(_)) for _ in range(len(ms_file_path))]
+
+    to_process = [(idx_start, fasta_list[idx_start:idx_end], ms_file_path, custom_settings, query_caches) for idx_start, idx_end in block_idx(len(fasta_list), fasta_block)]
+
+    try:
+        for ms_file, cache_path in zip(ms_file_path, query_caches):
+            save_query_cache(ms_file, cache_path)
 
-    n_processes = int(memory_available // 5 )
+        memory_available = psutil.virtual_memory().available/1024**3
+
+        n_processes = int(memory_available // 5 )
     
-    logging.info(f'Setting Process limit to {n_processes}')
+        logging.info(f'Setting Process limit to {n_processes}')
         
-    n_processes = alphapept.performance.set_worker_count(
-        worker_count=n_processes,
-        set_global=False
-    )
+        n_processes = alphapept.performance.set_worker_count(
+            worker_count=n_processes,
+            set_global=False
+        )
 
-    n_seqs_ = 0
+        n_seqs_ = 0
 
-    df_cache = {} 
-    ion_cache = {}
+        accumulators = {}
+        ion_cache = {}
     
-    failed = []
-    to_process_ = []
-                
-    with alphapept.performance.AlphaPool(n_processes) as p:
-        max_ = len(to_process)
-
-        for i, (psm_container, n_seqs, success) in enumerate(p.imap_unordered(search_fasta_block, to_process)):
-            n_seqs_ += n_seqs
-
-            logging.info(f'Block {i+1} of {max_} complete - {((i+1)/max_*100):.2f} % - created peptides {n_seqs:,} - total peptides {n_seqs_:,} ')
-            for j in range(len(psm_container)): #Temporary hdf files for avoiding saving issues
-                output = [_ for _ in psm_container[j]]
-                if len(output) > 0:
-                    psms = pd.concat(output)
-                    if ms_file_path[j] in df_cache:
-                        temp = filter_top_n(pd.concat([df_cache[ms_file_path[j]], psms]), settings['search']['top_n'])
-                        selector = temp['temp_idx'].values
-                        df_cache[ms_file_path[j]] = temp
-                    else:
-                        df_cache[ms_file_path[j]] = psms
-                                                     
-            if callback:
-                callback((i+1)/max_)
-                
-            if not success:
-                failed.append(i)
-                to_process_.append(to_process_[i])
+        failed = []
+        to_process_ = []
                 
-    n_failed = len(failed)
-    if n_failed > 0:
-        ## Retry failed with more memory
-        n_processes_ = max((1, int(n_processes // 2)))
-        logging.info(f'Attempting to rerun failed runs with {n_processes_} processes')
-        
-        max_ = n_failed
-        
         with alphapept.performance.AlphaPool(n_processes) as p:
-            for i, (psm_container, n_seqs, success) in enumerate(p.imap_unordered(search_fasta_block, to_process_)):
+            max_ = len(to_process)
+
+            # Ordered, so that failed blocks can be looked up by their index
+            for i, (psm_container, n_seqs, success) in enumerate(p.imap(search_fasta_block, to_process)):
                 n_seqs_ += n_seqs
 
                 logging.info(f'Block {i+1} of {max_} complete - {((i+1)/max_*100):.2f} % - created peptides {n_seqs:,} - total peptides {n_seqs_:,} ')
                 for j in range(len(psm_container)): #Temporary hdf files for avoiding saving issues
                     output = [_ for _ in psm_container[j]]
                     if len(output) > 0:
-                        psms = pd.concat(output)
-                        if ms_file_path[j] in df_cache:
-                            temp = filter_top_n(pd.concat([df_cache[ms_file_path[j]], psms]), settings['search']['top_n'])
-                            selector = temp['temp_idx'].values
-                            df_cache[ms_file_path[j]] = temp
-                        else:
-                            df_cache[ms_file_path[j]] = psms
-
+                        if ms_file_path[j] not in accumulators:
+                            accumulators[ms_file_path[j]] = TopNAccumulator(settings['search']['top_n'])
+                        for psms in output:
+                            accumulators[ms_file_path[j]].add(psms)
+                                                     
+                if callback:
+                    callback((i+1)/max_)
+                
+                if success is not True:
+                    failed.append(i)
+                    to_process_.append(to_process[i])
+                
+        n_failed = len(failed)
+        if n_failed > 0:
+            ## Retry failed with more memory
+            n_processes_ = max((1, int(n_processes // 2)))
+            logging.info(f'Attempting to rerun failed runs with {n_processes_} processes')
+        
+            max_ = n_failed
+        
+            with alphapept.performance.AlphaPool(n_processes_) as p:
+                for i, (psm_container, n_seqs, success) in enumerate(p.imap_unordered(search_fasta_block, to_process_)):
+                    n_seqs_ += n_seqs
+
+                    logging.info(f'Block {i+1} of {max_} complete - {((i+1)/max_*100):.2f} % - created peptides {n_seqs:,} - total peptides {n_seqs_:,} ')
+                    for j in range(len(psm_container)): #Temporary hdf files for avoiding saving issues
+                        output = [_ for _ in psm_container[j]]
+                        if len(output) > 0:
+                            if ms_file_path[j] not in accumulators:
+                                accumulators[ms_file_path[j]] = TopNAccumulator(settings['search']['top_n'])
+                            for psms in output:
+                                accumulators[ms_file_path[j]].add(psms)
+    finally:
+        clear_query_cache()
+        shutil.rmtree(query_cache_dir, ignore_errors=True)
 
     for idx, _ in enumerate(ms_file_path):
-        if _ in df_cache:
-            x = df_cache[_]
+        if _ in accumulators:
+            x = accumulators[_].to_df()
             ms_file = alphapept.io.MS_Data_File(_)
 
             x['fasta_index'] = x['fasta_index'].apply(lambda x: ','.join(str(_) for _ in x))
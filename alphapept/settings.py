@@ -84,6 +84,7 @@ workflow["search_data"] = {'type':'checkbox', 'default':True, 'description':"Fla
 workflow["recalibrate_data"] = {'type':'checkbox', 'default':True, 'description':"Flag to perform recalibration."}
 workflow["align"] = {'type':'checkbox', 'default':False, 'description':"Flag to align the data."}
 workflow["match"] = {'type':'checkbox', 'default':False, 'description':"Flag to perform match-between runs."}
+workflow["pipeline_files"] = {'type':'checkbox', 'default':True, 'description':"Flag to stream each file through the per-file steps (import to scoring) as soon as its previous step is finished instead of waiting for all files."}
 workflow["lfq_quantification"] = {'type':'checkbox', 'default':True, 'description':"Flag to perfrom lfq normalization."}
 
 SETTINGS_TEMPLATE["workflow"] = workflow
@@ -178,6 +179,9 @@ fasta["spectra_block"] = {'type':'spinbox', 'min':1000, 'max':1000000, 'default'
 fasta["fasta_block"] = {'type':'spinbox', 'min':100, 'max':10000, 'default':1000, 'description':"Number of fasta entries to be processed in one block."}
 fasta["save_db"] = {'type':'checkbox', 'default':True, 'description':"Save DB or create on the fly."}
 fasta["fasta_size_max"] = {'type':'spinbox', 'min':1, 'max':1000000, 'default':100, 'description':"Maximum size of FASTA (MB) when switching on-the-fly."}
+fasta["db_memory_budget"] = {'type':'spinbox', 'min':100, 'max':1000000, 'default':4000, 'description':"Memory budget (MB) for merging the theoretical spectra when saving the database."}
+fasta["db_cache"] = {'type':'checkbox', 'default':True, 'description':"Reuse or extend databases from the database cache if the FASTA files and settings match."}
+fasta["db_cache_size"] = {'type':'spinbox', 'min':1, 'max':100000, 'default':50, 'description':"Maximum size of the database cache (GB). Least recently used databases are removed first."}
 
 SETTINGS_TEMPLATE["fasta"] = fasta
 
@@ -229,6 +233,7 @@ search["parallel"] = {'type':'checkbox', 'default':True, 'description':"Use para
 search["peptide_fdr"] = {'type':'doublespinbox', 'min':0.0, 'max':1.0, 'default':0.01, 'description':"FDR level for peptides."}
 search["protein_fdr"] = {'type':'doublespinbox', 'min':0.0, 'max':1.0, 'default':0.01, 'description':"FDR level for proteins."}
 search['recalibration_min'] = {'type':'spinbox', 'min':100, 'max':10000, 'default':100, 'description':"Minimum number of datapoints to perform calibration."}
+search["fragment_index"] = {'type':'checkbox', 'default':False, 'description':"Use a fragment index to preselect database entries. Speeds up searches with large search spaces."}
 
 SETTINGS_TEMPLATE["search"] = search
 
@@ -238,6 +243,9 @@ score = {}
 
 score["method"] = {'type':'combobox', 'value':['x_tandem','random_forest','generic_score','morpheus'], 'default':'random_forest', 'description':"Scoring method."}
 score["ml_ini_score"] = {'type':'combobox', 'value':['x_tandem','hits','generic_score'], 'default':'generic_score', 'description':"Initial score for ML. Hits is equivalent to Morpehus score."}
+score["ml_model"] = {'type':'combobox', 'value':['file','experiment'], 'default':'file', 'description':"Train the random forest for each file or once on PSMs pooled from all files of the experiment."}
+score["ml_train_size"] = {'type':'spinbox', 'min':1000, 'max':10000000, 'default':100000, 'description':"Maximum number of targets and of decoys pooled from all files to train the experiment-level random forest."}
+score["ml_model_path"] = {'type':'path','default':None, 'filetype':['pkl'], 'folder':False, 'description':"Path to a persisted experiment-level random forest. It is reused if its features match, otherwise the newly trained model is saved there."}
 
 SETTINGS_TEMPLATE["score"] = score
 
@@ -261,6 +269,7 @@ matching = {}
 matching["match_p_min"] = {'type':'doublespinbox', 'min':0.001, 'max':1.0, 'default':0.05, 'description':"Minimum probability cutoff for matching."}
 matching["match_d_min"] = {'type':'doublespinbox', 'min':0.001, 'max':10.0, 'default':3, 'description': "Minimum distance cutoff for matching."}
 matching["match_group_tol"] = {'type':'spinbox', 'min':0, 'max':100, 'default':0, 'description': "When having matching groups, match neighboring groups."}
+matching["align_pairs"] = {'type':'combobox', 'value':['all','reference','spanning_tree'], 'default':'all', 'description': "Pairs of files that are compared for the alignment. 'reference' and 'spanning_tree' only compare a linear number of pairs for large cohorts."}
 
 
 SETTINGS_TEMPLATE["matching"] = matching
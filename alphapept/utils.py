@@ -354,10 +354,11 @@ def check_settings(settings):
     return settings
 
 
-def assemble_df(settings, field = 'protein_fdr', callback=None):
+def assemble_df(settings, field = 'protein_fdr', callback=None, columns=None):
     """
     Todo we could save this to disk
     include callback
+    If columns are given, only these columns are read when they exist and the table is not saved.
     """
     paths = [
         os.path.splitext(
@@ -372,9 +373,15 @@ def assemble_df(settings, field = 'protein_fdr', callback=None):
     for idx, file_name in enumerate(paths):
 
         try:
-            df = alphapept.io.MS_Data_File(
-                file_name
-            ).read(dataset_name=field)
+            ms_file = alphapept.io.MS_Data_File(file_name)
+            if columns is None:
+                df = ms_file.read(dataset_name=field)
+            else:
+                available = ms_file.read(group_name=field)
+                df = ms_file.read(
+                    dataset_name=field,
+                    columns=[_ for _ in columns if _ in available]
+                )
 
             df['filename'] = file_name
             df['shortname'] = shortnames[idx]
@@ -391,7 +398,8 @@ def assemble_df(settings, field = 'protein_fdr', callback=None):
 
     if len(all_dfs) > 0:
         xx = pd.concat(all_dfs)
-        xx.to_hdf(settings['experiment']['results_path'], 'combined_'+field)
+        if columns is None:
+            xx.to_hdf(settings['experiment']['results_path'], 'combined_'+field)
     else:
         xx = pd.DataFrame()
 